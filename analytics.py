@@ -0,0 +1,215 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Агрегаты продаж: по дням, по дням и товарам, по дням и реферерам, плюс итог
+# по каждому рефереру — за всё время и за скользящие окна PERIODS.
+# Обновляются в той же транзакции, что и запись в purchases или product_sales,
+# поэтому отчёты читают только агрегаты (не больше строки на день/товар/реферера)
+# и не сканируют сырые таблицы. Дни — по UTC, как CURRENT_TIMESTAMP в этих таблицах.
+# Покупки из purchases (/register_purchase_general) идут под товаром GENERAL_PRODUCT,
+# продажи товаров каталога (/register_purchase) — под кодом товара из product_sales.
+
+GENERAL_PRODUCT = ""
+
+# Окна отчётов /sales: название -> число дней, включая сегодня
+PERIODS: Dict[str, int] = {"today": 1, "7": 7, "30": 30}
+
+
+class Sales(NamedTuple):
+    orders: int
+    revenue: int
+
+
+class ReferrerSales(NamedTuple):
+    referrer_id: int
+    username: Optional[str]
+    orders: int
+    revenue: int
+
+
+_UPSERTS = [
+    """
+    INSERT INTO sales_daily (day, orders, revenue) VALUES (:day, :orders, :revenue)
+    ON CONFLICT (day) DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+    """,
+    """
+    INSERT INTO sales_by_product (day, product, orders, revenue) VALUES (:day, :product, :orders, :revenue)
+    ON CONFLICT (day, product) DO UPDATE
+    SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+    """,
+]
+
+_REFERRER_UPSERTS = [
+    """
+    INSERT INTO sales_by_referrer (day, referrer_id, orders, revenue) VALUES (:day, :referrer, :orders, :revenue)
+    ON CONFLICT (day, referrer_id) DO UPDATE
+    SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+    """,
+    """
+    INSERT INTO sales_referrers (referrer_id, orders, revenue) VALUES (:referrer, :orders, :revenue)
+    ON CONFLICT (referrer_id) DO UPDATE
+    SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+    """,
+]
+
+_WINDOW_UPSERT = """
+    INSERT INTO sales_referrers_window (period, referrer_id, orders, revenue)
+    SELECT period, :referrer, :orders, :revenue FROM sales_windows WHERE expired_through < :day
+    ON CONFLICT (period, referrer_id) DO UPDATE
+    SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+"""
+
+ROLLUP_TABLES = ["sales_daily", "sales_by_product", "sales_by_referrer", "sales_referrers",
+                 "sales_referrers_window", "sales_windows"]
+
+
+# Синхронные функции ниже выполняются в потоке базы данных (см. database.py)
+
+# Добавить одну покупку в агрегаты. day — дата покупки 'YYYY-MM-DD'.
+def record_sale(conn, day, product, referrer_id, amount):
+    params = {"day": day, "product": product or GENERAL_PRODUCT, "referrer": referrer_id,
+              "orders": 1, "revenue": amount}
+    for sql in _UPSERTS:
+        conn.execute(sql, params)
+    if referrer_id:
+        for sql in _REFERRER_UPSERTS:
+            conn.execute(sql, params)
+        expire_windows(conn)
+        conn.execute(_WINDOW_UPSERT, params)
+
+
+# Скользящие окна рефереров: для каждого окна из PERIODS итог по рефереру за дни
+# после sales_windows.expired_through. Когда наступает новый день, из окна
+# вычитаются дни, которые из него вышли (по sales_by_referrer) — работа
+# пропорциональна продажам за эти дни, а не размеру окна.
+# Вызывается при записи покупки и перед отчётом (см. Database.get_top_referrers_by_revenue).
+# Возвращает, сколько окон сдвинуто.
+def expire_windows(conn) -> int:
+    stale = conn.execute(
+        "SELECT period, expired_through, date('now', '-' || period || ' days') FROM sales_windows "
+        "WHERE expired_through < date('now', '-' || period || ' days')"
+    ).fetchall()
+    for period, through, new_through in stale:
+        expired = conn.execute(
+            "SELECT referrer_id, SUM(orders), SUM(revenue) FROM sales_by_referrer "
+            "WHERE day > ? AND day <= ? GROUP BY referrer_id",
+            (through, new_through)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE sales_referrers_window SET orders = orders - ?, revenue = revenue - ? "
+            "WHERE period = ? AND referrer_id = ?",
+            [(orders, revenue, period, referrer_id) for referrer_id, orders, revenue in expired]
+        )
+        conn.executemany(
+            "DELETE FROM sales_referrers_window WHERE period = ? AND referrer_id = ? AND orders <= 0",
+            [(period, referrer_id) for referrer_id, _, _ in expired]
+        )
+        conn.execute("UPDATE sales_windows SET expired_through = ? WHERE period = ?", (new_through, period))
+    return len(stale)
+
+
+# Заполнить окна заново из sales_by_referrer (после пересчёта агрегатов)
+def _fill_windows(conn):
+    for period in sorted(set(PERIODS.values())):
+        conn.execute(
+            "INSERT INTO sales_windows (period, expired_through) VALUES (?, date('now', ?))",
+            (period, f"-{period} days")
+        )
+        conn.execute(
+            "INSERT INTO sales_referrers_window (period, referrer_id, orders, revenue) "
+            "SELECT ?, referrer_id, SUM(orders), SUM(revenue) FROM sales_by_referrer "
+            "WHERE day > date('now', ?) GROUP BY referrer_id",
+            (period, f"-{period} days")
+        )
+
+
+def _add(totals: Dict, key, amount: int):
+    entry = totals.setdefault(key, [0, 0])
+    entry[0] += 1
+    entry[1] += amount
+
+
+# Пересчитать агрегаты из purchases и product_sales за один проход по обеим таблицам.
+# Суммы копятся в памяти по ключам (их не больше, чем дней × товаров/рефереров),
+# строки покупок читаются курсором и целиком в память не загружаются.
+# Возвращает число обработанных покупок.
+def rebuild_rollups(conn) -> int:
+    daily: Dict[str, List[int]] = {}
+    by_product: Dict[Tuple[str, str], List[int]] = {}
+    by_referrer: Dict[Tuple[str, int], List[int]] = {}
+    referrers: Dict[int, List[int]] = {}
+    count = 0
+    cursor = conn.execute(
+        "SELECT date(timestamp), NULL, referrer_id, amount FROM purchases WHERE timestamp IS NOT NULL "
+        "UNION ALL "
+        "SELECT date(timestamp), product, referrer_id, amount FROM product_sales WHERE timestamp IS NOT NULL"
+    )
+    for day, product, referrer_id, amount in cursor:
+        amount = amount or 0
+        count += 1
+        _add(daily, day, amount)
+        _add(by_product, (day, product or GENERAL_PRODUCT), amount)
+        if referrer_id:
+            _add(by_referrer, (day, referrer_id), amount)
+            _add(referrers, referrer_id, amount)
+
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.executemany("INSERT INTO sales_daily (day, orders, revenue) VALUES (?, ?, ?)",
+                     ((day, *totals) for day, totals in daily.items()))
+    conn.executemany("INSERT INTO sales_by_product (day, product, orders, revenue) VALUES (?, ?, ?, ?)",
+                     ((*key, *totals) for key, totals in by_product.items()))
+    conn.executemany("INSERT INTO sales_by_referrer (day, referrer_id, orders, revenue) VALUES (?, ?, ?, ?)",
+                     ((*key, *totals) for key, totals in by_referrer.items()))
+    conn.executemany("INSERT INTO sales_referrers (referrer_id, orders, revenue) VALUES (?, ?, ?)",
+                     ((referrer_id, *totals) for referrer_id, totals in referrers.items()))
+    _fill_windows(conn)
+    return count
+
+
+# Итого за последние days дней (включая сегодня)
+def get_sales(conn, days) -> Sales:
+    row = conn.execute(
+        "SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0) FROM sales_daily "
+        "WHERE day > date('now', ?)",
+        (f"-{days} days",)
+    ).fetchone()
+    return Sales(*row)
+
+
+# Выручка по товарам за последние days дней, по убыванию: [(товар, продажи)]
+def get_product_sales(conn, days) -> List[Tuple[str, Sales]]:
+    rows = conn.execute(
+        "SELECT product, SUM(orders), SUM(revenue) FROM sales_by_product "
+        "WHERE day > date('now', ?) GROUP BY product ORDER BY SUM(revenue) DESC",
+        (f"-{days} days",)
+    ).fetchall()
+    return [(product, Sales(orders, revenue)) for product, orders, revenue in rows]
+
+
+# Рефереры с наибольшей выручкой приглашённых: за последние days дней
+# или за всё время (days=None). Всё время и окна из PERIODS читаются по индексу
+# итогов без группировки; окно должно быть сдвинуто на сегодня (expire_windows).
+# Для других days суммы по дням группируются при запросе.
+def get_top_referrers_by_revenue(conn, days: Optional[int], limit: int) -> List[ReferrerSales]:
+    if days is None:
+        sql = (
+            "SELECT s.referrer_id, u.username, s.orders, s.revenue FROM sales_referrers s "
+            "LEFT JOIN users u ON u.user_id = s.referrer_id "
+            "WHERE s.revenue > 0 ORDER BY s.revenue DESC LIMIT ?"
+        )
+        params: tuple = (limit,)
+    elif days in PERIODS.values():
+        sql = (
+            "SELECT w.referrer_id, u.username, w.orders, w.revenue FROM sales_referrers_window w "
+            "LEFT JOIN users u ON u.user_id = w.referrer_id "
+            "WHERE w.period = ? AND w.revenue > 0 ORDER BY w.revenue DESC LIMIT ?"
+        )
+        params = (days, limit)
+    else:
+        sql = (
+            "SELECT s.referrer_id, u.username, SUM(s.orders), SUM(s.revenue) FROM sales_by_referrer s "
+            "LEFT JOIN users u ON u.user_id = s.referrer_id WHERE s.day > date('now', ?) "
+            "GROUP BY s.referrer_id ORDER BY SUM(s.revenue) DESC LIMIT ?"
+        )
+        params = (f"-{days} days", limit)
+    return [ReferrerSales(*row) for row in conn.execute(sql, params)]
@@ -0,0 +1,94 @@
+# Бенчмарк commit/сек для профилей соединения SQLite.
+#
+#   python benchmarks/bench_commits.py [--ops 2000] [--users 1000]
+#
+# Создаёт временную базу со схемой бота и сравнивает профиль SQLite по
+# умолчанию (rollback journal, synchronous=FULL) с профилем бота (WAL,
+# synchronous=NORMAL и т.д.): начисление монет с commit на каждую операцию,
+# как в обработчиках, и время чтения профиля, пока писатель держит транзакцию.
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DEFAULT_PROFILE, LEGACY_PROFILE, connect  # noqa: E402
+from migrations import apply_migrations  # noqa: E402
+
+
+def seed(path, users):
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+        ((i, f"user{i}", f"User {i}") for i in range(1, users + 1))
+    )
+    conn.commit()
+    conn.close()
+
+
+def bench_commits(path, profile, ops, users):
+    conn = connect(path, profile)
+    started = time.perf_counter()
+    for i in range(ops):
+        conn.execute("UPDATE users SET coins = coins + 1 WHERE user_id = ?", (i % users + 1,))
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return ops / elapsed
+
+
+# Сколько ждёт чтение профиля, пока другой поток держит открытую транзакцию записи
+def bench_read_under_write(path, profile, hold=0.2):
+    writer = connect(path, profile)
+    reader = connect(path, {**profile, "busy_timeout": "2000"}, readonly=True)
+    locked = threading.Event()
+    release = threading.Event()
+
+    def write():
+        # В rollback journal запись страниц и commit идут под EXCLUSIVE-блокировкой,
+        # эмулируем её; в WAL писатель читателей не блокирует
+        writer.execute("BEGIN EXCLUSIVE" if profile.get("journal_mode") != "WAL" else "BEGIN IMMEDIATE")
+        writer.execute("UPDATE users SET coins = coins + 1 WHERE user_id = 1")
+        locked.set()
+        release.wait()
+        time.sleep(hold)
+        writer.commit()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    locked.wait()
+    release.set()
+    started = time.perf_counter()
+    try:
+        reader.execute("SELECT coins FROM users WHERE user_id = 1").fetchone()
+        waited = time.perf_counter() - started
+    except sqlite3.OperationalError:
+        waited = float("nan")
+    thread.join()
+    reader.close()
+    writer.close()
+    return waited * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, profile in (("default (DELETE, FULL)", LEGACY_PROFILE), ("bot profile (WAL, NORMAL)", DEFAULT_PROFILE)):
+            path = os.path.join(tmp, f"{profile['journal_mode'].lower()}.db")
+            seed(path, args.users)
+            rate = bench_commits(path, profile, args.ops, args.users)
+            waited = bench_read_under_write(path, profile)
+            print(f"{name:28} {rate:10.0f} commits/sec   read during write: {waited:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# Микробенчмарки функций базы данных (database.py, referrals.py, analytics.py, user_list.py)
+# на синтетических базах разного размера: столько же покупок, сколько пользователей,
+# дерево рефералов, подарки, журнал монет и агрегаты продаж.
+# Каждая функция вызывается напрямую на соединении с профилем бота (без очереди
+# Database и commit — их меряют bench_write_queue.py и bench_commits.py): записи —
+# внутри одной транзакции, которая в конце откатывается, поэтому база не меняется
+# между прогонами. Для каждого размера выводится p50/p99 в микросекундах и запросы
+# из HOT_QUERIES, которые сканируют таблицу. Рост времени с размером базы — признак
+# пропавшего индекса или работы, пропорциональной размеру таблицы.
+#
+#   python benchmarks/bench_db.py [--sizes 1k,100k,1m] [--ops 2000] [--budget 2] [--data-dir DIR]
+#                                 [--json result.json] [--baseline previous.json]
+#
+# С --data-dir сгенерированные базы сохраняются и переиспользуются (1m — около 350 МБ).
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as D  # noqa: E402
+from analytics import get_product_sales, get_sales, get_top_referrers_by_revenue, rebuild_rollups  # noqa: E402
+from migrations import LATEST_VERSION, apply_migrations, get_version  # noqa: E402
+from referrals import get_network, get_top_referrers, get_tree  # noqa: E402
+from user_list import load_page  # noqa: E402
+
+FIRST_USER = 1_000_000_000
+# Рефералы приглашают не глубже SEED_DEPTH уровней от органических пользователей
+SEED_DEPTH = 4
+SEED_DAYS = 90
+PRODUCTS = ["discord_nitro_1m", "discord_nitro_12m", "spotify_premium", "telegram_premium"]
+GIFTS = ["🎮 Discord Nitro", "🎵 Spotify", "⭐ Telegram Premium", "🎁 Mystery Box"]
+MIN_OPS = 20
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    for suffix, factor in (("k", 1000), ("m", 1_000_000)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+# Синтетическая база на users пользователей и столько же покупок
+def seed(path: str, users: int, rng: random.Random):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    apply_migrations(conn)
+
+    ids = [FIRST_USER + i for i in range(users)]
+    referrers: List[Optional[int]] = []
+    ancestors: List[Tuple[int, ...]] = []
+    inviters: List[int] = []  # индексы пользователей, которые ещё могут приглашать
+    for i in range(users):
+        if inviters and rng.random() < 0.7:
+            parent = rng.choice(inviters)
+            referrers.append(ids[parent])
+            ancestors.append((ids[parent],) + ancestors[parent])
+        else:
+            referrers.append(None)
+            ancestors.append(())
+        if len(ancestors[i]) < SEED_DEPTH:
+            inviters.append(i)
+    counts = Counter(referrer for referrer in referrers if referrer is not None)
+
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name, referrer_id, referrals_count, discount, coins) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((user_id, f"user{user_id}" if i % 10 else None, f"User {i}", referrers[i], counts[user_id],
+          min(counts[user_id] * 2, 50), rng.randrange(0, 5000))
+         for i, user_id in enumerate(ids))
+    )
+    conn.executemany(
+        "INSERT INTO referral_paths (ancestor_id, depth, descendant_id) VALUES (?, ?, ?)",
+        ((ancestor, depth, user_id)
+         for user_id, chain in zip(ids, ancestors) for depth, ancestor in enumerate(chain, 1))
+    )
+
+    # Четверть продаж — покупки без товара (purchases), остальные — товары каталога (product_sales)
+    now = datetime.utcnow()
+    purchases, product_sales = [], []
+    for _ in range(users):
+        i = rng.randrange(users)
+        moment = (now - timedelta(seconds=rng.randrange(SEED_DAYS * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+        amount = rng.randrange(100, 5000)
+        if rng.random() < 0.25:
+            purchases.append((ids[i], referrers[i], amount, moment))
+        else:
+            product_sales.append((ids[i], referrers[i], rng.choice(PRODUCTS), amount, moment))
+    purchases.sort(key=lambda row: row[3])
+    product_sales.sort(key=lambda row: row[4])
+    conn.executemany(
+        "INSERT INTO purchases (user_id, referrer_id, amount, timestamp) VALUES (?, ?, ?, ?)",
+        purchases
+    )
+    conn.executemany(
+        "INSERT INTO product_sales (user_id, referrer_id, product, amount, timestamp) VALUES (?, ?, ?, ?, ?)",
+        product_sales
+    )
+    conn.execute("UPDATE users SET level = 2 WHERE user_id IN (SELECT user_id FROM purchases) "
+                 "OR user_id IN (SELECT referrer_id FROM purchases)")
+    rebuild_rollups(conn)
+
+    conn.executemany(
+        "INSERT INTO user_rewards (user_id, reward) VALUES (?, ?)",
+        ((rng.choice(ids), rng.choice(GIFTS)) for _ in range(users // 2))
+    )
+    conn.executemany(
+        "INSERT INTO coin_transactions (user_id, delta, balance, reason) VALUES (?, ?, ?, ?)",
+        ((rng.choice(ids), 100, 100, "bonus") for _ in range(users))
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+# Готовая база из --data-dir, если она того же размера и на последней версии схемы
+def reusable(path: str, users: int) -> bool:
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect(path)
+    try:
+        return get_version(conn) == LATEST_VERSION and conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == users
+    finally:
+        conn.close()
+
+
+# Замеряемые функции: (название, запись ли это, функция, аргументы для очередного вызова)
+def build_cases(users: int, rng: random.Random):
+    def user() -> int:
+        return FIRST_USER + rng.randrange(users)
+
+    new_users = iter(range(FIRST_USER + users, FIRST_USER + 2 * users + 1_000_000))
+    hot_user = FIRST_USER
+
+    Case = Tuple[str, bool, Callable, Callable[[], tuple]]
+    cases: List[Case] = [
+        ("add_user", True, D.add_user, lambda: (next(new_users), None, user(), "New")),
+        ("add_coins", True, D.add_coins, lambda: (user(), 10)),
+        ("add_reward", True, D.add_reward, lambda: (user(), rng.choice(GIFTS))),
+        # Все подарки одному пользователю: время не должно расти с их числом
+        ("add_reward (one user)", True, D.add_reward, lambda: (hot_user, rng.choice(GIFTS))),
+        ("update_user_level", True, D.update_user_level, lambda: (user(),)),
+        ("update_referrals_count", True, D.update_referrals_count, lambda: (user(),)),
+        ("register_purchase", True, D.register_purchase, lambda: (user(), user(), rng.randrange(100, 5000))),
+        ("record_product_sale", True, D.record_product_sale,
+         lambda: (user(), user(), rng.choice(PRODUCTS), rng.randrange(100, 5000))),
+        ("get_user_coins", False, D.get_user_coins, lambda: (user(),)),
+        ("get_profile", False, D.get_profile, lambda: (user(),)),
+        ("get_user_by_id", False, D.get_user_by_id, lambda: (user(),)),
+        ("get_user_by_username", False, D.get_user_by_username, lambda: (f"user{user()}",)),
+        ("get_referrals", False, D.get_referrals, lambda: (user(),)),
+        ("get_network", False, get_network, lambda: (user(),)),
+        ("get_tree", False, get_tree, lambda: (user(), 3)),
+        ("get_top_referrers", False, get_top_referrers, lambda: (10,)),
+        ("load_page", False, load_page, lambda: ("next", user())),
+        ("get_sales 7", False, get_sales, lambda: (7,)),
+        ("get_product_sales 30", False, get_product_sales, lambda: (30,)),
+        ("top_referrers_by_revenue", False, get_top_referrers_by_revenue, lambda: (None, 10)),
+        ("top_referrers_by_revenue 7", False, get_top_referrers_by_revenue, lambda: (7, 10)),
+    ]
+    return cases
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# Не больше ops вызовов и не дольше budget секунд на функцию (но не меньше MIN_OPS вызовов)
+def time_case(conn: sqlite3.Connection, write: bool, func: Callable, make_args: Callable,
+              ops: int, budget: float) -> List[float]:
+    if write:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        for _ in range(min(ops, MIN_OPS)):
+            func(conn, *make_args())
+        timings: List[float] = []
+        deadline = time.perf_counter() + budget
+        while len(timings) < ops and (len(timings) < MIN_OPS or time.perf_counter() < deadline):
+            args = make_args()
+            started = time.perf_counter()
+            func(conn, *args)
+            timings.append(time.perf_counter() - started)
+    finally:
+        if write:
+            conn.execute("ROLLBACK")
+    return timings
+
+
+def bench_size(path: str, users: int, ops: int, budget: float, seed_value: int) -> Dict:
+    conn = D.connect(path)
+    conn.isolation_level = None
+    scanning = D.audit_query_plans(conn)
+    rng = random.Random(seed_value)
+    cases = {}
+    for name, write, func, make_args in build_cases(users, rng):
+        timings = time_case(conn, write, func, make_args, ops, budget)
+        cases[name] = {
+            "ops": len(timings),
+            "mean_us": statistics.fmean(timings) * 1e6,
+            "p50_us": percentile(timings, 0.5) * 1e6,
+            "p99_us": percentile(timings, 0.99) * 1e6,
+        }
+    conn.close()
+    return {"users": users, "purchases": users, "db_bytes": os.path.getsize(path),
+            "scanning_queries": scanning, "cases": cases}
+
+
+def report(result: Dict, baseline: Dict = None):
+    sizes = list(result["sizes"])
+
+    def delta(size, name):
+        old = (baseline or {}).get("sizes", {}).get(size, {}).get("cases", {}).get(name, {}).get("p50_us")
+        if not old:
+            return ""
+        return f"{(result['sizes'][size]['cases'][name]['p50_us'] - old) / old * 100:+.0f}%"
+
+    for size in sizes:
+        info = result["sizes"][size]
+        print(f"{size} users: {info['db_bytes'] / 2 ** 20:.1f} MB, seed {info['seed_seconds']:.1f} s, "
+              f"scanning queries: {', '.join(info['scanning_queries']) or 'none'}")
+    print(f"{'p50 / p99, µs':28}" + "".join(f"{size + ' users':>24}" for size in sizes))
+    for name in result["sizes"][sizes[0]]["cases"]:
+        cells = []
+        for size in sizes:
+            stats = result["sizes"][size]["cases"][name]
+            cells.append(f"{stats['p50_us']:8.1f} /{stats['p99_us']:8.1f} {delta(size, name):>5}")
+        print(f"{name:28}" + "".join(f"{cell:>24}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1k,100k,1m", help="размеры баз через запятую: 1000, 100k, 1m")
+    parser.add_argument("--ops", type=int, default=2000, help="вызовов каждой функции на размер")
+    parser.add_argument("--budget", type=float, default=2.0, help="секунд на функцию, не меньше 20 вызовов")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", help="каталог для сохранения и повторного использования баз")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="результат прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    directory = args.data_dir or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    result = {"ops": args.ops, "seed": args.seed, "sqlite": sqlite3.sqlite_version, "sizes": {}}
+    try:
+        for size in args.sizes.split(","):
+            users = parse_size(size)
+            path = os.path.join(directory, f"bench_db_{users}.sqlite")
+            started = time.perf_counter()
+            if not reusable(path, users):
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                seed(path, users, random.Random(args.seed))
+            seeded = time.perf_counter() - started
+            print(f"{size}: база готова за {seeded:.1f} s", file=sys.stderr)
+            result["sizes"][size] = {**bench_size(path, users, args.ops, args.budget, args.seed), "seed_seconds": seeded}
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report(result, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# Нагрузочный прогон бота целиком без сети: настоящие dp и обработчики из bot.py,
+# временная база и поддельная сессия Telegram (вызовы Bot API запоминаются в памяти).
+# Синтетические обновления подаются в dp.feed_update с заданной параллельностью:
+#   1. /start от всех пользователей, большинство — по реферальной ссылке;
+#   2. админ начисляет монеты и регистрирует покупки части пользователей;
+#   3. смесь: профиль, меню, покупка подарков и скидок, текст мимо меню, админские команды.
+# Выводит пропускную способность, p50/p99 по типам обновлений, число commit и вызовов API.
+# Результат можно сохранить (--json) и сравнить с прошлым прогоном (--baseline).
+#
+#   python benchmarks/bench_dispatcher.py [--users 2000] [--updates 10000] [--concurrency 50]
+#                                         [--json result.json] [--baseline previous.json]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_ID = 1
+FIRST_USER = 10_000
+
+# Смесь обновлений третьей фазы: (тип, вес)
+MIX = [
+    ("profile", 35),
+    ("menu", 20),
+    ("gift", 15),
+    ("discount", 5),
+    ("unknown", 5),
+    ("admin", 20),
+]
+
+
+def setup_env(tmp):
+    os.environ.setdefault("API_TOKEN", "123456:BENCH")
+    os.environ["ADMIN_ID"] = str(ADMIN_ID)
+    os.environ["DB_PATH"] = os.path.join(tmp, "users.db")
+    os.environ["BOT_MODE"] = "polling"
+    os.environ["BOT_WORKERS"] = "1"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["THROTTLE_LIMITS"] = "start=1000000/0.001,default=1000000/0.001"
+
+
+# Обновления по фазам: [(название фазы, [(тип, user_id, текст)])]
+def build_phases(args, catalog) -> List[Tuple[str, List[Tuple[str, int, str]]]]:
+    rng = random.Random(args.seed)
+    users = [FIRST_USER + i for i in range(args.users)]
+    gifts = list(catalog.gifts_by_button)
+    discounts = list(catalog.discounts_by_button)
+    menus = ["🛒 Catalog", "🎁 Gift Shop", "🎁 Referral System", "❓ About Levels", "Back", "ℹ️ About Us"]
+
+    starts = []
+    for i, user_id in enumerate(users):
+        if i and rng.random() < 0.8:
+            starts.append(("start", user_id, f"/start {users[rng.randrange(i)]}"))
+        else:
+            starts.append(("start", user_id, "/start"))
+
+    buyers = rng.sample(users, max(1, len(users) // 10))
+    setup = []
+    for user_id in buyers:
+        setup.append(("admin", ADMIN_ID, f"/give_coins @user{user_id} 100000"))
+        setup.append(("admin", ADMIN_ID, f"/register_purchase_general @user{user_id} {rng.randrange(100, 1000)}"))
+
+    def admin_command() -> str:
+        user_id = rng.choice(users)
+        return rng.choice([
+            f"/userstat @user{user_id}",
+            f"/userstat_by_id {user_id}",
+            f"/referral_tree {user_id} 3",
+            "/top_referrers",
+            "/sales 7",
+            "/sales top",
+            f"/give_coins @user{user_id} 10",
+        ])
+
+    kinds = [kind for kind, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    mixed = []
+    for kind in rng.choices(kinds, weights, k=args.updates):
+        if kind == "profile":
+            mixed.append((kind, rng.choice(users), "👤 My Profile"))
+        elif kind == "menu":
+            mixed.append((kind, rng.choice(users), rng.choice(menus)))
+        elif kind == "gift":
+            mixed.append((kind, rng.choice(buyers), rng.choice(gifts)))
+        elif kind == "discount":
+            mixed.append((kind, rng.choice(buyers), rng.choice(discounts)))
+        elif kind == "unknown":
+            mixed.append((kind, rng.choice(users), "hello"))
+        else:
+            mixed.append((kind, ADMIN_ID, admin_command()))
+
+    return [("start", starts), ("setup", setup), ("mixed", mixed)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(args) -> Dict:
+    import bot as B
+    logging.getLogger().setLevel(logging.WARNING)
+    from fake_telegram import FakeTelegramSession, make_update
+
+    session = FakeTelegramSession(capture=False)
+    B.bot.session = session
+    await B.startup(primary=False)
+
+    phases = build_phases(args, B.catalog.current)
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+    update_id = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    # Исключения обработчиков перехватывает @dp.errors в bot.py, и из feed_update они
+    # не выходят. Поэтому ошибки считаются outer middleware событий ошибок: через него
+    # проходит каждое исключение, дошедшее до обработчика ошибок.
+    async def count_error(handler, event, data):
+        nonlocal errors
+        errors += 1
+        return await handler(event, data)
+
+    B.dp.errors.outer_middleware(count_error)
+
+    async def feed(kind, update):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await B.dp.feed_update(B.bot, update)
+            except Exception:
+                # Обработчик ошибок сам упал — исключение уже посчитано в count_error
+                pass
+            latencies.setdefault(kind, []).append(time.perf_counter() - started)
+
+    prepared = []
+    for name, events in phases:
+        updates = []
+        for kind, user_id, text in events:
+            update_id += 1
+            updates.append((kind, make_update(update_id, user_id, text)))
+        prepared.append((name, updates))
+
+    commits, writes = B.db.commits, B.db.writes
+    started = time.perf_counter()
+    phase_times = {}
+    for name, updates in prepared:
+        phase_started = time.perf_counter()
+        await asyncio.gather(*(feed(kind, update) for kind, update in updates))
+        phase_times[name] = (len(updates), time.perf_counter() - phase_started)
+    elapsed = time.perf_counter() - started
+    commits, writes = B.db.commits - commits, B.db.writes - writes
+
+    # Уведомления уходят из фоновой очереди — дожидаемся их при остановке
+    await B.shutdown()
+
+    total = sum(count for count, _ in phase_times.values())
+    every = [value for values in latencies.values() for value in values]
+    return {
+        "updates": total,
+        "concurrency": args.concurrency,
+        "elapsed": elapsed,
+        "throughput": total / elapsed,
+        "p50_ms": percentile(every, 0.5) * 1000,
+        "p99_ms": percentile(every, 0.99) * 1000,
+        "phases": {name: {"updates": count, "throughput": count / spent}
+                   for name, (count, spent) in phase_times.items()},
+        "kinds": {kind: {"updates": len(values),
+                         "p50_ms": percentile(values, 0.5) * 1000,
+                         "p99_ms": percentile(values, 0.99) * 1000}
+                  for kind, values in sorted(latencies.items())},
+        "errors": errors,
+        "db_commits": commits,
+        "db_writes": writes,
+        "api_calls": session.calls,
+        "api_methods": dict(session.methods.most_common()),
+    }
+
+
+def report(result: Dict, baseline: Dict = None):
+    def delta(key, section=None, name=None):
+        if baseline is None:
+            return ""
+        old = baseline.get(section, {}).get(name, {}).get(key) if section else baseline.get(key)
+        new = result[section][name][key] if section else result[key]
+        if not old:
+            return ""
+        return f"  ({(new - old) / old * 100:+.1f}%)"
+
+    print(f"updates:     {result['updates']} (concurrency {result['concurrency']}), errors: {result['errors']}")
+    print(f"throughput:  {result['throughput']:10.0f} updates/sec{delta('throughput')}")
+    print(f"latency:     p50 {result['p50_ms']:.2f} ms{delta('p50_ms')}, p99 {result['p99_ms']:.2f} ms{delta('p99_ms')}")
+    for name, phase in result["phases"].items():
+        print(f"  phase {name:9} {phase['updates']:7} updates {phase['throughput']:10.0f} updates/sec"
+              f"{delta('throughput', 'phases', name)}")
+    for kind, stats in result["kinds"].items():
+        print(f"  {kind:15} {stats['updates']:7} updates   p50 {stats['p50_ms']:7.2f} ms   "
+              f"p99 {stats['p99_ms']:7.2f} ms{delta('p99_ms', 'kinds', kind)}")
+    print(f"db commits:  {result['db_commits']} (writes: {result['db_writes']}, "
+          f"{result['db_writes'] / max(result['db_commits'], 1):.1f} per commit)")
+    print(f"api calls:   {result['api_calls']} {result['api_methods']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="результат прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        setup_env(tmp)
+        result = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report(result, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
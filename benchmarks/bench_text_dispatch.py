@@ -0,0 +1,116 @@
+# Время выбора обработчика для текстового сообщения: цепочка фильтров
+# F.text == "..." / Command(...) (как было) против поиска в TextRouter.
+# Кнопки и команды берутся из bot.py, обработчики пустые, сеть не нужна —
+# меряется только dp.feed_update.
+#
+#   python benchmarks/bench_text_dispatch.py [--updates 20000]
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def setup_env(tmp):
+    os.environ.setdefault("API_TOKEN", "123456:BENCH")
+    os.environ.setdefault("ADMIN_ID", "1")
+    os.environ["DB_PATH"] = os.path.join(tmp, "users.db")
+
+
+async def noop(message):
+    pass
+
+
+# Как было до TextRouter: по фильтру на каждую кнопку и команду, в конце — общий обработчик
+def linear_dispatcher(texts, commands):
+    from aiogram import Dispatcher, F  # type: ignore
+    from aiogram.filters import Command  # type: ignore
+
+    dp = Dispatcher()
+    for name in commands:
+        dp.message.register(noop, Command(commands=[name]))
+    for text in texts:
+        dp.message.register(noop, F.text == text)
+    dp.message.register(noop)
+    return dp
+
+
+def routed_dispatcher(texts, commands):
+    from aiogram import Dispatcher  # type: ignore
+
+    from text_router import TextRouter
+
+    dp = Dispatcher()
+    menu = TextRouter()
+    dp.message.register(menu.dispatch, menu.match)
+    menu.text(*texts)(noop)
+    menu.command(*commands)(noop)
+    dp.message.register(noop)
+    return dp
+
+
+def make_update(update_id, text):
+    from aiogram.types import Update  # type: ignore
+
+    return Update(**{
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 10, "type": "private"},
+            "from": {"id": 10, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    })
+
+
+async def measure(dp, bot, text, count):
+    updates = [make_update(i + 1, text) for i in range(count)]
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / count
+
+
+async def run(args):
+    import bot as B
+    logging.getLogger().setLevel(logging.WARNING)
+
+    texts = list(B.menu.texts)
+    commands = list(B.menu.commands)
+    cases = [
+        ("first button", texts[0]),
+        ("last button", texts[-1]),
+        ("last command", f"/{commands[-1]}"),
+        ("miss", "hello"),
+    ]
+    linear = linear_dispatcher(texts, commands)
+    routed = routed_dispatcher(texts, commands)
+
+    print(f"buttons: {len(texts)}, commands: {len(commands)}, updates per case: {args.updates}")
+    print(f"{'case':<14}{'filters, us':>14}{'router, us':>14}{'speedup':>10}")
+    for name, text in cases:
+        before = await measure(linear, B.bot, text, args.updates)
+        after = await measure(routed, B.bot, text, args.updates)
+        print(f"{name:<14}{before * 1e6:>14.1f}{after * 1e6:>14.1f}{before / after:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    try:
+        setup_env(tmp)
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
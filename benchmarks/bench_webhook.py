@@ -0,0 +1,108 @@
+# Нагрузочный стенд webhook-режима без сети: бот запускается в процессе с
+# поддельной сессией Telegram (ответы на вызовы Bot API не уходят в сеть),
+# а клиент POST-ит синтетические обновления на webhook с заданной параллельностью.
+# Меряется скорость приёма обновлений и время до отправки всех ответов.
+#
+#   python benchmarks/bench_webhook.py [--updates 2000] [--users 500] [--concurrency 50]
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SECRET = "bench-secret"
+
+
+def setup_env(tmp):
+    os.environ.setdefault("API_TOKEN", "123456:BENCH")
+    os.environ.setdefault("ADMIN_ID", "1")
+    os.environ["DB_PATH"] = os.path.join(tmp, "users.db")
+    os.environ["BOT_MODE"] = "webhook"
+    os.environ["WEBHOOK_SECRET"] = SECRET
+    # У каждого синтетического пользователя несколько сообщений подряд — не упираемся в throttling
+    os.environ.setdefault("THROTTLE_LIMITS", "start=1000/0.001,default=1000/0.001")
+
+
+async def run(args):
+    from aiohttp import ClientSession, web  # type: ignore
+
+    import bot as B
+    logging.getLogger().setLevel(logging.WARNING)
+    from fake_telegram import FakeTelegramSession, make_update_data
+    from webhook import SECRET_HEADER, build_app
+
+    session = FakeTelegramSession(capture=False)
+    B.bot.session = session
+    await B.db.start()
+    B.notifier.start()
+    app = build_app(B.dp, B.bot, "/webhook", secret_token=SECRET, health=B.health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    url = f"http://127.0.0.1:{args.port}/webhook"
+
+    # Сначала /start от каждого пользователя, дальше — открытие профиля
+    updates = [make_update_data(i + 1, 10_000 + i % args.users, "/start" if i < args.users else "👤 My Profile")
+               for i in range(args.updates)]
+    # Каждое обновление даёт ровно один ответ бота
+    session.expected = len(updates)
+
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with ClientSession() as client:
+        async def post(update):
+            async with semaphore:
+                started = time.perf_counter()
+                async with client.post(url, json=update, headers={SECRET_HEADER: SECRET}) as response:
+                    await response.read()
+                    assert response.status == 200, response.status
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        accepted = time.perf_counter() - started
+        await asyncio.wait_for(session.done.wait(), timeout=120)
+        handled = time.perf_counter() - started
+
+        async with client.post(url, json=updates[0]) as response:
+            unauthorized = response.status
+        async with client.get(f"http://127.0.0.1:{args.port}/healthz") as response:
+            health = await response.json()
+
+    await runner.cleanup()
+    await B.notifier.close()
+    await B.db.close()
+
+    latencies.sort()
+    print(f"updates:       {len(updates)} (concurrency {args.concurrency})")
+    print(f"accepted:      {len(updates) / accepted:10.0f} updates/sec")
+    print(f"handled:       {len(updates) / handled:10.0f} updates/sec")
+    print(f"ack latency:   p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print(f"no secret:     HTTP {unauthorized}")
+    print(f"healthz:       {health}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    try:
+        setup_env(tmp)
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Бенчмарк очереди записи: начисления монет и регистрация новых пользователей
+# с рефералом при commit на каждую операцию и при групповом commit.
+#
+#   python benchmarks/bench_write_queue.py [--ops 5000] [--users 1000]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+async def seed(db, users):
+    def insert(conn):
+        conn.executemany(
+            "INSERT INTO users (user_id, username) VALUES (?, ?)",
+            ((i, f"user{i}") for i in range(1, users + 1))
+        )
+    await db.write(insert)
+
+
+# Всплеск начислений монет
+async def coins_burst(db, ops, users):
+    await asyncio.gather(*(db.add_coins(i % users + 1, 1, "bench") for i in range(ops)))
+
+
+# Всплеск /start по реферальным ссылкам
+async def referral_burst(db, ops, users):
+    await asyncio.gather(*(db.add_user(users + i + 1, f"new{i}", i % users + 1) for i in range(ops)))
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario in (coins_burst, referral_burst):
+            for name, batch_size in (("commit per operation", 1), ("group commit", 50)):
+                db = Database(os.path.join(tmp, f"{scenario.__name__}_{batch_size}.db"), batch_size=batch_size)
+                await db.start()
+                await seed(db, args.users)
+                commits = db.commits
+                started = time.perf_counter()
+                await scenario(db, args.ops, args.users)
+                elapsed = time.perf_counter() - started
+                commits = db.commits - commits
+                await db.close()
+                print(f"{scenario.__name__:15} {name:22} {args.ops / elapsed:10.0f} ops/sec   commits: {commits}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
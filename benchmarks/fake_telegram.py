@@ -0,0 +1,71 @@
+# Поддельный Telegram для бенчмарков: сессия бота, которая не ходит в сеть,
+# а отвечает на любой метод Bot API правдоподобным объектом и запоминает вызовы.
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.client.session.base import BaseSession  # type: ignore
+from aiogram.types import Chat, Message, PhotoSize, Update, User  # type: ignore
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(self, capture: bool = True):
+        super().__init__()
+        self.capture = capture
+        self.calls = 0
+        self.methods: Counter = Counter()
+        # (метод, chat_id, текст или подпись) — только при capture
+        self.sent: List[Tuple[str, Any, Optional[str]]] = []
+        self.done = asyncio.Event()
+        self.expected = 0
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        name = type(method).__name__
+        self.methods[name] += 1
+        chat_id = getattr(method, "chat_id", None)
+        if self.capture:
+            self.sent.append((name, chat_id, getattr(method, "text", None) or getattr(method, "caption", None)))
+        if self.expected and self.calls >= self.expected:
+            self.done.set()
+
+        returning = getattr(method.__returning__, "__name__", "")
+        if returning == "Message":
+            self._message_id += 1
+            photo = None
+            if name == "SendPhoto":
+                # Стабильный file_id на картинку, чтобы работал кэш media_cache
+                file_id = f"fake-{abs(hash(str(method.photo)))}"
+                photo = [PhotoSize(file_id=file_id, file_unique_id=file_id, width=1, height=1)]
+            return Message(message_id=self._message_id, date=int(time.time()), photo=photo,
+                           chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"))
+        if returning == "Chat":
+            return Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private")
+        if returning == "User":
+            return User(id=1, is_bot=True, first_name="Bot", username="fake_bot")
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_update_data(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def make_update(update_id: int, user_id: int, text: str) -> Update:
+    return Update(**make_update_data(update_id, user_id, text))
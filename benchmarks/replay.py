@@ -0,0 +1,217 @@
+# Прогон записанного трафика (RECORD_UPDATES_PATH, см. recorder.py) через обработчики
+# bot.py без сети: копия базы во временном каталоге, поддельная сессия Telegram.
+# Копия обезличивается той же солью RECORD_UPDATES_SALT, что и запись, поэтому
+# записанные пользователи находятся в базе и прогон идёт по тем же веткам обработчиков,
+# что и в работе бота. Админом при прогоне считается обезличенный админ из записи.
+# Обновления подаются задачами, как при polling: с исходными интервалами (--speed 1),
+# ускоренно (--speed 10) или без пауз (--speed max, не больше --concurrency одновременно).
+# Отчёт — время по каждому обработчику (p50/p99/среднее), самые затратные функции базы,
+# число commit и вызовов Bot API. Результат можно сохранить (--json) и сравнить
+# с прогоном другой сборки на той же записи (--baseline).
+#
+#   RECORD_UPDATES_SALT=... python benchmarks/replay.py updates.jsonl --db users.db [--speed max]
+#                               [--json result.json] [--baseline previous.json]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_dispatcher import percentile  # noqa: E402
+from migrations import apply_migrations  # noqa: E402
+from recorder import Anonymizer, anonymize_database, read_records, record_to_update  # noqa: E402
+
+
+def setup_env(tmp, db_path, throttle, admin_id, anonymizer):
+    os.environ.setdefault("API_TOKEN", "123456:REPLAY")
+    os.environ["ADMIN_ID"] = str(admin_id)
+    os.environ["BOT_MODE"] = "polling"
+    os.environ["BOT_WORKERS"] = "1"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ.pop("RECORD_UPDATES_PATH", None)
+    if not throttle:
+        os.environ["THROTTLE_LIMITS"] = "start=1000000/0.001,default=1000000/0.001"
+    copy = os.path.join(tmp, "users.db")
+    # backup вместо копирования файла: забирает и то, что ещё лежит в WAL
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(copy)
+    source.backup(target)
+    source.close()
+    apply_migrations(target)
+    anonymize_database(target, anonymizer)
+    target.close()
+    os.environ["DB_PATH"] = copy
+
+
+# Записи с единой шкалой времени (у каждого запуска бота своё начало отсчёта)
+# и обезличенный ID админа. Все запуски должны быть записаны с солью anonymizer.
+def load_records(path: str, anonymizer: Anonymizer) -> Tuple[List[Dict[str, Any]], int]:
+    records = []
+    admin = 0
+    offset = previous = 0.0
+    for header, record in read_records(path):
+        if header.get("key") != anonymizer.key:
+            raise SystemExit(f"{path}: запись сделана с другой солью, чем RECORD_UPDATES_SALT / --salt")
+        admin = header["admin"]
+        if record["t"] < previous:
+            offset += previous
+        previous = record["t"]
+        record["t"] += offset
+        records.append(record)
+    return records, admin
+
+
+async def run(args, records) -> Dict:
+    import bot as B
+    logging.getLogger().setLevel(logging.WARNING)
+    from fake_telegram import FakeTelegramSession
+    from metrics import handler_name
+
+    timings: Dict[str, List[float]] = {}
+
+    # Точное время обработчиков (гистограммы metrics.py дают только границы корзин)
+    async def time_handler(handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            timings.setdefault(handler_name(data), []).append(time.perf_counter() - started)
+
+    B.dp.message.middleware(time_handler)
+    B.dp.callback_query.middleware(time_handler)
+
+    session = FakeTelegramSession(capture=False)
+    B.bot.session = session
+    await B.startup(primary=False)
+
+    updates = [(record["t"], record_to_update(record, i + 1)) for i, record in enumerate(records)]
+    speed = None if args.speed == "max" else float(args.speed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = 0
+
+    # Исключения обработчиков перехватывает @dp.errors в bot.py и из feed_update
+    # не выпускает, поэтому ошибки считаются outer middleware событий ошибок
+    async def count_error(handler, event, data):
+        nonlocal errors
+        errors += 1
+        return await handler(event, data)
+
+    B.dp.errors.outer_middleware(count_error)
+
+    async def feed(update):
+        try:
+            await B.dp.feed_update(B.bot, update)
+        except Exception:
+            # Обработчик ошибок сам упал — исключение уже посчитано в count_error
+            pass
+        finally:
+            semaphore.release()
+
+    commits, writes = B.db.commits, B.db.writes
+    tasks = set()
+    started = time.perf_counter()
+    for at, update in updates:
+        if speed is not None:
+            delay = at / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await semaphore.acquire()
+        task = asyncio.create_task(feed(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(set(tasks))
+    elapsed = time.perf_counter() - started
+    commits, writes = B.db.commits - commits, B.db.writes - writes
+    await B.shutdown()
+
+    queries = sorted(B.metrics.histograms("db_query_seconds"), key=lambda item: item[2], reverse=True)
+    return {
+        "records": args.records,
+        "speed": args.speed,
+        "updates": len(updates),
+        "recorded_span": updates[-1][0] if updates else 0.0,
+        "elapsed": elapsed,
+        "throughput": len(updates) / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "handlers": {name: {"updates": len(values),
+                            "avg_ms": sum(values) / len(values) * 1000,
+                            "p50_ms": percentile(values, 0.5) * 1000,
+                            "p99_ms": percentile(values, 0.99) * 1000}
+                     for name, values in sorted(timings.items(), key=lambda item: -sum(item[1]))},
+        "db_queries": {"{query} ({kind})".format(**dict(labels)): {"calls": count, "total_ms": total * 1000,
+                                                                    "avg_ms": total / count * 1000}
+                       for labels, count, total, _, _ in queries[:10]},
+        "db_commits": commits,
+        "db_writes": writes,
+        "api_calls": session.calls,
+    }
+
+
+def report(result: Dict, baseline: Dict = None):
+    def delta(name, key):
+        old = (baseline or {}).get("handlers", {}).get(name, {}).get(key)
+        if not old:
+            return ""
+        return f" ({(result['handlers'][name][key] - old) / old * 100:+.0f}%)"
+
+    print(f"updates:    {result['updates']} за {result['recorded_span']:.1f} с записи, "
+          f"speed {result['speed']}, errors: {result['errors']}")
+    print(f"elapsed:    {result['elapsed']:.2f} s, {result['throughput']:.0f} updates/sec")
+    print(f"{'handler':34}{'count':>7}{'avg ms':>9}{'p50 ms':>9}{'p99 ms':>16}")
+    for name, stats in result["handlers"].items():
+        print(f"{name:34}{stats['updates']:7}{stats['avg_ms']:9.2f}{stats['p50_ms']:9.2f}"
+              f"{stats['p99_ms']:9.2f}{delta(name, 'p99_ms'):>7}")
+    print("db helpers by total time:")
+    for name, stats in result["db_queries"].items():
+        print(f"  {name:40}{stats['calls']:7} calls{stats['total_ms']:10.1f} ms total{stats['avg_ms']:9.3f} ms avg")
+    print(f"db commits: {result['db_commits']} (writes: {result['db_writes']}), api calls: {result['api_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("records", help="JSONL-файл из RECORD_UPDATES_PATH")
+    parser.add_argument("--db", default="users.db", help="база, копия которой используется при прогоне")
+    parser.add_argument("--speed", default="max", help="1, 10, ... или max")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--throttle", action="store_true", help="не отключать ограничение частоты")
+    parser.add_argument("--salt", default=os.getenv("RECORD_UPDATES_SALT"),
+                        help="соль записи (по умолчанию RECORD_UPDATES_SALT)")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="результат прошлого прогона для сравнения")
+    args = parser.parse_args()
+    if args.speed != "max" and float(args.speed) <= 0:
+        parser.error("--speed должен быть больше нуля или max")
+    if not args.salt:
+        parser.error("нужна соль записи: RECORD_UPDATES_SALT или --salt")
+    anonymizer = Anonymizer(args.salt.encode())
+    records, admin_id = load_records(args.records, anonymizer)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        setup_env(tmp, args.db, args.throttle, admin_id, anonymizer)
+        result = asyncio.run(run(args, records))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report(result, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,236 +1,266 @@
 import logging
-import sqlite3
 from aiogram import Bot, Dispatcher, types, F  # type: ignore
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, Update  # type: ignore
-from aiogram.filters import Command  # type: ignore
-from aiogram.fsm.storage.memory import MemoryStorage  # type: ignore
+from aiogram.types import CallbackQuery, Message, Update  # type: ignore
 import asyncio
-from datetime import datetime
 
 from dotenv import load_dotenv  # type: ignore
 import os
+import secrets
+
+from analytics import PERIODS
+from broadcast import Broadcaster
+from cache import TTLCache
+from catalog import CatalogRegistry, Discount, Gift
+from database import Database
+from fsm_storage import create_storage
+from media import MediaCache
+from menus import CATALOG_MENU, MAIN_MENU, TURKISH_BANKCARDS_MENU, render_profile
+from metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, Metrics, MetricsServer, render_stats
+from notify import NotificationDispatcher
+from recorder import UpdateRecorder
+from referrals import MAX_TREE_DEPTH, format_network, render_tree
+from refresh import ProfileRefreshJob
+from sharding import ShardPool, consume, poll_updates, shard_for
+from text_router import TextRouter
+from throttling import MemoryBackend, RateLimiter, SQLiteBackend, ThrottlingMiddleware, parse_limits
+from user_list import EXPORT_FORMATS, build_page, export_file
+from webhook import run_webhook
 
 load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
 
 bot = Bot(token=API_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+
+# FSM-хранилище: memory, sqlite (FSM_DB_PATH, по умолчанию файл базы) или redis (REDIS_URL)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+dp = Dispatcher(storage=create_storage(
+    FSM_STORAGE,
+    os.getenv("FSM_DB_PATH", os.getenv("DB_PATH", "users.db")),
+    os.getenv("REDIS_URL"),
+))
+
+# Кнопки меню и команды: обработчик ищется по тексту одним поиском в словаре.
+# Регистрируется первым, остальные фильтры проверяются, только если текст не найден.
+menu = TextRouter()
+dp.message.register(menu.dispatch, menu.match)
+
+# Число процессов-обработчиков. При BOT_WORKERS > 1 главный процесс только получает
+# обновления и раскладывает их по процессам по user_id (см. sharding.py).
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
 
 # Логирование
 logging.basicConfig(level=logging.INFO)
 
-# Подключение к базе данных SQLite
-conn = sqlite3.connect('users.db')
-cursor = conn.cursor()
-
-# Ensure the 'level' column exists
-try:
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [column[1] for column in cursor.fetchall()]
-    print(columns)
-except sqlite3.OperationalError as e:
-    logging.error(f"Error ensuring 'level' column exists: {e}")
-
-# Добавляем колонку coins, rewards и level, если их нет
-try:
-    cursor.execute("ALTER TABLE users ADD COLUMN coins INTEGER DEFAULT 0")
-    cursor.execute("ALTER TABLE users ADD COLUMN rewards TEXT DEFAULT ''")
-    cursor.execute("ALTER TABLE users ADD COLUMN level INTEGER DEFAULT 1")
-    conn.commit()
-except sqlite3.OperationalError:
-    pass  # Колонки уже существуют
-
-# Добавляем колонку first_name, если её нет
-try:
-    cursor.execute("ALTER TABLE users ADD COLUMN first_name TEXT")
-    conn.commit()
-except sqlite3.OperationalError:
-    pass  # Колонка уже существует
-
-# Таблица пользователей
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        referrer_id INTEGER,
-        referrals_count INTEGER DEFAULT 0,
-        discount REAL DEFAULT 0.0,
-        coins INTEGER DEFAULT 0,
-        rewards TEXT DEFAULT '',
-        level INTEGER DEFAULT 1
-    )
-""")
-conn.commit()
-
-# Создаём таблицу purchases, если её нет
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS purchases (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        referrer_id INTEGER,
-        amount INTEGER,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-""")
-conn.commit()
-
-# Словарь для отслеживания времени последнего использования команды
-last_command_time = {}
-
-# Словарь продуктов
-PRODUCTS = {
-    "discord_nitro_1m": {"name": "Discord Nitro (1 Month)", "price": 400},
-    "spotify_premium_1m": {"name": "Spotify Premium (1 Month)", "price": 200},
-    "twitch_level1_1m": {"name": "Twitch Level 1 (1 Month)", "price": 200},
-}
-
-# Функция для ограничения частоты команд
-async def throttle_command(user_id: int, command: str, rate: int = 2):
-    now = datetime.now()
-    if user_id in last_command_time:
-        last_time = last_command_time[user_id].get(command)
-        if last_time and (now - last_time).total_seconds() < rate:
-            return False
-    last_command_time.setdefault(user_id, {})[command] = now
-    return True
-
-# Функция добавления нового пользователя в БД
-def add_user(user_id, username, referrer_id=None, first_name=None):
-    # Проверяем, существует ли пользователь
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    if cursor.fetchone():
-        logging.info(f"Пользователь {user_id} уже существует в базе данных.")
-        return
-
-    # Добавляем нового пользователя
-    cursor.execute(
-        "INSERT INTO users (user_id, username, first_name, referrer_id) VALUES (?, ?, ?, ?)",
-        (user_id, username, first_name, referrer_id)
-    )
-    conn.commit()
-    logging.info(f"Добавлен новый пользователь: {user_id}, реферер: {referrer_id}")
-
-    # Если есть реферер, обновляем его данные
-    if referrer_id:
-        logging.info(f"Обновляем данные реферера: {referrer_id}")
-        update_referrals_count(referrer_id)
-        update_discount_and_notify(referrer_id)
-
-# Функция обновления количества рефералов
-def update_referrals_count(user_id):
-    cursor.execute("UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = ?", (user_id,))
-    conn.commit()
-    logging.info(f"Количество рефералов обновлено для пользователя {user_id}")
-
-# Функция обновления скидки и уведомления реферера
-def update_discount_and_notify(user_id):
-    cursor.execute("SELECT referrals_count FROM users WHERE user_id = ?", (user_id,))
-    referrals_count = cursor.fetchone()[0]
-    discount = min(referrals_count * 2, 50)  # 2% за каждого реферала, максимум 50%
-    cursor.execute("UPDATE users SET discount = ? WHERE user_id = ?", (discount, user_id))
-    conn.commit()
-    logging.info(f"Скидка обновлена для пользователя {user_id}: {discount}%")
-
-    # Уведомляем реферера
-    asyncio.create_task(bot.send_message(
+# Метрики: время обработчиков, функций базы и commit, вызовов Bot API и ошибки.
+# При заданном METRICS_PORT отдаются на http://METRICS_HOST:METRICS_PORT/metrics
+# (при BOT_WORKERS > 1 процесс-обработчик i слушает METRICS_PORT + 1 + i), сводка — /stats.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+metrics = Metrics()
+metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT)
+bot.session.middleware(ApiMetricsMiddleware(metrics))
+dp.message.middleware(HandlerMetricsMiddleware(metrics))
+dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+
+# Асинхронный слой доступа к базе данных SQLite
+DB_PATH = os.getenv("DB_PATH", "users.db")
+DB_READERS = int(os.getenv("DB_READERS", "2"))
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "50"))
+DB_BATCH_DELAY_MS = int(os.getenv("DB_BATCH_DELAY_MS", "20"))
+# Кэш профилей у каждого процесса свой, а реферальные начисления и админские команды
+# меняют профили чужих шардов, поэтому при нескольких процессах кэш по умолчанию выключен
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000" if BOT_WORKERS == 1 else "0"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+db = Database(
+    DB_PATH,
+    readers=DB_READERS,
+    batch_size=DB_BATCH_SIZE,
+    batch_delay=DB_BATCH_DELAY_MS / 1000,
+    cache=TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL),
+    metrics=metrics,
+)
+
+# Ограничение частоты сообщений и inline-кнопок для всех обработчиков.
+# THROTTLE_LIMITS: "start=1/2,list_users=1/30,default=5/1" (запросов подряд / секунд на токен)
+# THROTTLE_BACKEND: memory или sqlite (общие лимиты для нескольких процессов)
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "memory")
+limiter = RateLimiter(
+    limits=parse_limits(os.getenv("THROTTLE_LIMITS", "")),
+    backend=SQLiteBackend(os.getenv("THROTTLE_DB_PATH", DB_PATH)) if THROTTLE_BACKEND == "sqlite" else MemoryBackend(),
+)
+throttling = ThrottlingMiddleware(limiter)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+
+# Фоновое обновление профилей пользователей для /list_users.
+# REFRESH_CONCURRENCY и REFRESH_RATE — параллельность и запросов getChat в секунду,
+# REFRESH_STALE_HOURS — через сколько часов профиль считается устаревшим.
+refresh_job = ProfileRefreshJob(
+    bot,
+    db,
+    concurrency=int(os.getenv("REFRESH_CONCURRENCY", "5")),
+    rate=float(os.getenv("REFRESH_RATE", "20")),
+    stale_after=int(os.getenv("REFRESH_STALE_HOURS", "24")) * 3600,
+)
+
+# Рассылки всем пользователям. BROADCAST_RATE — сообщений в секунду на все рассылки:
+# ниже глобального лимита Telegram (~30/с), чтобы ответы обработчиков не упирались в flood control.
+broadcaster = Broadcaster(
+    bot,
+    db,
+    rate=float(os.getenv("BROADCAST_RATE", "20")),
+    workers=int(os.getenv("BROADCAST_WORKERS", "8")),
+)
+
+# Уведомления пользователям отправляются в фоне через очередь:
+# NOTIFY_CONCURRENCY воркеров, не больше NOTIFY_QUEUE_SIZE ожидающих уведомлений.
+notifier = NotificationDispatcher(
+    bot,
+    concurrency=int(os.getenv("NOTIFY_CONCURRENCY", "10")),
+    max_queue=int(os.getenv("NOTIFY_QUEUE_SIZE", "10000")),
+)
+
+# Картинки отправляются по file_id из media_cache, по URL — только первый раз.
+# MEDIA_PRELOAD_CHAT_ID — чат, куда картинки загружаются при запуске (по умолчанию не загружаются).
+WELCOME_PHOTO = "https://i.imgur.com/lnr4Z0M.jpeg"
+FUPS_PHOTO = "https://imgur.com/a/Ns79AjX"
+OZAN_PHOTO = "https://imgur.com/a/hGYZ9Ny"
+PAYCELL_PHOTO = "https://imgur.com/a/LDGGDkG"
+MEDIA_PRELOAD_CHAT_ID = os.getenv("MEDIA_PRELOAD_CHAT_ID")
+media = MediaCache(bot, db)
+
+# Счётчики компонентов, которые снимаются при выгрузке метрик
+metrics.gauge("db_commits_total", lambda: db.commits)
+metrics.gauge("db_writes_total", lambda: db.writes)
+metrics.gauge("user_cache_hits_total", lambda: db.cache.hits)
+metrics.gauge("user_cache_misses_total", lambda: db.cache.misses)
+metrics.gauge("notify_queue_depth", lambda: notifier.queue_depth)
+metrics.gauge("notify_sent_total", lambda: notifier.sent)
+metrics.gauge("notify_failed_total", lambda: notifier.failed)
+metrics.gauge("media_cache_hits_total", lambda: media.hits)
+metrics.gauge("media_cache_misses_total", lambda: media.misses)
+
+# Режим получения обновлений: polling или webhook.
+# В режиме webhook бот слушает WEBHOOK_HOST:WEBHOOK_PORT (по умолчанию $PORT),
+# принимает POST на WEBHOOK_PATH с проверкой WEBHOOK_SECRET и при заданном
+# WEBHOOK_URL сам регистрирует webhook в Telegram. GET /healthz — для балансировщика.
+# Без проверки секрета любой, кто знает путь, мог бы прислать обновление от имени админа,
+# поэтому WEBHOOK_SECRET обязателен. Если он не задан, но webhook регистрирует сам бот
+# (задан WEBHOOK_URL), секрет генерируется при запуске; иначе бот не запускается.
+# Одновременно должен работать только один режим: polling при запуске удаляет webhook,
+# поэтому процессы web и worker из Procfile нельзя масштабировать вместе.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    if not WEBHOOK_URL:
+        raise SystemExit("BOT_MODE=webhook без WEBHOOK_SECRET: задайте секрет, с которым зарегистрирован webhook")
+    WEBHOOK_SECRET = secrets.token_urlsafe(32)
+    logging.warning("WEBHOOK_SECRET не задан, для webhook сгенерирован случайный секрет")
+
+# Каталог подарков, скидок и товаров из CATALOG_PATH; изменения файла
+# подхватываются без перезапуска (проверка раз в CATALOG_RELOAD_INTERVAL секунд)
+catalog = CatalogRegistry(
+    os.getenv("CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json")),
+    reload_interval=float(os.getenv("CATALOG_RELOAD_INTERVAL", "5")),
+)
+
+# Запись входящих обновлений для benchmarks/replay.py: при заданном RECORD_UPDATES_PATH
+# сообщения и callback-запросы дописываются в этот JSONL-файл (при BOT_WORKERS > 1 —
+# в файл с суффиксом .<номер процесса>). ID, username и числа в callback data заменяются
+# HMAC с солью RECORD_UPDATES_SALT, от свободного текста остаётся только длина; кнопки меню,
+# товары и имена команд сохраняются. Соль обязательна и должна быть постоянной: с ней же
+# replay.py обезличивает копию базы, иначе записанные пользователи не найдутся в базе.
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH")
+RECORD_UPDATES_SALT = os.getenv("RECORD_UPDATES_SALT", "")
+if RECORD_UPDATES_PATH and not RECORD_UPDATES_SALT:
+    logging.error("RECORD_UPDATES_PATH задан без RECORD_UPDATES_SALT, запись обновлений отключена")
+    RECORD_UPDATES_PATH = None
+
+# Тексты и аргументы, которые записываются без обезличивания
+def is_known_text(text):
+    current = catalog.current
+    return (text in menu.texts or text in current.gifts_by_button or text in current.discounts_by_button
+            or text in current.products or text in PERIODS or text in ("top", "all"))
+
+recorder = UpdateRecorder(
+    RECORD_UPDATES_PATH or "",
+    is_known_text,
+    admin_id=ADMIN_ID,
+    salt=RECORD_UPDATES_SALT.encode(),
+)
+if RECORD_UPDATES_PATH:
+    dp.update.outer_middleware(recorder)
+
+# Уведомление реферера о новом реферале
+async def notify_referrer(user_id, discount):
+    await notifier.send(
         user_id,
         f"🎉 *You have +1 new referral!*\n"
         f"*Your discount has been increased by 2%.*\n"
         f"*Current discount: {discount}%.*",
         parse_mode="Markdown"
-    ))
-
-# Главное меню (Reply-кнопки)
-def main_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="👤 My Profile"), KeyboardButton(text="🛒 Catalog")],
-            [KeyboardButton(text="🎁 Gift Shop"), KeyboardButton(text="🎁 Referral System")],
-            [KeyboardButton(text="ℹ️ About Us"), KeyboardButton(text="💬 Help & Support")],
-            [KeyboardButton(text="❓ About Levels")]
-        ],
-        resize_keyboard=True,  # Уменьшает размер кнопок для компактного отображения
     )
-    return keyboard
+
+# Список подарков с количеством: "Spotify Premium (1 Month) ×3, Discord Nitro (1 Month)"
+def format_rewards(rewards):
+    if not rewards:
+        return "No rewards yet."
+    return ", ".join(f"{reward} ×{count}" if count > 1 else reward for reward, count in rewards)
+
+# Сколько последних операций с монетами показывать в /userstat
+COIN_HISTORY_LIMIT = 5
+
+# Последние операции с монетами из журнала coin_transactions, новые сверху
+def format_transactions(transactions):
+    if not transactions:
+        return "No coin operations yet."
+    return "\n".join(
+        f"• `{delta:+} → {balance} · {reason} · {created_at}`" for delta, balance, reason, created_at in transactions
+    )
 
 # Проверка, является ли пользователь администратором
 def is_admin(user_id):
     return user_id == ADMIN_ID
 
-# Функция для получения баланса монет пользователя
-def get_user_coins(user_id):
-    cursor.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    return result[0] if result else 0
-
-# Функция для обновления наград пользователя
-def add_reward(user_id, reward):
-    cursor.execute("SELECT rewards FROM users WHERE user_id = ?", (user_id,))
-    current_rewards = cursor.fetchone()[0]
-    updated_rewards = current_rewards + f"{reward}, " if current_rewards else f"{reward}, "
-    cursor.execute("UPDATE users SET rewards = ? WHERE user_id = ?", (updated_rewards, user_id))
-    conn.commit()
-
-# Функция добавления монет пользователю
-def add_coins(user_id, coins_to_add):
-    cursor.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,))
-    current_coins = cursor.fetchone()[0]
-    new_coins = current_coins + coins_to_add
-    cursor.execute("UPDATE users SET coins = ? WHERE user_id = ?", (new_coins, user_id))
-    conn.commit()
-
-# Функция обновления уровня пользователя
-def update_user_level(user_id):
-    cursor.execute("SELECT level FROM users WHERE user_id = ?", (user_id,))
-    current_level = cursor.fetchone()[0]
-
-    # Проверяем, совершал ли пользователь покупку или его реферал
-    cursor.execute("SELECT COUNT(*) FROM purchases WHERE user_id = ? OR referrer_id = ?", (user_id, user_id))
-    purchase_count = cursor.fetchone()[0]
-
-    # Если есть покупки, повышаем уровень до 2
-    if purchase_count > 0 and current_level < 2:
-        cursor.execute("UPDATE users SET level = 2 WHERE user_id = ?", (user_id,))
-        conn.commit()
-
-        # Уведомляем пользователя о повышении уровня
-        asyncio.create_task(bot.send_message(
-            user_id,
-            "🎉 *Congratulations!*\n"
-            "Your level has been upgraded to *Level 2*!\n\n"
-            "🔹 *New benefits:*\n"
-            "• You can now purchase all gifts in the Gift Shop.\n"
-            "• You earn *30 coins* for each referral instead of 25.\n",
-            parse_mode="Markdown"
-        ))
+# Уведомление пользователя о повышении уровня
+async def notify_level_up(user_id):
+    await notifier.send(
+        user_id,
+        "🎉 *Congratulations!*\n"
+        "Your level has been upgraded to *Level 2*!\n\n"
+        "🔹 *New benefits:*\n"
+        "• You can now purchase all gifts in the Gift Shop.\n"
+        "• You earn *30 coins* for each referral instead of 25.\n",
+        parse_mode="Markdown"
+    )
 
 # Обработчик команды /start
-@dp.message(Command(commands=["start"]))
+@menu.command("start")
 async def cmd_start(message: Message):
     user_id = message.from_user.id
     username = message.from_user.username
     first_name = message.from_user.first_name  # Получаем имя пользователя
     referrer_id = None
 
-    # Ограничение частоты команды
-    if not await throttle_command(user_id, "start", rate=2):
-        await message.answer("⏳ Please wait before using this command again.")
-        return
-
     # Если сообщение содержит /start и реферальный код
     if len(message.text.split()) > 1:
         referrer_id = int(message.text.split()[1])
         logging.info(f"Пользователь {user_id} пришел по реферальной ссылке от {referrer_id}")
 
     # Добавляем пользователя в базу данных
-    add_user(user_id, username, referrer_id, first_name)
+    referrer_discount = await db.add_user(user_id, username, referrer_id, first_name)
+    if referrer_discount is not None:
+        await notify_referrer(referrer_id, referrer_discount)
 
     # Приветственное сообщение с фотографией и текстом
-    photo_url = "https://i.imgur.com/lnr4Z0M.jpeg" 
-    await bot.send_photo(
-        chat_id=message.chat.id,
-        photo=photo_url,
+    await media.send_photo(
+        message.chat.id,
+        WELCOME_PHOTO,
         caption=(
             f"Hello, *{first_name}*! \nWelcome to *Horda Shop*! 🎉\n\n"
             "*💫 Tap the menu below to snoop around.*\n"
@@ -239,130 +269,54 @@ async def cmd_start(message: Message):
             "*Reviews:* [@hordareviews]"
         ),
         parse_mode="Markdown",
-        reply_markup=main_menu()
+        reply_markup=MAIN_MENU
     )
 
 # Обработчик кнопки "👤 My Profile"
-@dp.message(F.text == "👤 My Profile")
+@menu.text("👤 My Profile")
 async def handle_profile(message: Message):
     user_id = message.from_user.id
 
     # Проверяем, существует ли пользователь в базе данных
-    cursor.execute("SELECT referrals_count, discount, coins, rewards, level FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
+    result = await db.get_profile(user_id)
 
     if result:
-        referrals_count, discount, coins, rewards, level = result
-        rewards_list = rewards if rewards else "No rewards yet."
-        await message.answer(
-            f"*👤 Your Profile*\n\n"
-            f"*👥 Referrals:* {referrals_count}\n"
-            f"*💸 Discount:* {discount:.2f}%\n"
-            f"*💰 Coins:* {coins} 🏅\n"
-             f"*🏆 Level:* {level} 💎\n\n"
-            f"*🎁 Presents bought:* {rewards_list}\n",
-            parse_mode="Markdown"
-        )
+        await message.answer(render_profile(result, format_rewards(result.rewards)), parse_mode="Markdown")
     else:
         await message.answer("You are not registered in the system yet.")
 
 # Обработчик кнопки "🎁 Gift Shop"
-@dp.message(F.text == "🎁 Gift Shop")
+@menu.text("🎁 Gift Shop")
 async def handle_gift_shop(message: Message):
-    user_id = message.from_user.id
-
-    # Проверяем уровень пользователя
-    cursor.execute("SELECT level FROM users WHERE user_id = ?", (user_id,))
-    level = cursor.fetchone()[0]
-
-    # Формируем клавиатуру для всех пользователей
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🎮 Discord Nitro (1 Month)"), KeyboardButton(text="🎮 Discord Nitro (3 Months)")],
-            [KeyboardButton(text="🎵 Spotify Premium (1 Month)"), KeyboardButton(text="🎵 Spotify Premium (3 Months)")],
-            [KeyboardButton(text="🎵 Spotify Premium (6 Months)"), KeyboardButton(text="🎵 Spotify Premium (12 Months)")],
-            [KeyboardButton(text="🟣 Twitch Level 1 (1 Month)"), KeyboardButton(text="🟣 Twitch Level 1 (3 Months)")],
-            [KeyboardButton(text="🟣 Twitch Level 1 (6 Months)"), KeyboardButton(text="🟣 Twitch Level 2 (1 Month)")],
-            [KeyboardButton(text="🟣 Twitch Level 3 (1 Month)"), KeyboardButton(text="💸 Buy 50% Discount (300 coins 🏅)")],
-            [KeyboardButton(text="💸 Buy 10% Discount (50 coins 🏅)"), KeyboardButton(text="💸 Buy 25% Discount (120 coins 🏅)")],
-                                            [KeyboardButton(text="⬅️ Back to Menu")]
-        ],
-        resize_keyboard=True,
-    )
-
-    await message.answer(
-        "🎁 *Gift Shop*\n\n"
-        "Here are the available gifts and discounts you can purchase with your coins.\n\n"
-        "🎮 *Discord Nitro*\n"
-        "▫️ *1 Month — 400 coins 🏅*\n"
-        "▫️* 3 Months — 800 coins 🏅*\n\n"
-        "🎵 *Spotify Premium*\n"
-        "▫️ *1 Month — 200 coins 🏅*\n"
-        "▫️ *3 Months — 450 coins 🏅*\n"
-        "▫️ *6 Months — 600 coins 🏅*\n"
-        "▫️ *12 Months — 1220 coins 🏅*\n\n"
-        "🟣 *Twitch Subscriptions*\n"
-        "▫️ *Level 1 (1 Month) — 200 coins 🏅*\n"
-        "▫️ *Level 1 (3 Months) — 400 coins* 🏅\n"
-        "▫️ *Level 1 (6 Months) — 800 coins *🏅\n"
-        "▫️ *Level 2 (1 Month) — 300 coins* 🏅\n"
-        "▫️ *Level 3 (1 Month) — 800 coins *🏅\n\n"
-        "💸 *Discounts:*\n"
-        "▫️* 10% — 50 coins *🏅\n"
-        "▫️ *25% — 120 coins* 🏅\n"
-        "▫️ *50% — 300 coins *🏅\n\n",
-        reply_markup=keyboard,
-        parse_mode="Markdown"
-    )
+    # Текст и клавиатура собраны при загрузке каталога
+    current = catalog.current
+    await message.answer(current.gift_shop_text, reply_markup=current.gift_shop_keyboard, parse_mode="Markdown")
 
 # Обработчик покупки подарков
-@dp.message(F.text.in_({
-    "🎮 Discord Nitro (1 Month)",
-    "🎮 Discord Nitro (3 Months)",
-    "🎵 Spotify Premium (1 Month)",
-    "🎵 Spotify Premium (3 Months)",
-    "🎵 Spotify Premium (6 Months)",
-    "🎵 Spotify Premium (12 Months)",
-    "🟣 Twitch Level 1 (1 Month)",
-    "🟣 Twitch Level 1 (3 Months)",
-    "🟣 Twitch Level 1 (6 Months)",
-    "🟣 Twitch Level 2 (1 Month)",
-    "🟣 Twitch Level 3 (1 Month)"
-}))
-async def handle_gift_purchase(message: Message):
+@dp.message(catalog.gift_filter())
+async def handle_gift_purchase(message: Message, gift: Gift):
     user_id = message.from_user.id
-    gift_mapping = {
-        "🎮 Discord Nitro (1 Month)": ("Discord Nitro (1 Month)", 400),
-        "🎮 Discord Nitro (3 Months)": ("Discord Nitro (3 Months)", 800),
-        "🎵 Spotify Premium (1 Month)": ("Spotify Premium (1 Month)", 200),
-        "🎵 Spotify Premium (3 Months)": ("Spotify Premium (3 Months)", 450),
-        "🎵 Spotify Premium (6 Months)": ("Spotify Premium (6 Months)", 600),
-        "🎵 Spotify Premium (12 Months)": ("Spotify Premium (12 Months)", 1220),
-        "🟣 Twitch Level 1 (1 Month)": ("Twitch Level 1 (1 Month)", 200),
-        "🟣 Twitch Level 1 (3 Months)": ("Twitch Level 1 (3 Months)", 400),
-        "🟣 Twitch Level 1 (6 Months)": ("Twitch Level 1 (6 Months)", 800),
-        "🟣 Twitch Level 2 (1 Month)": ("Twitch Level 2 (1 Month)", 300),
-        "🟣 Twitch Level 3 (1 Month)": ("Twitch Level 3 (1 Month)", 800),
-    }
-    gift_name, gift_cost = gift_mapping[message.text]
+    gift_name, gift_cost = gift.name, gift.cost
 
     # Проверяем уровень пользователя
-    cursor.execute("SELECT level FROM users WHERE user_id = ?", (user_id,))
-    level = cursor.fetchone()[0]
+    profile = await db.get_profile(user_id)
+    if not profile:
+        await message.answer("You are not registered in the system yet.")
+        return
 
     # Если уровень недостаточен
-    if level < 2:
+    if profile.level < gift.min_level:
         await message.answer(
-            f"❌ *This gift is only available for Level 2 users.*\n"
-            f"Earn Level 2 by making a purchase or if your referral makes a purchase.\n\n"
-            f"*Your current balance:* {get_user_coins(user_id)} 🏅 coins\n"
+            f"❌ *This gift is only available for Level {gift.min_level} users.*\n"
+            f"Earn Level {gift.min_level} by making a purchase or if your referral makes a purchase.\n\n"
+            f"*Your current balance:* {profile.coins} 🏅 coins\n"
             f"*Cost:* {gift_cost} 🏅 coins",
             parse_mode="Markdown"
         )
         return
 
     # Проверяем баланс пользователя
-    coins = get_user_coins(user_id)
+    coins = profile.coins
     if coins < gift_cost:
         await message.answer(
             f"❌ *You don't have enough coins to buy {gift_name}.*\n"
@@ -373,46 +327,40 @@ async def handle_gift_purchase(message: Message):
         return
 
     # Списываем монеты и добавляем подарок
-    cursor.execute("UPDATE users SET coins = coins - ? WHERE user_id = ?", (gift_cost, user_id))
-    conn.commit()
-    add_reward(user_id, gift_name)
+    new_coins = await db.buy_gift(user_id, gift_name, gift_cost)
+    if new_coins is None:
+        await message.answer(
+            f"❌ *You don't have enough coins to buy {gift_name}.*\n"
+            f"*Cost:* {gift_cost} 🏅 coins",
+            parse_mode="Markdown"
+        )
+        return
 
     await message.answer(
         f"🎉 *Congratulations!*\n"
         f"*You successfully purchased {gift_name}.*\n"
-        f"*Your current balance:* {coins - gift_cost} 🏅 coins",
+        f"*Your current balance:* {new_coins} 🏅 coins",
         parse_mode="Markdown"
     )
 
 # Обработчик покупки скидок
-@dp.message(F.text.in_({
-    "💸 Buy 10% Discount (50 coins 🏅)",
-    "💸 Buy 25% Discount (120 coins 🏅)",
-    "💸 Buy 50% Discount (300 coins 🏅)",
-    "💸 Buy 75% Discount (600 coins 🏅)",
-    "💸 Buy 100% Discount (1000 coins 🏅)"
-}))
-async def handle_buy_discount(message: Message):
+@dp.message(catalog.discount_filter())
+async def handle_buy_discount(message: Message, discount: Discount):
     user_id = message.from_user.id
-    discount_mapping = {
-        "💸 Buy 10% Discount (50 coins 🏅)": (10, 50),
-        "💸 Buy 25% Discount (120 coins 🏅)": (25, 120),
-        "💸 Buy 50% Discount (300 coins 🏅)": (50, 300),
-        "💸 Buy 75% Discount (600 coins 🏅)": (75, 600),
-        "💸 Buy 100% Discount (1000 coins 🏅)": (100, 1000),
-    }
-    discount_percent, discount_cost = discount_mapping[message.text]
+    discount_percent, discount_cost = discount.percent, discount.cost
 
     # Проверяем уровень пользователя
-    cursor.execute("SELECT level, coins, discount FROM users WHERE user_id = ?", (user_id,))
-    user_data = cursor.fetchone()
-    level, coins, current_discount = user_data
+    profile = await db.get_profile(user_id)
+    if not profile:
+        await message.answer("You are not registered in the system yet.")
+        return
+    level, coins = profile.level, profile.coins
 
     # Проверяем, доступна ли скидка для текущего уровня
-    if discount_percent > 50 and level < 2:
+    if level < discount.min_level:
         await message.answer(
-            "❌ *This discount is only available for Level 2 users.*\n"
-            "Earn Level 2 by making a purchase or if your referral makes a purchase.",
+            f"❌ *This discount is only available for Level {discount.min_level} users.*\n"
+            f"Earn Level {discount.min_level} by making a purchase or if your referral makes a purchase.",
             parse_mode="Markdown"
         )
         return
@@ -428,41 +376,39 @@ async def handle_buy_discount(message: Message):
         return
 
     # Списываем монеты и увеличиваем скидку
-    new_discount = current_discount + discount_percent
-    cursor.execute("UPDATE users SET coins = coins - ?, discount = ? WHERE user_id = ?", (discount_cost, new_discount, user_id))
-    conn.commit()
+    result = await db.buy_discount(user_id, discount_percent, discount_cost)
+    if result is None:
+        await message.answer(
+            f"❌ *You don't have enough coins to buy a {discount_percent}% discount.*\n"
+            f"*Cost:* {discount_cost} 🏅 coins",
+            parse_mode="Markdown"
+        )
+        return
+    new_coins, new_discount = result
 
     await message.answer(
         f"🎉 *Congratulations!*\n"
         f"*You successfully purchased a {discount_percent}% discount.*\n"
-        f"*Your current balance:* {coins - discount_cost} 🏅 coins\n"
+        f"*Your current balance:* {new_coins} 🏅 coins\n"
         f"*Your total discount:* {new_discount}%",
         parse_mode="Markdown"
     )
 
 # Обработчик кнопки "⬅️ Back to Menu"
-@dp.message(F.text == "⬅️ Back to Menu")
+@menu.text("⬅️ Back to Menu")
 async def handle_back_to_menu(message: Message):
-    await message.answer("⬅️ Back to the main menu.", reply_markup=main_menu())
+    await message.answer("⬅️ Back to the main menu.", reply_markup=MAIN_MENU)
 
 # Обработчик кнопки "Assortiment"
-@dp.message(F.text == "🛒 Catalog")
+@menu.text("🛒 Catalog")
 async def handle_assortiment(message: Message):                              
     await message.answer(
         "Choose a category:",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="🎧 Spotify Premium"), KeyboardButton(text="🔴 YouTube Premium")],
-                [KeyboardButton(text="🟣 Twitch Subscription"), KeyboardButton(text="💎 Discord Nitro")],
-                [KeyboardButton(text="⭐ Telegram Stars"), KeyboardButton(text="Turkish Bankcards 🇹🇷")],
-                                            [KeyboardButton(text="Back")]
-            ],
-            resize_keyboard=True
-        )
+        reply_markup=CATALOG_MENU
     )
 
 # Levels
-@dp.message(F.text == "❓ About Levels")
+@menu.text("❓ About Levels")
 async def handle_about_levels(message: Message):
     await message.answer(
         "*📈 About Levels*\n\n"
@@ -481,7 +427,7 @@ async def handle_about_levels(message: Message):
 
 
 # Обработчики для Spotify, YouTube Premium и Twitch Prime
-@dp.message(F.text == "🎧 Spotify Premium")
+@menu.text("🎧 Spotify Premium")
 async def handle_spotify(message: Message):
     await message.answer(
         "🎵 *Spotify Premium Individual*\n\n"
@@ -493,13 +439,13 @@ async def handle_spotify(message: Message):
         "*To buy: @headphony*",
     parse_mode="Markdown")
 
-@dp.message(F.text == "🔴 YouTube Premium")
+@menu.text("🔴 YouTube Premium")
 async def handle_youtube(message: Message):
     await message.answer(
         "soon..."
     )
 
-@dp.message(F.text == "🟣 Twitch Subscription")
+@menu.text("🟣 Twitch Subscription")
 async def handle_twitch(message: Message):
     await message.answer(
         "*🎮 Twitch Subscription*\n"
@@ -519,26 +465,18 @@ async def handle_twitch(message: Message):
     )
 
 # Обработчик кнопки "Turkish Bankcards 🇹🇷"
-@dp.message(F.text == "Turkish Bankcards 🇹🇷")
+@menu.text("Turkish Bankcards 🇹🇷")
 async def handle_turkish_bankcards(message: Message):
     await message.answer(
         "Choose a card type:",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="Fups 🇹🇷"), KeyboardButton(text="Ozan 🇹🇷")],
-                [KeyboardButton(text="Paycell 🇹🇷"), KeyboardButton(text="Other Stuff 🇹🇷")],
-                [KeyboardButton(text="📖 Must Read"), KeyboardButton(text="Back")]
-            ],
-            resize_keyboard=True
-        )
+        reply_markup=TURKISH_BANKCARDS_MENU
     )
 
-@dp.message(F.text == "Fups 🇹🇷")
+@menu.text("Fups 🇹🇷")
 async def handle_fups(message: Message):
-    photo_url = "https://imgur.com/a/Ns79AjX"  # Замените на URL вашей картинки
-    await bot.send_photo(
-        chat_id=message.chat.id,
-        photo=photo_url,
+    await media.send_photo(
+        message.chat.id,
+        FUPS_PHOTO,
         caption=(
             "<b>FUPS</b> is a digital banking platform offering personal <b>IBANs</b>, <b>Visa cards</b>, and "
             "<b>instant money transfers</b> ⭐\n\n"
@@ -552,12 +490,11 @@ async def handle_fups(message: Message):
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "Ozan 🇹🇷")
+@menu.text("Ozan 🇹🇷")
 async def handle_ozan(message: Message):
-    photo_url = "https://imgur.com/a/hGYZ9Ny"  # Замените на URL вашей картинки
-    await bot.send_photo(
-        chat_id=message.chat.id,
-        photo=photo_url,
+    await media.send_photo(
+        message.chat.id,
+        OZAN_PHOTO,
         caption=(
             "<b>Your money, your rules.</b>\n\n"
             "<a href='https://ozan.com'>Ozan</a> gives you <b>instant accounts</b>, <b>powerful cards</b>, and <b>fast</b>, "
@@ -571,12 +508,11 @@ async def handle_ozan(message: Message):
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "Paycell 🇹🇷")
+@menu.text("Paycell 🇹🇷")
 async def handle_paycell(message: Message):
-    photo_url = "https://imgur.com/a/LDGGDkG"  # Замените на URL вашей картинки
-    await bot.send_photo(
-        chat_id=message.chat.id,
-        photo=photo_url,
+    await media.send_photo(
+        message.chat.id,
+        PAYCELL_PHOTO,
         caption=(
             "<b>Paycell</b>, powered by <a href='https://www.turkcell.com.tr'>Turkcell</a>, lets you pay <b>bills</b>, "
             "<b>shop online</b>, and <b>send money</b> with just your phone number ⭐\n\n"
@@ -589,7 +525,7 @@ async def handle_paycell(message: Message):
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "Other Stuff 🇹🇷")
+@menu.text("Other Stuff 🇹🇷")
 async def handle_back(message: Message):
     await message.answer(
         "*🇹🇷Premium methods to top up a Turkish card - 1.99$*\n\n"
@@ -598,7 +534,7 @@ async def handle_back(message: Message):
         "*To buy: @headphony*",
             parse_mode="Markdown")
 
-@dp.message(F.text == "💎 Discord Nitro")
+@menu.text("💎 Discord Nitro")
 async def handle_discord(message: Message):
     await message.answer(
         "💎 *Discord Nitro Full*\n\n"
@@ -612,7 +548,7 @@ async def handle_discord(message: Message):
         parse_mode="Markdown"
     )
 
-@dp.message(F.text == "⭐ Telegram Stars")
+@menu.text("⭐ Telegram Stars")
 async def handle_telegram_stars(message: Message):
     await message.answer(
         "*⭐ Telegram Stars*\n\n"
@@ -628,12 +564,12 @@ async def handle_telegram_stars(message: Message):
     )
 
 # Обработчик кнопки "Назад"
-@dp.message(F.text == "Back")
+@menu.text("Back")
 async def handle_back(message: Message):
-    await message.answer("You are back to the main menu.", reply_markup=main_menu())
+    await message.answer("You are back to the main menu.", reply_markup=MAIN_MENU)
 
 # Обработчик кнопки "Info about us"
-@dp.message(F.text == "ℹ️ About Us")
+@menu.text("ℹ️ About Us")
 async def handle_about(message: Message):
     await message.answer(
         "*Horda Shop. We don’t beg — we deliver.*\n\n"
@@ -646,7 +582,7 @@ async def handle_about(message: Message):
     )
 
 # Обработчик кнопки "Referral System"
-@dp.message(F.text == "🎁 Referral System")
+@menu.text("🎁 Referral System")
 async def handle_referral(message: Message):
     user_id = message.from_user.id
     referral_link = f"https://t.me/hordashop_bot?start={user_id}"
@@ -661,7 +597,7 @@ async def handle_referral(message: Message):
     parse_mode="Markdown")
 
 # Обработчик кнопки "Help"
-@dp.message(F.text == "💬 Help & Support")
+@menu.text("💬 Help & Support")
 async def handle_help(message: Message):
     await message.answer(
         "*Got any questions?*\n\n"
@@ -670,7 +606,7 @@ async def handle_help(message: Message):
        parse_mode="Markdown" 
        )
 
-@dp.message(F.text == "📖 Must Read")
+@menu.text("📖 Must Read")
 async def handle_to_read(message: Message):
     await message.answer(
         "*Important! 🚨*\n\n"
@@ -684,7 +620,7 @@ async def handle_to_read(message: Message):
    )
 
 # Команда: /give_coins
-@dp.message(Command(commands=["give_coins"]))
+@menu.command("give_coins")
 async def handle_give_coins(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -699,19 +635,15 @@ async def handle_give_coins(message: Message):
         username = args[1].lstrip("@")
         coins_to_add = int(args[2])
 
-        cursor.execute("SELECT user_id, coins FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
+        user = await db.get_user_by_username(username)
         if not user:
             await message.answer(f"User with username `@{username}` not found.", parse_mode="Markdown")
             return
 
-        user_id, current_coins = user
-        new_coins = current_coins + coins_to_add
+        user_id = user.user_id
+        new_coins = await db.add_coins(user_id, coins_to_add, reason="admin_give")
 
-        cursor.execute("UPDATE users SET coins = ? WHERE user_id = ?", (new_coins, user_id))
-        conn.commit()
-
-        await bot.send_message(
+        await notifier.send(
             user_id,
             f"🎉 *You have received {coins_to_add} 🏅 coins!*\n"
             f"*Your current balance: {new_coins} 🏅 coins.*",
@@ -728,7 +660,7 @@ async def handle_give_coins(message: Message):
         await message.answer("Invalid input. Please provide a valid username and coin amount.")
 
 # Команда: /remove_coins
-@dp.message(Command(commands=["remove_coins"]))
+@menu.command("remove_coins")
 async def handle_remove_coins(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -743,19 +675,15 @@ async def handle_remove_coins(message: Message):
         username = args[1].lstrip("@")
         coins_to_remove = int(args[2])
 
-        cursor.execute("SELECT user_id, coins FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
+        user = await db.get_user_by_username(username)
         if not user:
             await message.answer(f"User with username `@{username}` not found.", parse_mode="Markdown")
             return
 
-        user_id, current_coins = user
-        new_coins = max(current_coins - coins_to_remove, 0)
-
-        cursor.execute("UPDATE users SET coins = ? WHERE user_id = ?", (new_coins, user_id))
-        conn.commit()
+        user_id = user.user_id
+        new_coins = await db.remove_coins(user_id, coins_to_remove)
 
-        await bot.send_message(
+        await notifier.send(
             user_id,
             f"❌ *{coins_to_remove} 🏅 coins have been removed from your balance.*\n"
             f"*Your current balance: {new_coins} 🏅 coins.*",
@@ -772,7 +700,7 @@ async def handle_remove_coins(message: Message):
         await message.answer("Invalid input. Please provide a valid username and coin amount.")
 
 # Команда: /register_purchase
-@dp.message(Command(commands=["register_purchase"]))
+@menu.command("register_purchase")
 async def handle_register_purchase(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -788,37 +716,40 @@ async def handle_register_purchase(message: Message):
         product_code = args[2]
 
         # Проверяем, существует ли продукт
-        if product_code not in PRODUCTS:
+        product = catalog.current.products.get(product_code)
+        if product is None:
             await message.answer(f"Invalid product code: `{product_code}`", parse_mode="Markdown")
             return
 
-        product = PRODUCTS[product_code]
-        product_name = product["name"]
-        product_price = product["price"]
+        product_name = product.name
+        product_price = product.price
 
         # Проверяем, существует ли пользователь
-        cursor.execute("SELECT user_id, referrer_id FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
+        user = await db.get_user_by_username(username)
         if not user:
             await message.answer(f"User with username `@{username}` not found.", parse_mode="Markdown")
             return
 
-        user_id, referrer_id = user
+        user_id, referrer_id = user.user_id, user.referrer_id
 
         # Начисляем монеты рефереру, если он существует
         if referrer_id:
             coins_to_add = int(product_price * 0.2)
-            add_coins(referrer_id, coins_to_add)
+            await db.add_coins(referrer_id, coins_to_add, reason=f"referral_purchase:{user_id}")
 
-            await bot.send_message(
+            await notifier.send(
                 referrer_id,
                 f"🎉 *The user you invited made a purchase!*\n"
                 f"*You earned {coins_to_add} 🏅 coins!*\n",
                 parse_mode="Markdown"
             )
 
+        # Продажа товара попадает в отчёты /sales, но не в purchases и не влияет на уровень
+        await db.record_product_sale(user_id, referrer_id, product.code, product_price)
+
         # Обновляем уровень пользователя
-        update_user_level(user_id)
+        if await db.update_user_level(user_id):
+            await notify_level_up(user_id)
 
         await message.answer(
             f"Purchase of `{product_name}` by user `@{username}` has been successfully registered.",
@@ -829,7 +760,7 @@ async def handle_register_purchase(message: Message):
         await message.answer("Invalid input. Please provide a valid username and product code.")
 
 # Команда: /register_purchase_general
-@dp.message(Command(commands=["register_purchase_general"]))
+@menu.command("register_purchase_general")
 async def handle_register_purchase_general(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -845,20 +776,16 @@ async def handle_register_purchase_general(message: Message):
         purchase_amount = int(args[2])
 
         # Проверяем, существует ли пользователь
-        cursor.execute("SELECT user_id, referrer_id FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
+        user = await db.get_user_by_username(username)
         if not user:
             await message.answer(f"User with username `@{username}` not found.", parse_mode="Markdown")
             return
 
-        user_id, referrer_id = user
-
-        # Записываем покупку в таблицу purchases
-        cursor.execute("INSERT INTO purchases (user_id, referrer_id, amount) VALUES (?, ?, ?)", (user_id, referrer_id, purchase_amount))
-        conn.commit()
+        user_id, referrer_id = user.user_id, user.referrer_id
 
-        # Обновляем уровень пользователя
-        update_user_level(user_id)
+        # Записываем покупку в таблицу purchases и обновляем уровень пользователя
+        if await db.register_purchase(user_id, referrer_id, purchase_amount):
+            await notify_level_up(user_id)
 
         await message.answer(
             f"Purchase of `{purchase_amount}` coins by user `@{username}` has been successfully registered.",
@@ -868,8 +795,52 @@ async def handle_register_purchase_general(message: Message):
     except ValueError:
         await message.answer("Invalid input. Please provide a valid username and purchase amount.")
 
+# Команда: /sales [today|7|30] или /sales top [7|30|all]
+@menu.command("sales")
+async def handle_sales(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split()[1:]
+    usage = "Usage: `/sales [today|7|30]` or `/sales top [today|7|30|all]`"
+    titles = {"today": "сегодня", "7": "за 7 дней", "30": "за 30 дней", "all": "за всё время"}
+    if args and args[0] == "top":
+        period = args[1] if len(args) > 1 else "all"
+        if period != "all" and period not in PERIODS:
+            return await message.answer(usage, parse_mode="Markdown")
+        leaders = await db.get_top_referrers_by_revenue(PERIODS.get(period), 10)
+        if not leaders:
+            return await message.answer("Продаж по рефералам пока нет.")
+        lines = [
+            f"{place}. {'@' + leader.username if leader.username else leader.referrer_id} — "
+            f"{leader.revenue}, покупок: {leader.orders}"
+            for place, leader in enumerate(leaders, 1)
+        ]
+        return await message.answer(f"🏆 Рефереры по выручке {titles[period]}:\n\n" + "\n".join(lines))
+
+    period = args[0] if args else "today"
+    if period not in PERIODS:
+        return await message.answer(usage, parse_mode="Markdown")
+    total = await db.get_sales(PERIODS[period])
+    products = catalog.current.products
+    lines = [
+        f"• {products[code].name if code in products else code or 'Без товара'}: {sales.revenue} ({sales.orders})"
+        for code, sales in await db.get_product_sales(PERIODS[period])
+    ]
+    await message.answer(
+        f"💰 Продажи {titles[period]}: {total.revenue}, покупок: {total.orders}\n\n" + "\n".join(lines)
+    )
+
+# Команда: /sales_rebuild — пересчитать агрегаты продаж из purchases
+@menu.command("sales_rebuild")
+async def handle_sales_rebuild(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+    count = await db.rebuild_rollups()
+    await message.answer(f"✅ Агрегаты продаж пересчитаны, покупок: {count}")
+
 # Команда: /delete_user
-@dp.message(Command(commands=["delete_user"]))
+@menu.command("delete_user")
 async def handle_delete_user(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -883,21 +854,17 @@ async def handle_delete_user(message: Message):
     try:
         user_id = int(args[1])
 
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        if not cursor.fetchone():
+        if not await db.delete_user(user_id):
             await message.answer(f"User with ID `{user_id}` not found.", parse_mode="Markdown")
             return
 
-        cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-        conn.commit()
-
         await message.answer(f"User with ID `{user_id}` has been successfully deleted.", parse_mode="Markdown")
 
     except ValueError:
         await message.answer("Invalid input. Please provide a valid user ID.")
 
 # Команда: /userstat
-@dp.message(Command(commands=["userstat"]))
+@menu.command("userstat")
 async def handle_userstat(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -911,19 +878,19 @@ async def handle_userstat(message: Message):
     username = args[1].lstrip("@")
 
     # Проверяем, существует ли пользователь
-    cursor.execute("SELECT user_id, referrals_count, coins, rewards FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
+    user = await db.get_user_by_username(username)
     if not user:
         await message.answer(f"User with username `@{username}` not found.", parse_mode="Markdown")
         return
 
-    user_id, referrals_count, coins, rewards = user
-    rewards_list = rewards if rewards else "No rewards yet."
+    user_id, referrals_count, coins, rewards = user.user_id, user.referrals_count, user.coins, user.rewards
+    rewards_list = format_rewards(rewards)
 
-    # Получаем список рефералов
-    cursor.execute("SELECT username FROM users WHERE referrer_id = ?", (user_id,))
-    referrals = cursor.fetchall()
-    referrals_list = "\n".join([f"• @{referral[0]}" for referral in referrals]) if referrals else "No referrals yet."
+    # Получаем список рефералов и размер сети по уровням
+    referrals = await db.get_referrals(user_id)
+    referrals_list = "\n".join([f"• @{referral}" for referral in referrals]) if referrals else "No referrals yet."
+    network = format_network(await db.get_network(user_id))
+    transactions = format_transactions(await db.get_transactions(user_id, COIN_HISTORY_LIMIT))
 
     # Отправляем статистику
     await message.answer(
@@ -931,14 +898,16 @@ async def handle_userstat(message: Message):
         f"*User ID:* `{user_id}`\n"
         f"*Username:* `@{username}`\n"
         f"*Referrals:* `{referrals_count}`\n"
+        f"*Referral network:* `{network}`\n"
         f"*Coins:* `{coins} 🏅`\n"
         f"*Rewards:* `{rewards_list}`\n\n"
+        f"*Recent coin operations:*\n{transactions}\n\n"
         f"*Referrals List:*\n{referrals_list}",
         parse_mode="Markdown"
     )
 
 # Команда: /userstat_by_id
-@dp.message(Command(commands=["userstat_by_id"]))
+@menu.command("userstat_by_id")
 async def handle_userstat_by_id(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("🚫 You don't have permission to use this command.")
@@ -953,19 +922,19 @@ async def handle_userstat_by_id(message: Message):
         user_id = int(args[1])
 
         # Проверяем, существует ли пользователь
-        cursor.execute("SELECT user_id, username, referrals_count, coins, rewards FROM users WHERE user_id = ?", (user_id,))
-        user = cursor.fetchone()
+        user = await db.get_user_by_id(user_id)
         if not user:
             await message.answer(f"User with ID `{user_id}` not found.", parse_mode="Markdown")
             return
 
-        user_id, username, referrals_count, coins, rewards = user
-        rewards_list = rewards if rewards else "No rewards yet."
+        username, referrals_count, coins, rewards = user.username, user.referrals_count, user.coins, user.rewards
+        rewards_list = format_rewards(rewards)
 
-        # Получаем список рефералов
-        cursor.execute("SELECT username FROM users WHERE referrer_id = ?", (user_id,))
-        referrals = cursor.fetchall()
-        referrals_list = "\n".join([f"• @{referral[0]}" for referral in referrals]) if referrals else "No referrals yet."
+        # Получаем список рефералов и размер сети по уровням
+        referrals = await db.get_referrals(user_id)
+        referrals_list = "\n".join([f"• @{referral}" for referral in referrals]) if referrals else "No referrals yet."
+        network = format_network(await db.get_network(user_id))
+        transactions = format_transactions(await db.get_transactions(user_id, COIN_HISTORY_LIMIT))
 
         # Отправляем статистику
         await message.answer(
@@ -973,8 +942,10 @@ async def handle_userstat_by_id(message: Message):
             f"*User ID:* `{user_id}`\n"
             f"*Username:* `@{username if username else 'No username'}`\n"
             f"*Referrals:* `{referrals_count}`\n"
+            f"*Referral network:* `{network}`\n"
             f"*Coins:* `{coins} 🏅`\n"
             f"*Rewards:* `{rewards_list}`\n\n"
+            f"*Recent coin operations:*\n{transactions}\n\n"
             f"*Referrals List:*\n{referrals_list}",
             parse_mode="Markdown"
         )
@@ -982,47 +953,163 @@ async def handle_userstat_by_id(message: Message):
     except ValueError:
         await message.answer("Invalid input. Please provide a valid user ID.")
 
+# Команда: /referral_tree <user_id> [глубина]
+@menu.command("referral_tree")
+async def handle_referral_tree(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split()
+    if len(args) not in (2, 3) or not all(arg.isdigit() for arg in args[1:]):
+        return await message.answer(
+            f"Usage: `/referral_tree <user_id> [depth 1-{MAX_TREE_DEPTH}]`", parse_mode="Markdown"
+        )
+
+    user_id = int(args[1])
+    depth = min(max(int(args[2]) if len(args) == 3 else 3, 1), MAX_TREE_DEPTH)
+    levels = await db.get_network(user_id)
+    nodes = await db.get_tree(user_id, depth)
+    total = sum(count for level, count in levels if level <= depth)
+    await message.answer(
+        f"🌳 Рефералы {user_id} до {depth} уровня: {total}, всего в сети: {format_network(levels)}\n\n"
+        f"{render_tree(user_id, nodes, total)}"
+    )
+
+# Команда: /top_referrers [N]
+@menu.command("top_referrers")
+async def handle_top_referrers(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split()
+    limit = min(int(args[1]), 50) if len(args) > 1 and args[1].isdigit() else 10
+    leaders = await db.get_top_referrers(limit)
+    if not leaders:
+        return await message.answer("No referrals yet.")
+    lines = [
+        f"{place}. {'@' + leader.username if leader.username else leader.user_id} — "
+        f"{leader.referrals_count} рефералов, в сети {leader.network}"
+        for place, leader in enumerate(leaders, 1)
+    ]
+    await message.answer("🏆 Топ рефереров:\n\n" + "\n".join(lines))
+
 
 # Команда: /list_users
-@dp.message(Command(commands=["list_users"]))
+@menu.command("list_users")
 async def handle_list_users(message: Message):
     if not is_admin(message.from_user.id):
         return await message.answer("🚫 Доступно только админам.")
 
-    # Получаем список user_id из базы данных
-    cursor.execute("SELECT user_id FROM users")
-    user_ids = [row[0] for row in cursor.fetchall()]
-
-    # Обновляем данные пользователей через get_chat
-    for user_id in user_ids:
-        try:
-            chat = await bot.get_chat(user_id)  # Получаем актуальные данные пользователя
-            await update_user_in_db(
-                user_id=chat.id,
-                username=chat.username,
-                first_name=chat.first_name
-            )
-        except Exception as e:
-            logging.warning(f"Не удалось обновить данные пользователя {user_id}: {e}")
-
-    # Получаем актуальный список пользователей из базы данных
-    cursor.execute("SELECT user_id, username, first_name FROM users")
-    users = cursor.fetchall()
+    # Обновляем устаревшие профили через get_chat в фоне, прогресс придёт отдельным сообщением
+    await refresh_job.start(message.chat.id)
 
-    if not users:
+    # Первая страница списка пользователей, остальные — по кнопкам
+    page = await build_page(db)
+    if page is None:
         return await message.answer("📭 База пользователей пуста.")
 
-    # Формируем ответное сообщение
-    response = "📂 <b>Список пользователей:</b>\n\n"
-    for user_id, username, first_name in users:
-        response += (
-            f"▫️ <b>{first_name if first_name else '—'}</b>\n"
-            f"├ @{username if username else 'нет юзернейма'}\n"
-            f"└ ID: <code>{user_id}</code>\n"
-            f"🔗 <a href='tg://user?id={user_id}'>Профиль</a>\n\n"
+    text, keyboard = page
+    await message.answer(text, parse_mode="HTML", disable_web_page_preview=True, reply_markup=keyboard)
+
+# Кнопки листания /list_users
+@dp.callback_query(F.data.startswith("users:"))
+async def handle_list_users_page(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("🚫 Доступно только админам.", show_alert=True)
+
+    _, direction, anchor = callback.data.split(":")
+    page = await build_page(db, direction, int(anchor))
+    if page is None:
+        return await callback.answer("📭 Больше пользователей нет.")
+
+    text, keyboard = page
+    await callback.message.edit_text(text, parse_mode="HTML", disable_web_page_preview=True, reply_markup=keyboard)
+    await callback.answer()
+
+# Команда: /export_users [csv|jsonl] — полная выгрузка пользователей файлом
+@menu.command("export_users")
+async def handle_export_users(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split()
+    fmt = args[1].lower() if len(args) > 1 else "csv"
+    if fmt not in EXPORT_FORMATS:
+        return await message.answer("Usage: `/export_users [csv|jsonl]`", parse_mode="Markdown")
+
+    await bot.send_document(message.chat.id, export_file(db, fmt))
+
+# Команда: /refresh_users — полное обновление профилей из Telegram
+@menu.command("refresh_users")
+async def handle_refresh_users(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    if not await refresh_job.start(message.chat.id, full=True):
+        await message.answer("⏳ Обновление профилей уже идёт.")
+
+# Команда: /broadcast <текст> — рассылка всем пользователям.
+# Ответом на сообщение рассылает копию этого сообщения (с фото, форматированием и т.д.).
+@menu.command("broadcast")
+async def handle_broadcast(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split(maxsplit=1)
+    if message.reply_to_message is not None:
+        broadcast_id, total = await broadcaster.create(
+            message.chat.id, from_chat_id=message.chat.id, message_id=message.reply_to_message.message_id
+        )
+    elif len(args) > 1:
+        broadcast_id, total = await broadcaster.create(message.chat.id, text=args[1])
+    else:
+        return await message.answer(
+            "Usage: `/broadcast <text>` or reply `/broadcast` to a message", parse_mode="Markdown"
         )
+    await message.answer(f"📣 Рассылка #{broadcast_id} запущена, получателей: {total}")
+
+# Команда: /broadcast_status <id>
+@menu.command("broadcast_status")
+async def handle_broadcast_status(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        return await message.answer("Usage: `/broadcast_status <id>`", parse_mode="Markdown")
+
+    status = await broadcaster.status(int(args[1]))
+    if status is None:
+        return await message.answer("❌ Рассылка не найдена.")
+    state, total, counts = status
+    await message.answer(
+        f"📣 Рассылка #{args[1]}: {state}\n"
+        f"Получателей: {total}, в очереди: {counts.get('pending', 0)}\n"
+        f"Доставлено: {counts.get('sent', 0)}, заблокировали бота: {counts.get('blocked', 0)}, "
+        f"ошибок: {counts.get('failed', 0)}"
+    )
 
-    await message.answer(response, parse_mode="HTML", disable_web_page_preview=True)
+# Команда: /broadcast_cancel <id>
+@menu.command("broadcast_cancel")
+async def handle_broadcast_cancel(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        return await message.answer("Usage: `/broadcast_cancel <id>`", parse_mode="Markdown")
+
+    if await broadcaster.cancel(int(args[1])):
+        await message.answer(f"🛑 Рассылка #{args[1]} остановлена.")
+    else:
+        await message.answer("❌ Активная рассылка с таким ID не найдена.")
+
+# Команда: /stats — задержки обработчиков, базы и Bot API в этом процессе
+@menu.command("stats")
+async def handle_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("🚫 Доступно только админам.")
+    await message.answer(render_stats(metrics))
 
 # Глобальный обработчик ошибок
 @dp.errors()
@@ -1040,9 +1127,95 @@ async def handle_errors(update: Update, exception: Exception):
 async def handle_unhandled_messages(message: Message):
     await message.answer("There is no such command. Try again!")
 
+# Состояние для /healthz: база отвечает на запросы
+async def health():
+    await db.read(lambda conn: conn.execute("SELECT 1").fetchone())
+    return {"mode": BOT_MODE, "notify_queue": notifier.queue_depth}
+
+async def startup(primary: bool = True):
+    if METRICS_PORT:
+        await metrics_server.start()
+    if RECORD_UPDATES_PATH:
+        recorder.start()
+    await db.start()
+    limiter.start()
+    notifier.start()
+    catalog.start()
+    await media.load()
+    if primary:
+        if MEDIA_PRELOAD_CHAT_ID:
+            await media.preload([WELCOME_PHOTO, FUPS_PHOTO, OZAN_PHOTO, PAYCELL_PHOTO], int(MEDIA_PRELOAD_CHAT_ID))
+        await refresh_job.resume()
+        await broadcaster.resume()
+
+async def shutdown():
+    await catalog.close()
+    await notifier.close()
+    await broadcaster.close()
+    await refresh_job.close()
+    await limiter.close()
+    await db.close()
+    await dp.storage.close()
+    await metrics_server.close()
+    recorder.close()
+
+# Процесс-обработчик при BOT_WORKERS > 1: обрабатывает обновления своих пользователей.
+# Прерванные рассылки и обновление профилей продолжает процесс, в который попадает админ.
+def run_shard(index, shard_queue):
+    asyncio.run(shard_main(index, shard_queue))
+
+async def shard_main(index, shard_queue):
+    metrics_server.port = METRICS_PORT + 1 + index
+    recorder.path = f"{RECORD_UPDATES_PATH}.{index}"
+    await startup(primary=index == shard_for(ADMIN_ID, BOT_WORKERS))
+    try:
+        await consume(shard_queue, dp, bot)
+    finally:
+        await shutdown()
+        await bot.session.close()
+
+# Главный процесс при BOT_WORKERS > 1: получает обновления и передаёт их в процессы
+async def main_sharded():
+    pool = ShardPool(BOT_WORKERS, run_shard)
+    pool.start()
+    if METRICS_PORT:
+        await metrics_server.start()
+
+    async def pool_health():
+        return {"mode": BOT_MODE, "workers": BOT_WORKERS, "alive": pool.alive}
+
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp, bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+                url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, health=pool_health, submit=pool.submit,
+            )
+        else:
+            await bot.delete_webhook()
+            await poll_updates(bot, pool.submit, dp.resolve_used_update_types())
+    finally:
+        await pool.close()
+        await metrics_server.close()
+        await bot.session.close()
+
 # Запуск бота
 async def main():
-    await dp.start_polling(bot)
+    if BOT_WORKERS > 1:
+        return await main_sharded()
+
+    await startup()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp, bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+                url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, health=health,
+            )
+        else:
+            # Telegram не отдаёт обновления через getUpdates, пока установлен webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await shutdown()
 
 logging.basicConfig(level=logging.DEBUG)
 
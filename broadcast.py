@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.exceptions import (  # type: ignore
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+# Состояния получателя в очереди рассылки
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+# Telegram не даёт слать в один чат чаще раза в секунду
+PER_CHAT_INTERVAL = 1.0
+
+
+# Создаём рассылку и ставим в очередь всех, кто не заблокировал бота.
+# Возвращает (id рассылки, количество получателей).
+def create_broadcast(conn, text, from_chat_id, message_id, chat_id) -> Tuple[int, int]:
+    broadcast_id = conn.execute(
+        "INSERT INTO broadcasts (state, text, from_chat_id, message_id, chat_id) VALUES ('running', ?, ?, ?, ?)",
+        (text, from_chat_id, message_id, chat_id)
+    ).lastrowid
+    total = conn.execute(
+        "INSERT INTO broadcast_queue (broadcast_id, user_id) SELECT ?, user_id FROM users WHERE blocked_at IS NULL",
+        (broadcast_id,)
+    ).rowcount
+    conn.execute("UPDATE broadcasts SET total = ? WHERE id = ?", (total, broadcast_id))
+    return broadcast_id, total
+
+
+# (state, text, from_chat_id, message_id, chat_id, total)
+def get_broadcast(conn, broadcast_id):
+    return conn.execute(
+        "SELECT state, text, from_chat_id, message_id, chat_id, total FROM broadcasts WHERE id = ?",
+        (broadcast_id,)
+    ).fetchone()
+
+
+def running_broadcasts(conn) -> List[int]:
+    return [row[0] for row in conn.execute("SELECT id FROM broadcasts WHERE state = 'running' ORDER BY id")]
+
+
+def broadcast_counts(conn, broadcast_id) -> Dict[str, int]:
+    return dict(conn.execute(
+        "SELECT state, COUNT(*) FROM broadcast_queue WHERE broadcast_id = ? GROUP BY state", (broadcast_id,)
+    ).fetchall())
+
+
+# Следующая страница получателей, которым ещё не отправили
+def next_pending(conn, broadcast_id, after_user_id, limit) -> List[Tuple[int, int]]:
+    return conn.execute(
+        "SELECT user_id, attempts FROM broadcast_queue "
+        "WHERE broadcast_id = ? AND state = 'pending' AND user_id > ? ORDER BY user_id LIMIT ?",
+        (broadcast_id, after_user_id, limit)
+    ).fetchall()
+
+
+# Сохраняем результаты отправки пачкой; заблокировавших бота отмечаем в users
+def save_results(conn, broadcast_id, results: List[Tuple[int, str, int]]):
+    conn.executemany(
+        "UPDATE broadcast_queue SET state = ?, attempts = ? WHERE broadcast_id = ? AND user_id = ?",
+        [(state, attempts, broadcast_id, user_id) for user_id, state, attempts in results]
+    )
+    blocked_at = int(time.time())
+    conn.executemany(
+        "UPDATE users SET blocked_at = ? WHERE user_id = ?",
+        [(blocked_at, user_id) for user_id, state, _ in results if state == BLOCKED]
+    )
+
+
+def finish_broadcast(conn, broadcast_id, state):
+    conn.execute(
+        "UPDATE broadcasts SET state = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (state, broadcast_id)
+    )
+
+
+# Общий для всех воркеров token bucket: rate сообщений в секунду, всплеск до capacity.
+# pause() останавливает выдачу токенов после RetryAfter от Telegram.
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Рассылка сообщений всем пользователям.
+# Очередь получателей хранится в SQLite, результаты сохраняются пачками, поэтому
+# после перезапуска рассылка продолжается с неотправленных (сообщения из последней
+# несохранённой пачки могут уйти повторно). Темп ограничен общим token bucket
+# ниже глобального лимита Telegram, чтобы обычным обработчикам оставался запас.
+class Broadcaster:
+    def __init__(self, bot, db, rate: float = 20.0, workers: int = 8, page_size: int = 200,
+                 max_attempts: int = 3, flush_interval: float = 1.0, report_interval: float = 5.0):
+        self.bot = bot
+        self.db = db
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    # Создать рассылку текста или копии сообщения и запустить её
+    async def create(self, chat_id: int, text: Optional[str] = None, from_chat_id: Optional[int] = None,
+                     message_id: Optional[int] = None) -> Tuple[int, int]:
+        broadcast_id, total = await self.db.write(create_broadcast, text, from_chat_id, message_id, chat_id)
+        self.start(broadcast_id)
+        return broadcast_id, total
+
+    def start(self, broadcast_id: int):
+        if broadcast_id not in self._tasks:
+            task = asyncio.create_task(self._run(broadcast_id))
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    # Продолжить рассылки, прерванные перезапуском
+    async def resume(self):
+        for broadcast_id in await self.db.read(running_broadcasts):
+            logging.info(f"Продолжаем рассылку {broadcast_id}")
+            self.start(broadcast_id)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        broadcast = await self.db.read(get_broadcast, broadcast_id)
+        if not broadcast or broadcast[0] != "running":
+            return False
+        await self.db.write(finish_broadcast, broadcast_id, "cancelled")
+        task = self._tasks.get(broadcast_id)
+        if task is not None:
+            task.cancel()
+        return True
+
+    async def status(self, broadcast_id: int) -> Optional[Tuple[str, int, Dict[str, int]]]:
+        broadcast = await self.db.read(get_broadcast, broadcast_id)
+        if not broadcast:
+            return None
+        return broadcast[0], broadcast[5], await self.db.read(broadcast_counts, broadcast_id)
+
+    # Остановить все рассылки без смены состояния — они продолжатся после запуска
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send(self, broadcast, user_id: int):
+        _, text, from_chat_id, message_id, _, _ = broadcast
+        if message_id is not None:
+            await self.bot.copy_message(chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id)
+        else:
+            await self.bot.send_message(user_id, text)
+
+    # Доставка одному получателю с повторами. Возвращает (user_id, состояние, попытки).
+    async def _deliver(self, broadcast, user_id: int, attempts: int) -> Tuple[int, str, int]:
+        while True:
+            await self.bucket.acquire()
+            attempts += 1
+            try:
+                await self._send(broadcast, user_id)
+                return user_id, SENT, attempts
+            except TelegramRetryAfter as e:
+                logging.warning(f"Flood control при рассылке, пауза {e.retry_after} с")
+                self.bucket.pause(e.retry_after)
+                attempts -= 1
+            except TelegramForbiddenError:
+                return user_id, BLOCKED, attempts
+            except TelegramBadRequest as e:
+                logging.warning(f"Рассылка пользователю {user_id} не доставлена: {e}")
+                return user_id, FAILED, attempts
+            except TelegramAPIError as e:
+                if attempts >= self.max_attempts:
+                    logging.warning(f"Рассылка пользователю {user_id} не доставлена после {attempts} попыток: {e}")
+                    return user_id, FAILED, attempts
+                await asyncio.sleep(PER_CHAT_INTERVAL * attempts)
+            except Exception:
+                logging.exception(f"Ошибка рассылки пользователю {user_id}")
+                return user_id, FAILED, attempts
+
+    async def _run(self, broadcast_id: int):
+        broadcast = await self.db.read(get_broadcast, broadcast_id)
+        if not broadcast or broadcast[0] != "running":
+            return
+        chat_id, total = broadcast[4], broadcast[5]
+        counts = await self.db.read(broadcast_counts, broadcast_id)
+        done = total - counts.get(PENDING, 0)
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        results: List[Tuple[int, str, int]] = []
+
+        async def worker():
+            nonlocal done
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                result = await self._deliver(broadcast, *item)
+                results.append(result)
+                counts[result[1]] = counts.get(result[1], 0) + 1
+                done += 1
+
+        async def flush():
+            if results:
+                batch = results[:]
+                del results[:len(batch)]
+                await self.db.write(save_results, broadcast_id, batch)
+
+        async def flusher():
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await flush()
+
+        progress = await self._report(chat_id, None, self._progress_text(broadcast_id, done, total, counts))
+        last_report = time.monotonic()
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        flush_task = asyncio.create_task(flusher())
+        try:
+            cursor = 0
+            while True:
+                page = await self.db.read(next_pending, broadcast_id, cursor, self.page_size)
+                if not page:
+                    break
+                for item in page:
+                    await queue.put(item)
+                cursor = page[-1][0]
+                if time.monotonic() - last_report >= self.report_interval:
+                    progress = await self._report(
+                        chat_id, progress, self._progress_text(broadcast_id, done, total, counts)
+                    )
+                    last_report = time.monotonic()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            logging.info(f"Рассылка {broadcast_id} остановлена на {done}/{total}")
+            raise
+        except Exception:
+            logging.exception(f"Рассылка {broadcast_id} прервана")
+            await self._report(chat_id, progress, "⚠️ " + self._progress_text(broadcast_id, done, total, counts))
+            return
+        finally:
+            for task in workers:
+                task.cancel()
+            flush_task.cancel()
+            await asyncio.gather(*workers, flush_task, return_exceptions=True)
+            await asyncio.shield(flush())
+
+        await self.db.write(finish_broadcast, broadcast_id, "done")
+        await self._report(chat_id, progress, "✅ " + self._progress_text(broadcast_id, done, total, counts))
+
+    @staticmethod
+    def _progress_text(broadcast_id, done, total, counts) -> str:
+        return (
+            f"📣 Рассылка #{broadcast_id}: {done}/{total}\n"
+            f"Доставлено: {counts.get(SENT, 0)}, заблокировали бота: {counts.get(BLOCKED, 0)}, "
+            f"ошибок: {counts.get(FAILED, 0)}"
+        )
+
+    async def _report(self, chat_id, message, text):
+        if chat_id is None:
+            return message
+        try:
+            if message is None:
+                return await self.bot.send_message(chat_id, text)
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message.message_id)
+        except TelegramAPIError as e:
+            logging.warning(f"Не удалось отправить прогресс рассылки: {e}")
+        return message
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+# Ограниченный LRU-кэш с временем жизни записей.
+# generation растёт при каждой записи через кэш: чтение из базы, начатое до
+# изменения, не перезапишет кэш устаревшими данными (см. put).
+class TTLCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # Положить значение, прочитанное из базы.
+    # generation — значение self.generation на момент начала чтения;
+    # если с тех пор кэш менялся, значение могло устареть и не сохраняется.
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        if self.maxsize <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    # Write-through: применить изменение к закэшированному значению, если оно есть
+    def update(self, key: Hashable, change: Callable[[Any], Any]):
+        self.generation += 1
+        item = self._data.get(key)
+        if item is not None:
+            self._data[key] = (change(item[0]), item[1])
+
+    def invalidate(self, key: Hashable):
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import os
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from aiogram.types import Message, ReplyKeyboardMarkup  # type: ignore
+
+from menus import keyboard
+
+BACK_TO_MENU = "⬅️ Back to Menu"
+
+
+# Товар для /register_purchase: price — сумма покупки, от которой считается бонус рефереру
+class Product(NamedTuple):
+    code: str
+    name: str
+    price: int
+
+
+class Gift(NamedTuple):
+    code: str
+    category: str
+    button: str
+    name: str
+    label: str
+    cost: int
+    min_level: int
+
+
+class Discount(NamedTuple):
+    percent: int
+    cost: int
+    min_level: int
+    in_menu: bool
+
+    @property
+    def button(self) -> str:
+        return f"💸 Buy {self.percent}% Discount ({self.cost} coins 🏅)"
+
+
+# Каталог, загруженный из файла: неизменяемые индексы и готовые тексты меню.
+# Всё считается один раз при загрузке, обработчики только читают.
+class Catalog:
+    def __init__(self, data: Dict[str, Any]):
+        products = [Product(**item) for item in data.get("products", [])]
+        categories = [(item["code"], item["title"]) for item in data.get("gift_categories", [])]
+        gifts = [Gift(**item) for item in data.get("gifts", [])]
+        discounts = [Discount(**item) for item in data.get("discounts", [])]
+
+        known = {code for code, _ in categories}
+        for gift in gifts:
+            if gift.category not in known:
+                raise ValueError(f"Подарок {gift.code}: неизвестная категория {gift.category}")
+
+        self.products: Mapping[str, Product] = MappingProxyType({p.code: p for p in products})
+        self.gifts: Mapping[str, Gift] = MappingProxyType({g.code: g for g in gifts})
+        self.gifts_by_button: Mapping[str, Gift] = MappingProxyType({g.button: g for g in gifts})
+        self.gifts_by_category: Mapping[str, Tuple[Gift, ...]] = MappingProxyType({
+            code: tuple(g for g in gifts if g.category == code) for code, _ in categories
+        })
+        self.discounts_by_button: Mapping[str, Discount] = MappingProxyType({d.button: d for d in discounts})
+        if len(self.gifts_by_button) != len(gifts) or len(self.discounts_by_button) != len(discounts):
+            raise ValueError("Повторяющиеся кнопки в каталоге")
+
+        self.gift_shop_text = self._render_gift_shop(categories, discounts)
+        self.gift_shop_keyboard = self._build_gift_shop_keyboard(gifts, discounts)
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _render_gift_shop(self, categories: List[Tuple[str, str]], discounts: List[Discount]) -> str:
+        parts = [
+            "🎁 *Gift Shop*\n\n"
+            "Here are the available gifts and discounts you can purchase with your coins.\n\n"
+        ]
+        for code, title in categories:
+            parts.append(f"{title}\n")
+            parts.extend(f"▫️ *{g.label} — {g.cost} coins 🏅*\n" for g in self.gifts_by_category[code])
+            parts.append("\n")
+        parts.append("💸 *Discounts:*\n")
+        parts.extend(f"▫️ *{d.percent}% — {d.cost} coins 🏅*\n" for d in discounts if d.in_menu)
+        return "".join(parts)
+
+    @staticmethod
+    def _build_gift_shop_keyboard(gifts: List[Gift], discounts: List[Discount]) -> ReplyKeyboardMarkup:
+        buttons = [g.button for g in gifts] + [d.button for d in discounts if d.in_menu]
+        return keyboard([buttons[i:i + 2] for i in range(0, len(buttons), 2)] + [[BACK_TO_MENU]])
+
+
+# Текущий каталог с перезагрузкой при изменении файла.
+# Новый каталог собирается целиком и подменяет старый одной ссылкой; если файл
+# не разбирается, остаётся прежний каталог.
+class CatalogRegistry:
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.current = Catalog.load(path)
+        self._mtime = self._stat()
+        self._task: Optional[asyncio.Task] = None
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    # Перечитать файл, если он изменился. Возвращает True, если каталог обновлён.
+    def reload(self, force: bool = False) -> bool:
+        mtime = self._stat()
+        if not force and (mtime is None or mtime == self._mtime):
+            return False
+        self._mtime = mtime
+        try:
+            self.current = Catalog.load(self.path)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.error(f"Каталог {self.path} не загружен, используется прежний: {e}")
+            return False
+        logging.info(f"Каталог {self.path} перезагружен")
+        return True
+
+    def start(self):
+        if self._task is None and self.reload_interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload()
+
+    # Фильтры для обработчиков: подходящий товар передаётся в обработчик аргументом
+    def gift_filter(self):
+        async def is_gift(message: Message) -> Union[bool, Dict[str, Gift]]:
+            gift = self.current.gifts_by_button.get(message.text)
+            return {"gift": gift} if gift is not None else False
+        return is_gift
+
+    def discount_filter(self):
+        async def is_discount(message: Message) -> Union[bool, Dict[str, Discount]]:
+            discount = self.current.discounts_by_button.get(message.text)
+            return {"discount": discount} if discount is not None else False
+        return is_discount
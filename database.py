@@ -0,0 +1,620 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from analytics import (ReferrerSales, Sales, expire_windows, get_product_sales, get_sales,
+                       get_top_referrers_by_revenue, rebuild_rollups, record_sale)
+from cache import TTLCache
+from ledger import apply_coins, get_transactions
+from migrations import apply_migrations
+from referrals import Referrer, TreeNode, get_network, get_top_referrers, get_tree, link_referral, unlink_user
+
+
+# Профиль соединения SQLite: PRAGMA и их значения.
+# WAL позволяет читателям не ждать писателя, а synchronous=NORMAL в WAL
+# делает fsync только при checkpoint, а не на каждый commit.
+DEFAULT_PROFILE: Dict[str, str] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",
+    "cache_size": "-16000",  # в KiB, т.е. ~16 МБ
+    "mmap_size": "67108864",  # 64 МБ
+    "temp_store": "MEMORY",
+}
+
+# Профиль SQLite по умолчанию (rollback journal, synchronous=FULL) — для сравнения
+LEGACY_PROFILE: Dict[str, str] = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+}
+
+
+# Профиль из окружения: SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS и т.д.
+def load_profile(environ=os.environ) -> Dict[str, str]:
+    return {name: environ.get(f"SQLITE_{name.upper()}", value) for name, value in DEFAULT_PROFILE.items()}
+
+
+# Открываем соединение и применяем профиль
+def connect(path: str, profile: Optional[Dict[str, str]] = None, readonly: bool = False) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for name, value in (profile if profile is not None else DEFAULT_PROFILE).items():
+        # journal_mode хранится в файле базы, его меняет только писатель
+        if readonly and name == "journal_mode":
+            continue
+        result = conn.execute(f"PRAGMA {name} = {value}").fetchone()
+        if name == "journal_mode" and result and result[0].lower() != value.lower():
+            logging.warning(f"SQLite не включил journal_mode={value}, используется {result[0]}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+# Профиль пользователя, который показываем в "👤 My Profile"
+class Profile(NamedTuple):
+    referrals_count: int
+    discount: float
+    coins: int
+    rewards: List[Tuple[str, int]]  # (подарок, сколько раз куплен)
+    level: int
+
+
+# Короткая запись пользователя для админских команд
+class UserRecord(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    referrer_id: Optional[int]
+    referrals_count: int
+    coins: int
+    rewards: List[Tuple[str, int]]
+
+
+# Горячие запросы обработчиков: (название, SQL, пример параметров).
+# При запуске проверяем их планы, чтобы ни один не сканировал таблицу целиком.
+HOT_QUERIES = [
+    ("user by id", "SELECT referrals_count, discount, coins, level FROM users WHERE user_id = ?", (0,)),
+    ("user by username",
+     "SELECT user_id, username, referrer_id, referrals_count, coins FROM users WHERE username = ?", ("",)),
+    ("reward counts",
+     "SELECT reward, COUNT(*) FROM user_rewards WHERE user_id = ? GROUP BY reward ORDER BY MIN(id)", (0,)),
+    ("referrals list", "SELECT username FROM users WHERE referrer_id = ?", (0,)),
+    ("purchase count", "SELECT COUNT(*) FROM purchases WHERE user_id = ? OR referrer_id = ?", (0, 0)),
+    ("coin history",
+     "SELECT delta, balance, reason, created_at FROM coin_transactions WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+     (0, 5)),
+    ("referral network", "SELECT depth, COUNT(*) FROM referral_paths WHERE ancestor_id = ? GROUP BY depth", (0,)),
+    ("top referrers",
+     "SELECT user_id, username, referrals_count FROM users WHERE referrals_count > 0 "
+     "ORDER BY referrals_count DESC, user_id LIMIT ?", (10,)),
+    ("sales by day", "SELECT SUM(orders), SUM(revenue) FROM sales_daily WHERE day > ?", ("",)),
+    ("top referrers by revenue",
+     "SELECT referrer_id, orders, revenue FROM sales_referrers WHERE revenue > 0 "
+     "ORDER BY revenue DESC LIMIT ?", (10,)),
+    ("top referrers by revenue in window",
+     "SELECT referrer_id, orders, revenue FROM sales_referrers_window WHERE period = ? AND revenue > 0 "
+     "ORDER BY revenue DESC LIMIT ?", (7, 10)),
+]
+
+
+# Проверка планов горячих запросов через EXPLAIN QUERY PLAN.
+# Возвращает список запросов, которые всё ещё сканируют таблицу.
+def audit_query_plans(conn: sqlite3.Connection) -> List[str]:
+    scanning = []
+    for name, sql, params in HOT_QUERIES:
+        details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        if any(detail.startswith("SCAN") for detail in details):
+            logging.warning(f"Запрос '{name}' сканирует таблицу: {'; '.join(details)}")
+            scanning.append(name)
+        else:
+            logging.debug(f"План запроса '{name}': {'; '.join(details)}")
+    return scanning
+
+
+# Синхронные функции ниже выполняются только в потоке базы данных
+# и не делают commit сами: транзакцией управляет Database.
+
+# Функция добавления нового пользователя в БД.
+# Возвращает (количество рефералов, скидка) реферера, если его нужно уведомить.
+def add_user(conn, user_id, username, referrer_id=None, first_name=None) -> Optional[Tuple[int, float]]:
+    # Проверяем, существует ли пользователь
+    if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+        logging.info(f"Пользователь {user_id} уже существует в базе данных.")
+        # Пользователь снова пишет боту — значит, больше не заблокировал его
+        conn.execute("UPDATE users SET blocked_at = NULL WHERE user_id = ? AND blocked_at IS NOT NULL", (user_id,))
+        return None
+
+    # Добавляем нового пользователя
+    conn.execute(
+        "INSERT INTO users (user_id, username, first_name, referrer_id) VALUES (?, ?, ?, ?)",
+        (user_id, username, first_name, referrer_id)
+    )
+    logging.info(f"Добавлен новый пользователь: {user_id}, реферер: {referrer_id}")
+    link_referral(conn, user_id, referrer_id)
+
+    # Если есть реферер, обновляем его данные
+    if referrer_id:
+        logging.info(f"Обновляем данные реферера: {referrer_id}")
+        update_referrals_count(conn, referrer_id)
+        return update_discount(conn, referrer_id)
+    return None
+
+# Функция обновления количества рефералов
+def update_referrals_count(conn, user_id):
+    conn.execute("UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = ?", (user_id,))
+    logging.info(f"Количество рефералов обновлено для пользователя {user_id}")
+
+# Функция обновления скидки реферера. Возвращает (количество рефералов, скидка).
+def update_discount(conn, user_id) -> Optional[Tuple[int, float]]:
+    row = conn.execute("SELECT referrals_count FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        logging.warning(f"Реферер {user_id} не найден в базе данных.")
+        return None
+    discount = min(row[0] * 2, 50)  # 2% за каждого реферала, максимум 50%
+    conn.execute("UPDATE users SET discount = ? WHERE user_id = ?", (discount, user_id))
+    logging.info(f"Скидка обновлена для пользователя {user_id}: {discount}%")
+    return row[0], discount
+
+# Функция для получения профиля пользователя
+def get_profile(conn, user_id) -> Optional[Profile]:
+    row = conn.execute(
+        "SELECT referrals_count, discount, coins, level FROM users WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if not row:
+        return None
+    referrals_count, discount, coins, level = row
+    return Profile(referrals_count, discount, coins, get_reward_counts(conn, user_id), level)
+
+# Функция для получения уровня пользователя
+def get_level(conn, user_id) -> Optional[int]:
+    row = conn.execute("SELECT level FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+# Функция для получения баланса монет пользователя
+def get_user_coins(conn, user_id) -> int:
+    row = conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+# Функция для добавления награды пользователю
+def add_reward(conn, user_id, reward):
+    conn.execute("INSERT INTO user_rewards (user_id, reward) VALUES (?, ?)", (user_id, reward))
+
+# Купленные подарки с количеством, в порядке первой покупки
+def get_reward_counts(conn, user_id) -> List[Tuple[str, int]]:
+    return conn.execute(
+        "SELECT reward, COUNT(*) FROM user_rewards WHERE user_id = ? GROUP BY reward ORDER BY MIN(id)",
+        (user_id,)
+    ).fetchall()
+
+# Функция добавления монет пользователю. Возвращает новый баланс.
+def add_coins(conn, user_id, coins_to_add, reason="bonus") -> Optional[int]:
+    return apply_coins(conn, user_id, coins_to_add, reason)
+
+# Функция списания монет (баланс не уходит в минус). Возвращает новый баланс.
+def remove_coins(conn, user_id, coins_to_remove, reason="admin_remove") -> Optional[int]:
+    return apply_coins(conn, user_id, -coins_to_remove, reason, clamp=True)
+
+# Покупка подарка за монеты. Возвращает (баланс, подарки) или None, если монет не хватает.
+def buy_gift(conn, user_id, gift_name, gift_cost) -> Optional[Tuple[int, List[Tuple[str, int]]]]:
+    new_coins = apply_coins(conn, user_id, -gift_cost, f"gift:{gift_name}", require_funds=True)
+    if new_coins is None:
+        return None
+    add_reward(conn, user_id, gift_name)
+    return new_coins, get_reward_counts(conn, user_id)
+
+# Покупка скидки за монеты. Возвращает (баланс, скидка) или None, если монет не хватает.
+def buy_discount(conn, user_id, discount_percent, discount_cost) -> Optional[Tuple[int, float]]:
+    new_coins = apply_coins(conn, user_id, -discount_cost, f"discount:{discount_percent}", require_funds=True)
+    if new_coins is None:
+        return None
+    new_discount = conn.execute(
+        "UPDATE users SET discount = discount + ? WHERE user_id = ? RETURNING discount",
+        (discount_percent, user_id)
+    ).fetchall()[0][0]
+    return new_coins, new_discount
+
+# Функция обновления уровня пользователя. Возвращает True, если уровень повышен.
+def update_user_level(conn, user_id) -> bool:
+    row = conn.execute("SELECT level FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        return False
+    current_level = row[0]
+
+    # Проверяем, совершал ли пользователь покупку или его реферал
+    purchase_count = conn.execute(
+        "SELECT COUNT(*) FROM purchases WHERE user_id = ? OR referrer_id = ?", (user_id, user_id)
+    ).fetchone()[0]
+
+    # Если есть покупки, повышаем уровень до 2
+    if purchase_count > 0 and current_level < 2:
+        conn.execute("UPDATE users SET level = 2 WHERE user_id = ?", (user_id,))
+        return True
+    return False
+
+# Запись покупки в таблицу purchases и в агрегаты продаж. Возвращает True, если уровень повышен.
+def register_purchase(conn, user_id, referrer_id, amount) -> bool:
+    day = conn.execute(
+        "INSERT INTO purchases (user_id, referrer_id, amount) VALUES (?, ?, ?) RETURNING date(timestamp)",
+        (user_id, referrer_id, amount)
+    ).fetchall()[0][0]
+    record_sale(conn, day, None, referrer_id, amount)
+    return update_user_level(conn, user_id)
+
+# Запись продажи товара каталога в product_sales и в агрегаты продаж (на уровень не влияет)
+def record_product_sale(conn, user_id, referrer_id, product, amount):
+    day = conn.execute(
+        "INSERT INTO product_sales (user_id, referrer_id, product, amount) VALUES (?, ?, ?, ?) "
+        "RETURNING date(timestamp)",
+        (user_id, referrer_id, product, amount)
+    ).fetchall()[0][0]
+    record_sale(conn, day, product, referrer_id, amount)
+
+# Поиск пользователя по username
+def get_user_by_username(conn, username) -> Optional[UserRecord]:
+    row = conn.execute(
+        "SELECT user_id, username, referrer_id, referrals_count, coins FROM users WHERE username = ?",
+        (username,)
+    ).fetchone()
+    return UserRecord(*row, get_reward_counts(conn, row[0])) if row else None
+
+# Поиск пользователя по user_id
+def get_user_by_id(conn, user_id) -> Optional[UserRecord]:
+    row = conn.execute(
+        "SELECT user_id, username, referrer_id, referrals_count, coins FROM users WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()
+    return UserRecord(*row, get_reward_counts(conn, user_id)) if row else None
+
+# Список username рефералов пользователя
+def get_referrals(conn, user_id) -> List[Optional[str]]:
+    return [row[0] for row in conn.execute("SELECT username FROM users WHERE referrer_id = ?", (user_id,))]
+
+# Удаление пользователя. Возвращает False, если пользователя нет.
+def delete_user(conn, user_id) -> bool:
+    if conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,)).rowcount == 0:
+        return False
+    unlink_user(conn, user_id)
+    return True
+
+# Список всех пользователей для /list_users
+def list_users(conn) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    return conn.execute("SELECT user_id, username, first_name FROM users").fetchall()
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+# Асинхронный слой доступа к данным.
+# Соединение-писатель принадлежит отдельному потоку, поэтому запросы и commit
+# не блокируют event loop и обработку апдейтов других пользователей.
+# Записи всех обработчиков собираются в пачки (batch_size операций или
+# batch_delay секунд) и фиксируются одним commit; каждая операция выполняется
+# в своём SAVEPOINT, а её future разрешается только после commit пачки.
+# В режиме WAL чтения идут через небольшой пул потоков со своими
+# соединениями и не ждут, пока писатель закончит транзакцию.
+class Database:
+    def __init__(self, path: str = "users.db", profile: Optional[Dict[str, str]] = None, readers: int = 2,
+                 batch_size: int = 50, batch_delay: float = 0.02, cache: Optional[TTLCache] = None,
+                 metrics=None):
+        self.path = path
+        self.profile = profile if profile is not None else load_profile()
+        self.readers = readers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        # Кэш профилей по user_id; мутации ниже обновляют его после commit
+        self.cache = cache if cache is not None else TTLCache()
+        self.writes = 0
+        self.commits = 0
+        # metrics.Metrics: время каждой функции запроса и каждого commit
+        self.metrics = metrics
+        self._jobs: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._reader_pool: Optional[ThreadPoolExecutor] = None
+        self._reader_local = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        # День (UTC), на который уже сдвинуты окна продаж рефереров
+        self._windows_day: Optional[str] = None
+
+    async def start(self):
+        if self._thread is not None:
+            return
+        # Миграции управляют транзакциями сами, поэтому идут до запуска очереди записи
+        await asyncio.get_running_loop().run_in_executor(None, self._migrate)
+        self._thread = threading.Thread(target=self._worker, name="db-worker", daemon=True)
+        self._thread.start()
+        journal_mode = await self._submit(lambda conn: conn.execute("PRAGMA journal_mode").fetchone()[0], (), False)
+        # Без WAL отдельные читатели блокировались бы писателем, читаем через поток писателя
+        if self.readers > 0 and journal_mode.lower() == "wal":
+            self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        await self.read(audit_query_plans)
+
+    async def close(self):
+        if self._thread is None:
+            return
+        if self._reader_pool is not None:
+            self._reader_pool.shutdown(wait=True)
+            self._reader_pool = None
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+        self._jobs.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    def _migrate(self):
+        conn = connect(self.path, self.profile)
+        try:
+            apply_migrations(conn)
+        finally:
+            conn.close()
+
+    def _worker(self):
+        conn = connect(self.path, self.profile)
+        try:
+            job = self._jobs.get()
+            while job is not None:
+                func, args, commit, future, loop = job
+                if commit:
+                    job = self._write_batch(conn, job)
+                    continue
+                try:
+                    result = self._call(func, conn, args, "read")
+                except BaseException as e:
+                    loop.call_soon_threadsafe(_resolve, future, None, e)
+                else:
+                    loop.call_soon_threadsafe(_resolve, future, result)
+                job = self._jobs.get()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.close()
+
+    # Выполняем пачку записей, начиная с job, и фиксируем её одним commit.
+    # Сначала без открытой транзакции набираем до batch_size записей или ждём
+    # batch_delay (чтения по пути выполняются сразу), и только потом берём
+    # блокировку записи: она держится, пока выполняется SQL пачки, а не всё окно
+    # ожидания, и не мешает другим процессам на том же файле (шарды, throttling, FSM).
+    # Возвращает следующую задачу из очереди (None — остановка).
+    def _write_batch(self, conn: sqlite3.Connection, job):
+        writes = []
+        stop = False
+        deadline = time.monotonic() + self.batch_delay
+        while True:
+            func, args, commit, future, loop = job
+            if commit:
+                writes.append(job)
+            else:
+                try:
+                    loop.call_soon_threadsafe(_resolve, future, self._call(func, conn, args, "read"))
+                except BaseException as e:
+                    loop.call_soon_threadsafe(_resolve, future, None, e)
+
+            job = None
+            timeout = deadline - time.monotonic()
+            if len(writes) >= self.batch_size or timeout <= 0:
+                break
+            try:
+                job = self._jobs.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                stop = True
+                break
+
+        done = []
+        try:
+            # IMMEDIATE: блокировку записи берём сразу, иначе при нескольких процессах
+            # повышение блокировки чтения до записи сразу падает с "database is locked"
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+        except BaseException as e:
+            logging.exception("Не удалось начать транзакцию для пачки записей")
+            for _, _, _, future, loop in writes:
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            writes = []
+        for func, args, _, future, loop in writes:
+            conn.execute("SAVEPOINT write_job")
+            try:
+                result = self._call(func, conn, args, "write")
+            except BaseException as e:
+                conn.execute("ROLLBACK TO write_job")
+                conn.execute("RELEASE write_job")
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            else:
+                conn.execute("RELEASE write_job")
+                done.append((future, loop, result))
+
+        if conn.in_transaction:
+            started = time.perf_counter()
+            try:
+                conn.commit()
+            except BaseException as e:
+                logging.exception("Не удалось зафиксировать пачку записей")
+                conn.rollback()
+                for future, loop, _ in done:
+                    loop.call_soon_threadsafe(_resolve, future, None, e)
+            else:
+                self.commits += 1
+                self.writes += len(done)
+                if self.metrics is not None:
+                    self.metrics.observe("db_commit_seconds", time.perf_counter() - started)
+                for future, loop, result in done:
+                    loop.call_soon_threadsafe(_resolve, future, result)
+
+        if stop:
+            return None
+        return job if job is not None else self._jobs.get()
+
+    # Вызов функции запроса с замером времени (метка query — имя функции)
+    def _call(self, func: Callable, conn: sqlite3.Connection, args: tuple, kind: str) -> Any:
+        if self.metrics is None:
+            return func(conn, *args)
+        started = time.perf_counter()
+        try:
+            return func(conn, *args)
+        finally:
+            self.metrics.observe("db_query_seconds", time.perf_counter() - started,
+                                 query=getattr(func, "__name__", "?"), kind=kind)
+
+    def _submit(self, func: Callable, args: tuple, commit: bool) -> asyncio.Future:
+        if self._thread is None:
+            raise RuntimeError("Database is not started")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put((func, args, commit, future, loop))
+        return future
+
+    def _run_read(self, func: Callable, args: tuple) -> Any:
+        conn = getattr(self._reader_local, "conn", None)
+        if conn is None:
+            conn = connect(self.path, self.profile, readonly=True)
+            self._reader_local.conn = conn
+            self._reader_conns.append(conn)
+        try:
+            return self._call(func, conn, args, "read")
+        finally:
+            # Не держим снимок WAL открытым между запросами
+            if conn.in_transaction:
+                conn.rollback()
+
+    # Выполнить функцию чтения в пуле читателей (или в потоке писателя без WAL)
+    async def read(self, func: Callable, *args) -> Any:
+        if self._reader_pool is None:
+            return await self._submit(func, args, False)
+        return await asyncio.get_running_loop().run_in_executor(self._reader_pool, self._run_read, func, args)
+
+    # Выполнить функцию записи в потоке базы данных одной транзакцией
+    async def write(self, func: Callable, *args) -> Any:
+        return await self._submit(func, args, True)
+
+    async def add_user(self, user_id: int, username: Optional[str], referrer_id: Optional[int] = None,
+                       first_name: Optional[str] = None) -> Optional[float]:
+        result = await self.write(add_user, user_id, username, referrer_id, first_name)
+        if result is None:
+            return None
+        referrals_count, discount = result
+        self.cache.update(referrer_id, lambda p: p._replace(referrals_count=referrals_count, discount=discount))
+        return discount
+
+    async def get_profile(self, user_id: int) -> Optional[Profile]:
+        profile = self.cache.get(user_id)
+        if profile is not None:
+            return profile
+        generation = self.cache.generation
+        profile = await self.read(get_profile, user_id)
+        if profile is not None:
+            self.cache.put(user_id, profile, generation)
+        return profile
+
+    async def get_level(self, user_id: int) -> Optional[int]:
+        profile = await self.get_profile(user_id)
+        return profile.level if profile else None
+
+    async def get_user_coins(self, user_id: int) -> int:
+        profile = await self.get_profile(user_id)
+        return profile.coins if profile else 0
+
+    def _set_coins(self, user_id: int, coins: Optional[int]):
+        if coins is not None:
+            self.cache.update(user_id, lambda p: p._replace(coins=coins))
+
+    async def add_coins(self, user_id: int, coins_to_add: int, reason: str = "bonus") -> Optional[int]:
+        coins = await self.write(add_coins, user_id, coins_to_add, reason)
+        self._set_coins(user_id, coins)
+        return coins
+
+    async def remove_coins(self, user_id: int, coins_to_remove: int, reason: str = "admin_remove") -> Optional[int]:
+        coins = await self.write(remove_coins, user_id, coins_to_remove, reason)
+        self._set_coins(user_id, coins)
+        return coins
+
+    async def add_reward(self, user_id: int, reward: str):
+        await self.write(add_reward, user_id, reward)
+        self.cache.invalidate(user_id)
+
+    async def buy_gift(self, user_id: int, gift_name: str, gift_cost: int) -> Optional[int]:
+        result = await self.write(buy_gift, user_id, gift_name, gift_cost)
+        if result is None:
+            return None
+        coins, rewards = result
+        self.cache.update(user_id, lambda p: p._replace(coins=coins, rewards=rewards))
+        return coins
+
+    async def buy_discount(self, user_id: int, discount_percent: int,
+                           discount_cost: int) -> Optional[Tuple[int, float]]:
+        result = await self.write(buy_discount, user_id, discount_percent, discount_cost)
+        if result is not None:
+            coins, discount = result
+            self.cache.update(user_id, lambda p: p._replace(coins=coins, discount=discount))
+        return result
+
+    async def update_user_level(self, user_id: int) -> bool:
+        upgraded = await self.write(update_user_level, user_id)
+        if upgraded:
+            self.cache.update(user_id, lambda p: p._replace(level=2))
+        return upgraded
+
+    async def register_purchase(self, user_id: int, referrer_id: Optional[int], amount: int) -> bool:
+        upgraded = await self.write(register_purchase, user_id, referrer_id, amount)
+        if upgraded:
+            self.cache.update(user_id, lambda p: p._replace(level=2))
+        return upgraded
+
+    async def record_product_sale(self, user_id: int, referrer_id: Optional[int], product: str, amount: int):
+        await self.write(record_product_sale, user_id, referrer_id, product, amount)
+
+    async def get_sales(self, days: int) -> Sales:
+        return await self.read(get_sales, days)
+
+    async def get_product_sales(self, days: int) -> List[Tuple[str, Sales]]:
+        return await self.read(get_product_sales, days)
+
+    async def get_top_referrers_by_revenue(self, days: Optional[int], limit: int) -> List[ReferrerSales]:
+        # Окна сдвигаются и при записи покупки; здесь — если покупок с начала дня (UTC) ещё не было
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        if days is not None and self._windows_day != today:
+            await self.write(expire_windows)
+            self._windows_day = today
+        return await self.read(get_top_referrers_by_revenue, days, limit)
+
+    async def rebuild_rollups(self) -> int:
+        return await self.write(rebuild_rollups)
+
+    async def get_user_by_username(self, username: str) -> Optional[UserRecord]:
+        return await self.read(get_user_by_username, username)
+
+    async def get_user_by_id(self, user_id: int) -> Optional[UserRecord]:
+        return await self.read(get_user_by_id, user_id)
+
+    async def get_referrals(self, user_id: int) -> List[Optional[str]]:
+        return await self.read(get_referrals, user_id)
+
+    async def get_network(self, user_id: int) -> List[Tuple[int, int]]:
+        return await self.read(get_network, user_id)
+
+    async def get_transactions(self, user_id: int, limit: int = 20) -> List[tuple]:
+        return await self.read(get_transactions, user_id, limit)
+
+    async def get_tree(self, user_id: int, depth: int) -> List[TreeNode]:
+        return await self.read(get_tree, user_id, depth)
+
+    async def get_top_referrers(self, limit: int) -> List[Referrer]:
+        return await self.read(get_top_referrers, limit)
+
+    async def delete_user(self, user_id: int) -> bool:
+        deleted = await self.write(delete_user, user_id)
+        self.cache.invalidate(user_id)
+        return deleted
+
+    async def list_users(self) -> List[Tuple[int, Optional[str], Optional[str]]]:
+        return await self.read(list_users)
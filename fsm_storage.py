@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State  # type: ignore
+from aiogram.fsm.storage.base import BaseStorage, StorageKey  # type: ignore
+from aiogram.fsm.storage.memory import MemoryStorage  # type: ignore
+
+from migrations import apply_migrations
+
+
+def storage_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.destiny}"
+
+
+# FSM-хранилище в SQLite: состояние переживает перезапуск и доступно всем
+# процессам бота, работающим с одним файлом базы. Как и SQLiteBackend для
+# throttling, работает в отдельном потоке со своим соединением.
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+            # Таблица fsm_storage создаётся миграцией; на базе бота это одно чтение PRAGMA
+            apply_migrations(self._conn)
+        return self._conn
+
+    def _set_state(self, key: str, state: Optional[str]):
+        self._connection().execute(
+            "INSERT INTO fsm_storage (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (key, state)
+        )
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT state FROM fsm_storage WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_data(self, key: str, data: str):
+        self._connection().execute(
+            "INSERT INTO fsm_storage (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (key, data)
+        )
+
+    def _get_data(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT data FROM fsm_storage WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    async def _call(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def set_state(self, bot, key: StorageKey, state=None) -> None:
+        await self._call(self._set_state, storage_key(key), state.state if isinstance(state, State) else state)
+
+    async def get_state(self, bot, key: StorageKey) -> Optional[str]:
+        return await self._call(self._get_state, storage_key(key))
+
+    async def set_data(self, bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._call(self._set_data, storage_key(key), json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, bot, key: StorageKey) -> Dict[str, Any]:
+        data = await self._call(self._get_data, storage_key(key))
+        return json.loads(data) if data else {}
+
+    async def close(self) -> None:
+        def close_connection():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._call(close_connection)
+        self._executor.shutdown(wait=True)
+
+
+# Хранилище по имени: memory, sqlite (path) или redis (url, нужен пакет redis)
+def create_storage(kind: str, path: str, redis_url: Optional[str] = None) -> BaseStorage:
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(path)
+    if kind == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage  # type: ignore
+        return RedisStorage.from_url(redis_url or "redis://localhost:6379/0")
+    raise ValueError(f"Неизвестное FSM-хранилище: {kind}")
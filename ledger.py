@@ -0,0 +1,45 @@
+import sqlite3
+from typing import List, Optional
+
+
+# Изменение баланса одной операцией UPDATE ... RETURNING и запись в журнал.
+# require_funds: списание только при достаточном балансе, иначе None.
+# Возвращает новый баланс или None, если пользователя нет / не хватает монет.
+def apply_coins(conn: sqlite3.Connection, user_id: int, delta: int, reason: str,
+                clamp: bool = False, require_funds: bool = False) -> Optional[int]:
+    if clamp:
+        # Фактическое списание зависит от текущего баланса, поэтому читаем его
+        # в той же транзакции писателя, чтобы в журнал попала реальная сумма
+        row = conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if not row:
+            return None
+        delta = max(delta, -row[0])
+        rows = conn.execute(
+            "UPDATE users SET coins = coins + ? WHERE user_id = ? RETURNING coins", (delta, user_id)
+        ).fetchall()
+    elif require_funds:
+        rows = conn.execute(
+            "UPDATE users SET coins = coins + ? WHERE user_id = ? AND coins >= ? RETURNING coins",
+            (delta, user_id, -delta)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "UPDATE users SET coins = coins + ? WHERE user_id = ? RETURNING coins", (delta, user_id)
+        ).fetchall()
+    if not rows:
+        return None
+
+    balance = rows[0][0]
+    conn.execute(
+        "INSERT INTO coin_transactions (user_id, delta, balance, reason) VALUES (?, ?, ?, ?)",
+        (user_id, delta, balance, reason)
+    )
+    return balance
+
+
+# История операций пользователя, новые сверху
+def get_transactions(conn: sqlite3.Connection, user_id: int, limit: int = 20) -> List[tuple]:
+    return conn.execute(
+        "SELECT delta, balance, reason, created_at FROM coin_transactions WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+        (user_id, limit)
+    ).fetchall()
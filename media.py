@@ -0,0 +1,89 @@
+import logging
+from typing import Dict, Iterable, Optional
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest  # type: ignore
+
+
+def load_media(conn) -> Dict[str, str]:
+    return dict(conn.execute("SELECT url, file_id FROM media_cache").fetchall())
+
+
+def save_media(conn, url, file_id):
+    conn.execute(
+        "INSERT OR REPLACE INTO media_cache (url, file_id, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        (url, file_id)
+    )
+
+
+def delete_media(conn, url):
+    conn.execute("DELETE FROM media_cache WHERE url = ?", (url,))
+
+
+# Ошибка Telegram из-за самого file_id (удалён, устарел, от другого бота)
+def is_file_id_error(error: TelegramBadRequest) -> bool:
+    return "file" in str(error).lower()
+
+
+# Кэш file_id для картинок, которые бот отправляет по URL.
+# После первой отправки Telegram возвращает file_id загруженного файла: дальше
+# картинка отправляется по нему, без повторного скачивания с внешнего сайта.
+# file_id хранятся в таблице media_cache; если Telegram отверг сохранённый
+# file_id, он удаляется и картинка снова отправляется по URL.
+class MediaCache:
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+        self.hits = 0
+        self.misses = 0
+        self._file_ids: Dict[str, str] = {}
+
+    async def load(self):
+        self._file_ids = await self.db.read(load_media)
+
+    async def send_photo(self, chat_id: int, url: str, **kwargs):
+        file_id = self._file_ids.get(url)
+        if file_id is not None:
+            try:
+                message = await self.bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+                self.hits += 1
+                return message
+            except TelegramBadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logging.warning(f"Сохранённый file_id для {url} недействителен, отправляем по URL: {e}")
+                self._file_ids.pop(url, None)
+                await self.db.write(delete_media, url)
+
+        self.misses += 1
+        message = await self.bot.send_photo(chat_id=chat_id, photo=url, **kwargs)
+        await self._remember(url, message)
+        return message
+
+    # Загрузить картинки, для которых ещё нет file_id, отправив их в служебный чат
+    # (например, чат админа); сообщения сразу удаляются.
+    async def preload(self, urls: Iterable[str], chat_id: Optional[int]):
+        missing = [url for url in urls if url not in self._file_ids]
+        if not missing or chat_id is None:
+            return
+        loaded = 0
+        for url in missing:
+            try:
+                message = await self.bot.send_photo(chat_id=chat_id, photo=url, disable_notification=True)
+            except TelegramAPIError as e:
+                logging.warning(f"Не удалось предзагрузить {url}: {e}")
+                continue
+            await self._remember(url, message)
+            loaded += 1
+            try:
+                await self.bot.delete_message(chat_id, message.message_id)
+            except TelegramAPIError:
+                pass
+        logging.info(f"Предзагружено картинок: {loaded} из {len(missing)}")
+
+    async def _remember(self, url: str, message):
+        if not getattr(message, "photo", None):
+            return
+        # Самый большой размер — последний в списке
+        file_id = message.photo[-1].file_id
+        self._file_ids[url] = file_id
+        await self.db.write(save_media, url, file_id)
@@ -0,0 +1,49 @@
+from typing import List
+
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup  # type: ignore
+
+# Клавиатуры меню собираются один раз при импорте и переиспользуются во всех ответах:
+# объекты не изменяются после создания, поэтому их можно отдавать в reply_markup как есть.
+
+
+def keyboard(rows: List[List[str]]) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
+        resize_keyboard=True,  # Уменьшает размер кнопок для компактного отображения
+    )
+
+
+# Главное меню (Reply-кнопки)
+MAIN_MENU = keyboard([
+    ["👤 My Profile", "🛒 Catalog"],
+    ["🎁 Gift Shop", "🎁 Referral System"],
+    ["ℹ️ About Us", "💬 Help & Support"],
+    ["❓ About Levels"],
+])
+
+# Категории магазина ("🛒 Catalog")
+CATALOG_MENU = keyboard([
+    ["🎧 Spotify Premium", "🔴 YouTube Premium"],
+    ["🟣 Twitch Subscription", "💎 Discord Nitro"],
+    ["⭐ Telegram Stars", "Turkish Bankcards 🇹🇷"],
+    ["Back"],
+])
+
+# Турецкие карты
+TURKISH_BANKCARDS_MENU = keyboard([
+    ["Fups 🇹🇷", "Ozan 🇹🇷"],
+    ["Paycell 🇹🇷", "Other Stuff 🇹🇷"],
+    ["📖 Must Read", "Back"],
+])
+
+
+# Текст "👤 My Profile" для профиля из Database.get_profile
+def render_profile(profile, rewards_text: str) -> str:
+    return (
+        f"*👤 Your Profile*\n\n"
+        f"*👥 Referrals:* {profile.referrals_count}\n"
+        f"*💸 Discount:* {profile.discount:.2f}%\n"
+        f"*💰 Coins:* {profile.coins} 🏅\n"
+        f"*🏆 Level:* {profile.level} 💎\n\n"
+        f"*🎁 Presents bought:* {rewards_text}\n"
+    )
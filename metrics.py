@@ -0,0 +1,237 @@
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware  # type: ignore
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware  # type: ignore
+from aiohttp import web  # type: ignore
+
+# Границы корзин гистограмм в секундах: от 1 мс до 10 с
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Метка -> значение, отсортированные по имени метки
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Оценка квантиля сверху: граница корзины, в которую он попал
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+# Метрики процесса: гистограммы задержек, счётчики и значения, которые
+# снимаются в момент выгрузки (очереди, счётчики commit и т.п.).
+# Запись идёт и из event loop, и из потоков базы данных, поэтому под блокировкой.
+class Metrics:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    # Значение, которое читается при каждой выгрузке (имя с _total выгружается как counter)
+    def gauge(self, name: str, func: Callable[[], float]):
+        self._gauges[name] = func
+
+    # Копия гистограмм: [(метки, count, sum, p50, p99)] по имени метрики
+    def histograms(self, name: str) -> List[Tuple[Labels, int, float, float, float]]:
+        with self._lock:
+            return [(labels, h.count, h.sum, h.quantile(0.5), h.quantile(0.99))
+                    for labels, h in self._histograms.get(name, {}).items()]
+
+    def counters(self, name: str) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    def gauges(self) -> Dict[str, float]:
+        values = {}
+        for name, func in self._gauges.items():
+            try:
+                values[name] = float(func())
+            except Exception as e:
+                logging.warning(f"Метрика {name} не получена: {e}")
+        return values
+
+    # Текстовый формат Prometheus
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), h.counts):
+                        cumulative += count
+                        le = 'le="' + _format_bound(bound) + '"'
+                        lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {h.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Имя обработчика, выбранного для события (в data inner middleware).
+# Кнопки и команды TextRouter вызываются через общий dispatch — берём сам обработчик.
+def handler_name(data: Dict[str, Any]) -> str:
+    callback = data.get("text_handler") or data["handler"].callback
+    return getattr(callback, "__name__", type(callback).__name__)
+
+
+# Время работы обработчиков сообщений и callback-запросов (inner middleware:
+# вызывается после фильтров, когда обработчик уже выбран)
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = handler_name(data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.metrics.inc("handler_errors_total", handler=name, error=type(e).__name__)
+            raise
+        finally:
+            self.metrics.observe("handler_seconds", time.perf_counter() - started, handler=name)
+
+
+# Вызовы Bot API: время ответа, ошибки и число запросов в полёте
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.in_flight = 0
+        metrics.gauge("telegram_api_in_flight", lambda: self.in_flight)
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.metrics.inc("telegram_api_errors_total", method=name, error=type(e).__name__)
+            raise
+        finally:
+            self.in_flight -= 1
+            self.metrics.observe("telegram_api_seconds", time.perf_counter() - started, method=name)
+
+
+# Сводка для админской команды /stats: самые затратные по суммарному времени серии
+def render_stats(metrics: Metrics, limit: int = 5) -> str:
+    sections = [
+        ("Обработчики", "handler_seconds", "handler"),
+        ("Запросы к базе", "db_query_seconds", "query"),
+        ("Bot API", "telegram_api_seconds", "method"),
+    ]
+    lines = ["📊 Статистика процесса", ""]
+    for title, name, label in sections:
+        series = sorted(metrics.histograms(name), key=lambda item: item[2], reverse=True)
+        lines.append(f"{title}:")
+        if not series:
+            lines.append("  нет данных")
+        for labels, count, total, p50, p99 in series[:limit]:
+            lines.append(
+                f"  {dict(labels).get(label, '?')}: {count} шт., "
+                f"сред. {total / count * 1000:.1f} мс, p50 ≤{p50 * 1000:g} мс, p99 ≤{p99 * 1000:g} мс"
+            )
+        lines.append("")
+
+    commits = metrics.histograms("db_commit_seconds")
+    if commits:
+        count = sum(item[1] for item in commits)
+        total = sum(item[2] for item in commits)
+        lines.append(f"Commit: {count} шт., сред. {total / count * 1000:.1f} мс")
+    errors = {**metrics.counters("handler_errors_total"), **metrics.counters("telegram_api_errors_total")}
+    if errors:
+        lines.append("Ошибки: " + ", ".join(
+            f"{'/'.join(value for _, value in labels)} ×{int(count)}" for labels, count in errors.items()
+        ))
+    for gauge, value in metrics.gauges().items():
+        lines.append(f"{gauge}: {value:g}")
+    return "\n".join(lines)
+
+
+# Локальный HTTP-сервер с GET /metrics для Prometheus
+class MetricsServer:
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9100):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
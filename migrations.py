@@ -0,0 +1,365 @@
+import logging
+import sqlite3
+
+
+# Колонки, которые раньше добавлялись в users через ALTER TABLE при каждом запуске
+LEGACY_USER_COLUMNS = [
+    ("coins", "INTEGER DEFAULT 0"),
+    ("rewards", "TEXT DEFAULT ''"),
+    ("level", "INTEGER DEFAULT 1"),
+    ("first_name", "TEXT"),
+]
+
+
+# Миграция 1: базовая схема и вторичные индексы для поиска по username и рефералам.
+# Все операторы идемпотентны: на старых базах таблицы уже созданы прежним кодом.
+def _baseline(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            referrer_id INTEGER,
+            referrals_count INTEGER DEFAULT 0,
+            discount REAL DEFAULT 0.0,
+            coins INTEGER DEFAULT 0,
+            rewards TEXT DEFAULT '',
+            level INTEGER DEFAULT 1,
+            first_name TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            referrer_id INTEGER,
+            amount INTEGER,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_referrer_id ON users(referrer_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_purchases_user_id ON purchases(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_purchases_referrer_id ON purchases(referrer_id)")
+
+
+# Миграция 2: добавляем каждую недостающую колонку users по отдельности.
+# Старый код падал на первом ALTER и молча пропускал остальные.
+def _legacy_user_columns(conn: sqlite3.Connection):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    for name, definition in LEGACY_USER_COLUMNS:
+        if name not in existing:
+            logging.info(f"Добавляем колонку users.{name}")
+            conn.execute(f"ALTER TABLE users ADD COLUMN {name} {definition}")
+
+
+# Миграция 3: журнал операций с монетами (только добавление записей)
+def _coin_ledger(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS coin_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            balance INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_coin_transactions_user_id ON coin_transactions(user_id, id)")
+
+
+# Миграция 4: награды в отдельной таблице вместо строки "A, B, " в users.rewards.
+# Старые строки переносим один раз; колонку users.rewards больше не читаем.
+def _user_rewards(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_rewards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            reward TEXT NOT NULL,
+            purchased_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_rewards_user_id ON user_rewards(user_id, reward)")
+
+    rows = conn.execute("SELECT user_id, rewards FROM users WHERE rewards IS NOT NULL AND rewards != ''").fetchall()
+    conn.executemany(
+        "INSERT INTO user_rewards (user_id, reward, purchased_at) VALUES (?, ?, NULL)",
+        (
+            (user_id, reward.strip())
+            for user_id, rewards in rows
+            for reward in rewards.split(", ")
+            if reward.strip()
+        )
+    )
+
+
+# Миграция 5: отметка времени обновления профиля из Telegram и состояние фоновых задач
+def _refresh_jobs(conn: sqlite3.Connection):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    if "last_refreshed" not in existing:
+        conn.execute("ALTER TABLE users ADD COLUMN last_refreshed INTEGER")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            name TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            cursor INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            chat_id INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Миграция 6: рассылки — постоянная очередь исходящих сообщений и отметка заблокировавших бота
+def _broadcasts(conn: sqlite3.Connection):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    if "blocked_at" not in existing:
+        conn.execute("ALTER TABLE users ADD COLUMN blocked_at INTEGER")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            state TEXT NOT NULL,
+            text TEXT,
+            from_chat_id INTEGER,
+            message_id INTEGER,
+            chat_id INTEGER,
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_queue (
+            broadcast_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (broadcast_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_queue_state ON broadcast_queue(broadcast_id, state)")
+
+
+# Миграция 7: кэш file_id отправленных картинок
+def _media_cache(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS media_cache (
+            url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """)
+
+
+# Миграция 8: closure table дерева рефералов (см. referrals.py) и индекс для лидеров.
+# Пути для уже зарегистрированных пользователей строим из users.referrer_id;
+# глубина ограничена на случай циклов в старых данных.
+def _referral_paths(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS referral_paths (
+            ancestor_id INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            descendant_id INTEGER NOT NULL,
+            PRIMARY KEY (ancestor_id, depth, descendant_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_referral_paths_descendant ON referral_paths(descendant_id)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_referrals_count
+        ON users(referrals_count DESC, user_id) WHERE referrals_count > 0
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO referral_paths (ancestor_id, depth, descendant_id)
+        WITH RECURSIVE paths(ancestor_id, depth, descendant_id) AS (
+            SELECT referrer_id, 1, user_id FROM users
+            WHERE referrer_id IS NOT NULL AND referrer_id != user_id
+            UNION
+            SELECT u.referrer_id, p.depth + 1, p.descendant_id
+            FROM paths p JOIN users u ON u.user_id = p.ancestor_id
+            WHERE u.referrer_id IS NOT NULL AND u.referrer_id != p.descendant_id AND p.depth < 64
+        )
+        SELECT ancestor_id, MIN(depth), descendant_id FROM paths GROUP BY ancestor_id, descendant_id
+    """)
+
+
+# Миграция 9: продажи товаров каталога и агрегаты продаж (см. analytics.py),
+# заполненные по уже записанным покупкам. Продажи товаров лежат отдельно от purchases:
+# purchases определяет уровень пользователя, а продажи товаров на него не влияют.
+def _sales_rollups(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            referrer_id INTEGER,
+            product TEXT NOT NULL,
+            amount INTEGER,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            day TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            revenue INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_by_product (
+            day TEXT NOT NULL,
+            product TEXT NOT NULL,
+            orders INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (day, product)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_by_referrer (
+            day TEXT NOT NULL,
+            referrer_id INTEGER NOT NULL,
+            orders INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (day, referrer_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_referrers (
+            referrer_id INTEGER PRIMARY KEY,
+            orders INTEGER NOT NULL,
+            revenue INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_referrers_revenue ON sales_referrers(revenue DESC)")
+
+    purchases = "FROM purchases WHERE timestamp IS NOT NULL"
+    conn.execute(f"""
+        INSERT INTO sales_daily (day, orders, revenue)
+        SELECT date(timestamp), COUNT(*), COALESCE(SUM(amount), 0) {purchases} GROUP BY 1
+    """)
+    conn.execute(f"""
+        INSERT INTO sales_by_product (day, product, orders, revenue)
+        SELECT date(timestamp), '', COUNT(*), COALESCE(SUM(amount), 0) {purchases} GROUP BY 1
+    """)
+    conn.execute(f"""
+        INSERT INTO sales_by_referrer (day, referrer_id, orders, revenue)
+        SELECT date(timestamp), referrer_id, COUNT(*), COALESCE(SUM(amount), 0) {purchases} AND referrer_id
+        GROUP BY 1, 2
+    """)
+    conn.execute(f"""
+        INSERT INTO sales_referrers (referrer_id, orders, revenue)
+        SELECT referrer_id, COUNT(*), COALESCE(SUM(amount), 0) {purchases} AND referrer_id GROUP BY 1
+    """)
+
+
+# Миграция 10: итоги рефереров за скользящие окна отчётов /sales top (см. analytics.py),
+# заполненные по уже накопленным агрегатам по дням
+def _sales_windows(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_windows (
+            period INTEGER PRIMARY KEY,
+            expired_through TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_referrers_window (
+            period INTEGER NOT NULL,
+            referrer_id INTEGER NOT NULL,
+            orders INTEGER NOT NULL,
+            revenue INTEGER NOT NULL,
+            PRIMARY KEY (period, referrer_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sales_referrers_window_revenue
+        ON sales_referrers_window(period, revenue DESC)
+    """)
+    for period in (1, 7, 30):
+        conn.execute(
+            "INSERT INTO sales_windows (period, expired_through) VALUES (?, date('now', ?))",
+            (period, f"-{period} days")
+        )
+        conn.execute(
+            "INSERT INTO sales_referrers_window (period, referrer_id, orders, revenue) "
+            "SELECT ?, referrer_id, SUM(orders), SUM(revenue) FROM sales_by_referrer "
+            "WHERE day > date('now', ?) GROUP BY referrer_id",
+            (period, f"-{period} days")
+        )
+
+
+# Миграция 11: состояние throttling (throttling.SQLiteBackend) и FSM-хранилище
+# (fsm_storage.SQLiteStorage). Раньше эти таблицы создавались при первом подключении.
+def _state_tables(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS throttle_state (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL,
+            warned INTEGER NOT NULL,
+            expires REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_throttle_state_expires ON throttle_state(expires)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT
+        ) WITHOUT ROWID
+    """)
+
+
+# Список миграций: (версия, описание, функция). Версии только растут,
+# уже выпущенные миграции не меняются — для изменений добавляется новая.
+MIGRATIONS = [
+    (1, "baseline schema and secondary indexes", _baseline),
+    (2, "add missing legacy users columns", _legacy_user_columns),
+    (3, "coin transactions ledger", _coin_ledger),
+    (4, "normalized user rewards", _user_rewards),
+    (5, "profile refresh timestamps and job state", _refresh_jobs),
+    (6, "broadcast queue and blocked users", _broadcasts),
+    (7, "media file_id cache", _media_cache),
+    (8, "referral closure table and leaderboard index", _referral_paths),
+    (9, "product sales and sales rollups", _sales_rollups),
+    (10, "rolling referrer sales windows", _sales_windows),
+    (11, "throttle state and FSM storage tables", _state_tables),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Применяем миграции, версия которых больше PRAGMA user_version.
+# Каждая миграция и запись новой версии выполняются в одной транзакции,
+# поэтому при ошибке база остаётся на предыдущей версии.
+# На прогретой базе это единственное чтение PRAGMA.
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    current = get_version(conn)
+    if current >= LATEST_VERSION:
+        if current > LATEST_VERSION:
+            logging.warning(f"Версия схемы {current} новее известной коду ({LATEST_VERSION})")
+        return current
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Применяем миграцию {version}: {description}")
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        # Другой процесс бота мог применить миграцию, пока мы ждали блокировку
+        if get_version(conn) >= version:
+            conn.rollback()
+            current = version
+            continue
+        try:
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        except Exception:
+            conn.rollback()
+            logging.exception(f"Миграция {version} не применена")
+            raise
+        conn.commit()
+        current = version
+    return current
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple
+
+from aiogram.exceptions import (  # type: ignore
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+
+# Уведомление в очереди: кому, текст, параметры send_message и время постановки
+class Notification(NamedTuple):
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any]
+    queued_at: float
+
+
+# Отправка уведомлений пользователям в фоне вместо asyncio.create_task:
+# ограниченная очередь (обработчик ждёт, если она заполнена), фиксированное
+# число воркеров, повторы с экспоненциальной задержкой и счётчики для /stats.
+# При остановке close() дожидается отправки оставшегося в очереди.
+class NotificationDispatcher:
+    def __init__(self, bot, concurrency: int = 10, max_queue: int = 10000, max_attempts: int = 3,
+                 backoff: float = 1.0):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    # Поставить уведомление в очередь. Если очередь заполнена, ждём свободного места.
+    async def send(self, chat_id: int, text: str, **kwargs):
+        if self._closing:
+            logging.warning(f"Уведомление пользователю {chat_id} не отправлено: бот останавливается")
+            return
+        await self._queue.put(Notification(chat_id, text, kwargs, time.monotonic()))
+
+    # Дождаться отправки очереди (не дольше timeout секунд) и остановить воркеров
+    async def close(self, timeout: float = 10.0):
+        self._closing = True
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Не отправлено уведомлений при остановке: {self._queue.qsize()}")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        delivered = self.sent + self.failed
+        return {
+            "queue_depth": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_avg": self.latency_total / delivered if delivered else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    async def _worker(self):
+        while True:
+            notification = await self._queue.get()
+            try:
+                delivered = await self._deliver(notification)
+            except Exception:
+                logging.exception(f"Ошибка отправки уведомления пользователю {notification.chat_id}")
+                delivered = False
+            latency = time.monotonic() - notification.queued_at
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if delivered:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._queue.task_done()
+
+    async def _deliver(self, notification: Notification) -> bool:
+        attempt = 0
+        while True:
+            try:
+                await self.bot.send_message(notification.chat_id, notification.text, **notification.kwargs)
+                return True
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                logging.warning(f"Уведомление пользователю {notification.chat_id} не доставлено: {e}")
+                return False
+            except TelegramAPIError as e:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    logging.warning(
+                        f"Уведомление пользователю {notification.chat_id} не доставлено после {attempt} попыток: {e}"
+                    )
+                    return False
+                self.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
@@ -0,0 +1,222 @@
+import hashlib
+import hmac
+import json
+import logging
+import re
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from aiogram import BaseMiddleware  # type: ignore
+from aiogram.types import Update  # type: ignore
+
+RECORD_VERSION = 2
+
+# Аргументы команд, которые сохраняются как есть: суммы и короткие числа
+_AMOUNT = re.compile(r"^\d{1,5}$")
+# Служебные слова в callback data ("users", "next"), которые сохраняются как есть
+_KEYWORD = re.compile(r"^[a-z_]{1,32}$")
+
+# Таблицы базы с ID пользователей: (таблица, колонки)
+ID_COLUMNS = [
+    ("users", ("user_id", "referrer_id")),
+    ("purchases", ("user_id", "referrer_id")),
+    ("product_sales", ("user_id", "referrer_id")),
+    ("coin_transactions", ("user_id",)),
+    ("user_rewards", ("user_id",)),
+    ("referral_paths", ("ancestor_id", "descendant_id")),
+    ("sales_by_referrer", ("referrer_id",)),
+    ("sales_referrers", ("referrer_id",)),
+    ("sales_referrers_window", ("referrer_id",)),
+]
+# Состояние, которое при прогоне не нужно и может содержать личные данные
+CLEARED_TABLES = ["jobs", "broadcasts", "broadcast_queue", "fsm_storage", "throttle_state"]
+
+
+# Обезличивание: ID и username заменяются HMAC с солью, которая в файл не пишется,
+# поэтому по записи нельзя восстановить пользователя, но один и тот же человек
+# получает один и тот же ID во всей записи (порядок и рефералы сохраняются).
+# С той же солью обезличивается копия базы для прогона (anonymize_database),
+# поэтому соль должна быть постоянной (RECORD_UPDATES_SALT).
+class Anonymizer:
+    def __init__(self, salt: bytes):
+        self.salt = salt
+
+    # Отпечаток соли для заголовка записи: по нему replay.py проверяет, что соль та же
+    @property
+    def key(self) -> str:
+        return self._digest("replay-key").hex()[:16]
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self.salt, value.encode(), hashlib.sha256).digest()
+
+    def user_id(self, user_id: int) -> int:
+        # В диапазоне ID Telegram (не больше 52 бит); диапазон широкий, чтобы у миллиона
+        # пользователей базы не было совпадений
+        return 1_000_000_000 + int.from_bytes(self._digest(str(user_id))[:7], "big") % (2 ** 52 - 1_000_000_000)
+
+    def username(self, username: Optional[str]) -> Optional[str]:
+        if not username:
+            return None
+        return "u" + self._digest(username.lower()).hex()[:12]
+
+    # Кнопки и известные слова остаются, у команд сохраняется имя, ID внутри
+    # аргументов обезличиваются так же, как ID пользователей, остальные слова —
+    # как username (/userstat john и /userstat @john указывают на одного человека).
+    # От свободного текста остаётся только длина.
+    def text(self, text: str, known: Callable[[str], bool]) -> str:
+        if known(text):
+            return text
+        if not text.startswith("/"):
+            return "?" * min(len(text), 64)
+        command, *args = text.split()
+        return " ".join([command] + [self._argument(arg, known) for arg in args])
+
+    def _argument(self, arg: str, known: Callable[[str], bool]) -> str:
+        if known(arg) or _AMOUNT.match(arg):
+            return arg
+        if arg.isdigit():
+            return str(self.user_id(int(arg)))
+        if arg.startswith("@"):
+            return "@" + self.username(arg[1:])
+        return self.username(arg)
+
+    # Callback data вида "users:next:1065778583": служебные слова и короткие числа
+    # остаются, длинные числа обезличиваются как ID, остальное — как username
+    def callback_data(self, data: Optional[str]) -> Optional[str]:
+        if data is None:
+            return None
+        parts = []
+        for part in data.split(":"):
+            if not part or _KEYWORD.match(part) or _AMOUNT.match(part):
+                parts.append(part)
+            elif part.isdigit():
+                parts.append(str(self.user_id(int(part))))
+            else:
+                parts.append(self.username(part))
+        return ":".join(parts)
+
+
+# Запись входящих обновлений в JSONL для benchmarks/replay.py (outer middleware на dp.update).
+# Первая строка каждого запуска — заголовок с обезличенным ID админа, дальше
+# по строке на сообщение или callback-запрос с временем от начала записи.
+# Сохраняются только поля, которые читают обработчики.
+class UpdateRecorder(BaseMiddleware):
+    def __init__(self, path: str, known: Callable[[str], bool], admin_id: int, salt: bytes):
+        self.path = path
+        self.known = known
+        self.admin_id = admin_id
+        self.anonymizer = Anonymizer(salt)
+        self.recorded = 0
+        self._file = None
+        self._started = 0.0
+
+    def start(self):
+        if self._file is not None:
+            return
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        self._started = time.monotonic()
+        self._write({"version": RECORD_VERSION, "admin": self.anonymizer.user_id(self.admin_id),
+                     "key": self.anonymizer.key, "started": int(time.time())})
+        logging.info(f"Входящие обновления записываются в {self.path}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record(self, update: Update) -> Optional[Dict[str, Any]]:
+        anonymizer = self.anonymizer
+        if update.message is not None and update.message.text is not None and update.message.from_user:
+            message = update.message
+            record = {"type": "message", "text": anonymizer.text(message.text, self.known)}
+        elif update.callback_query is not None and update.callback_query.message is not None:
+            message = update.callback_query.message
+            record = {"type": "callback_query", "data": anonymizer.callback_data(update.callback_query.data),
+                      "message_id": message.message_id}
+        else:
+            return None
+        user = update.message.from_user if update.message is not None else update.callback_query.from_user
+        record.update(
+            t=round(time.monotonic() - self._started, 3),
+            user=anonymizer.user_id(user.id),
+            username=anonymizer.username(user.username),
+            chat=anonymizer.user_id(message.chat.id),
+            chat_type=message.chat.type,
+        )
+        return record
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self._file is not None:
+            try:
+                record = self.record(event)
+                if record is not None:
+                    self._write(record)
+                    self.recorded += 1
+            except Exception:
+                logging.exception("Не удалось записать обновление")
+        return await handler(event, data)
+
+
+# Чтение записи: (заголовок запуска, запись) по порядку
+def read_records(path: str) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    header: Dict[str, Any] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "version" in record:
+                header = record
+                continue
+            yield header, record
+
+
+# Обезличить копию базы той же солью, что и запись: ID во всех таблицах,
+# username и имена пользователей; служебное состояние удаляется.
+# ID сначала заменяются отрицательными, чтобы новые значения первичных ключей
+# не совпали со старыми, ещё не заменёнными.
+def anonymize_database(conn: sqlite3.Connection, anonymizer: Anonymizer):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.create_function("anon_id", 1, lambda value: None if value is None else anonymizer.user_id(value),
+                         deterministic=True)
+    conn.create_function("anon_name", 1, anonymizer.username, deterministic=True)
+    with conn:
+        for table in CLEARED_TABLES:
+            if table in tables:
+                conn.execute(f"DELETE FROM {table}")
+        for table, columns in ID_COLUMNS:
+            if table not in tables:
+                continue
+            conn.execute(f"UPDATE {table} SET " + ", ".join(f"{c} = -anon_id({c})" for c in columns))
+            conn.execute(f"UPDATE {table} SET " + ", ".join(f"{c} = -{c}" for c in columns))
+        conn.execute("UPDATE users SET username = anon_name(username), first_name = anon_name(first_name)")
+
+
+# Обновление для dp.feed_update из записи
+def record_to_update(record: Dict[str, Any], update_id: int) -> Update:
+    user = {"id": record["user"], "is_bot": False, "first_name": "User", "username": record.get("username")}
+    chat = {"id": record["chat"], "type": record.get("chat_type", "private")}
+    if record["type"] == "callback_query":
+        return Update(update_id=update_id, callback_query={
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(record["chat"]),
+            "data": record.get("data"),
+            "message": {"message_id": record["message_id"], "date": int(time.time()), "chat": chat},
+        })
+    return Update(update_id=update_id, message={
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": chat,
+        "from": user,
+        "text": record["text"],
+    })
@@ -0,0 +1,133 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Дерево рефералов хранится как closure table referral_paths: строка
+# (ancestor_id, depth, descendant_id) на каждую пару "пригласивший на depth
+# уровней выше — приглашённый". Строки добавляются при регистрации пользователя,
+# поэтому размер сети и уровни читаются по первичному ключу, без обхода users.
+# Как и users.referrer_id, пути сохраняются и для реферера, которого ещё нет в базе.
+
+MAX_TREE_DEPTH = 10
+MAX_TREE_NODES = 50
+
+
+class Referrer(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    referrals_count: int
+    network: int  # приглашённые на всех уровнях
+
+
+class TreeNode(NamedTuple):
+    user_id: int
+    referrer_id: Optional[int]
+    username: Optional[str]
+    depth: int
+
+
+# Синхронные функции ниже выполняются в потоке базы данных (см. database.py)
+
+# Подключаем пользователя и уже известных его рефералов ко всем предкам реферера.
+# Если реферер сам в поддереве пользователя (или это он сам), связь создала бы
+# цикл, и пути не добавляются.
+def link_referral(conn, user_id, referrer_id):
+    if referrer_id is None or referrer_id == user_id:
+        return
+    if conn.execute(
+        "SELECT 1 FROM referral_paths WHERE ancestor_id = ? AND descendant_id = ?", (user_id, referrer_id)
+    ).fetchone():
+        return
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO referral_paths (ancestor_id, depth, descendant_id)
+        SELECT a.ancestor_id, a.depth + d.depth, d.descendant_id
+        FROM (SELECT ancestor_id, depth + 1 AS depth FROM referral_paths WHERE descendant_id = :referrer
+              UNION ALL SELECT :referrer, 1) AS a,
+             (SELECT descendant_id, depth FROM referral_paths WHERE ancestor_id = :user
+              UNION ALL SELECT :user, 0) AS d
+        """,
+        {"user": user_id, "referrer": referrer_id}
+    )
+
+
+# Удалённый пользователь пропадает из дерева. Его рефералы остаются в сетях
+# его предков — так же, как не уменьшается referrals_count реферера.
+def unlink_user(conn, user_id):
+    conn.execute("DELETE FROM referral_paths WHERE ancestor_id = ?", (user_id,))
+    conn.execute("DELETE FROM referral_paths WHERE descendant_id = ?", (user_id,))
+
+
+# Сколько приглашённых на каждом уровне: [(уровень, количество)]
+def get_network(conn, user_id) -> List[Tuple[int, int]]:
+    return conn.execute(
+        "SELECT depth, COUNT(*) FROM referral_paths WHERE ancestor_id = ? GROUP BY depth ORDER BY depth",
+        (user_id,)
+    ).fetchall()
+
+
+# Поддерево до depth уровней в порядке уровней, не больше limit узлов
+def get_tree(conn, user_id, depth, limit=MAX_TREE_NODES) -> List[TreeNode]:
+    rows = conn.execute(
+        """
+        SELECT p.descendant_id, u.referrer_id, u.username, p.depth
+        FROM referral_paths p JOIN users u ON u.user_id = p.descendant_id
+        WHERE p.ancestor_id = ? AND p.depth <= ?
+        ORDER BY p.depth
+        LIMIT ?
+        """,
+        (user_id, depth, limit)
+    ).fetchall()
+    return [TreeNode(*row) for row in rows]
+
+
+# Лидеры по числу прямых рефералов: идём по индексу referrals_count сверху,
+# размер сети каждого — отдельный поиск по closure table
+def get_top_referrers(conn, limit) -> List[Referrer]:
+    rows = conn.execute(
+        """
+        SELECT user_id, username, referrals_count FROM users
+        WHERE referrals_count > 0
+        ORDER BY referrals_count DESC, user_id
+        LIMIT ?
+        """,
+        (limit,)
+    ).fetchall()
+    return [
+        Referrer(user_id, username, count, conn.execute(
+            "SELECT COUNT(*) FROM referral_paths WHERE ancestor_id = ?", (user_id,)
+        ).fetchone()[0])
+        for user_id, username, count in rows
+    ]
+
+
+def _name(user_id: int, username: Optional[str]) -> str:
+    return f"@{username}" if username else str(user_id)
+
+
+# Строка для /userstat: "5 (L1: 3, L2: 2)"
+def format_network(levels: List[Tuple[int, int]]) -> str:
+    if not levels:
+        return "0"
+    total = sum(count for _, count in levels)
+    return f"{total} (" + ", ".join(f"L{depth}: {count}" for depth, count in levels) + ")"
+
+
+# Дерево с отступами по уровням; узлы, чей родитель не попал в выборку,
+# выводятся на своём уровне без родителя
+def render_tree(root_id: int, nodes: List[TreeNode], total: int) -> str:
+    children: Dict[Optional[int], List[TreeNode]] = {}
+    known = {node.user_id for node in nodes}
+    for node in nodes:
+        parent = node.referrer_id if node.referrer_id in known else root_id
+        children.setdefault(parent, []).append(node)
+
+    lines: List[str] = []
+
+    def walk(parent: int):
+        for node in children.get(parent, []):
+            lines.append(f"{'    ' * (node.depth - 1)}└ {_name(node.user_id, node.username)}")
+            walk(node.user_id)
+
+    walk(root_id)
+    if total > len(nodes):
+        lines.append(f"… ещё {total - len(nodes)}")
+    return "\n".join(lines) if lines else "No referrals yet."
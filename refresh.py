@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from aiogram.exceptions import (TelegramAPIError, TelegramBadRequest, TelegramForbiddenError,  # type: ignore
+                                TelegramNotFound, TelegramRetryAfter)
+
+JOB_NAME = "refresh_profiles"
+
+
+# Состояние задачи в таблице jobs: (state, cursor, processed, total, chat_id)
+def get_job(conn, name) -> Optional[Tuple[str, int, int, int, Optional[int]]]:
+    return conn.execute(
+        "SELECT state, cursor, processed, total, chat_id FROM jobs WHERE name = ?", (name,)
+    ).fetchone()
+
+
+def save_job(conn, name, state, cursor, processed, total, chat_id):
+    conn.execute(
+        "INSERT OR REPLACE INTO jobs (name, state, cursor, processed, total, chat_id, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        (name, state, cursor, processed, total, chat_id)
+    )
+
+
+# Сколько профилей устарело после cursor
+def count_stale(conn, cursor, stale_before) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM users WHERE user_id > ? AND (last_refreshed IS NULL OR last_refreshed < ?)",
+        (cursor, stale_before)
+    ).fetchone()[0]
+
+
+# Следующая страница устаревших профилей (keyset по user_id)
+def next_stale_page(conn, cursor, stale_before, limit) -> List[int]:
+    return [row[0] for row in conn.execute(
+        "SELECT user_id FROM users WHERE user_id > ? AND (last_refreshed IS NULL OR last_refreshed < ?) "
+        "ORDER BY user_id LIMIT ?",
+        (cursor, stale_before, limit)
+    )]
+
+
+# Сохраняем пачку профилей и продвигаем курсор задачи в одной транзакции.
+# Недоступные чаты (username и имя None) тоже отмечаем, чтобы не запрашивать
+# их снова до следующего устаревания. Профили, которые не удалось запросить
+# из-за сети или ошибки сервера, в rows не попадают и остаются устаревшими.
+def save_page(conn, rows, refreshed_at, cursor, processed, total, chat_id):
+    found = [row for row in rows if row[1] is not None or row[2] is not None]
+    missing = [row for row in rows if row[1] is None and row[2] is None]
+    conn.executemany(
+        "UPDATE users SET username = ?, first_name = ?, last_refreshed = ? WHERE user_id = ?",
+        [(username, first_name, refreshed_at, user_id) for user_id, username, first_name in found]
+    )
+    conn.executemany(
+        "UPDATE users SET last_refreshed = ? WHERE user_id = ?",
+        [(refreshed_at, user_id) for user_id, _, _ in missing]
+    )
+    save_job(conn, JOB_NAME, "running", cursor, processed, total, chat_id)
+
+
+# Равномерный темп запросов: не больше rate в секунду на все корутины
+class Pacer:
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Фоновое обновление username и имён пользователей через getChat.
+# Запросы идут параллельно (concurrency) в темпе rate/сек, результаты пишутся
+# пачками; курсор хранится в таблице jobs, поэтому после перезапуска задача
+# продолжается с места остановки. Обновляются только профили старше stale_after.
+class ProfileRefreshJob:
+    def __init__(self, bot, db, concurrency: int = 5, rate: float = 20.0, page_size: int = 100,
+                 stale_after: int = 24 * 3600, report_interval: float = 5.0):
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency
+        self.rate = rate
+        self.page_size = page_size
+        self.stale_after = stale_after
+        self.report_interval = report_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # Запустить задачу (или продолжить прерванную). Возвращает False, если уже идёт.
+    # Если устаревших профилей нет, задача не запускается и прогресс не отправляется.
+    async def start(self, chat_id: Optional[int], full: bool = False) -> bool:
+        if self.running:
+            return False
+        stale_before = int(time.time()) if full else int(time.time()) - self.stale_after
+        job = await self.db.read(get_job, JOB_NAME)
+        if job and job[0] == "running" and not full:
+            _, cursor, processed, total, saved_chat_id = job
+            chat_id = chat_id or saved_chat_id
+        else:
+            cursor, processed = 0, 0
+            total = await self.db.read(count_stale, cursor, stale_before)
+            if not total:
+                logging.debug("Устаревших профилей нет, обновление не нужно")
+                return True
+        self._task = asyncio.create_task(self._run(chat_id, cursor, processed, total, stale_before))
+        return True
+
+    # Продолжить задачу, прерванную перезапуском бота
+    async def resume(self):
+        job = await self.db.read(get_job, JOB_NAME)
+        if job and job[0] == "running":
+            logging.info(f"Продолжаем обновление профилей с user_id > {job[1]}")
+            await self.start(job[4])
+
+    async def close(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    # (user_id, username, first_name); (user_id, None, None), если чат точно недоступен
+    # (не найден или бот заблокирован); None при сетевой или временной ошибке Telegram —
+    # такой профиль остаётся устаревшим и запрашивается при следующем запуске.
+    async def _fetch(self, pacer: Pacer, semaphore: asyncio.Semaphore, user_id: int):
+        async with semaphore:
+            while True:
+                await pacer.wait()
+                try:
+                    chat = await self.bot.get_chat(user_id)
+                    return user_id, chat.username, chat.first_name
+                except TelegramRetryAfter as e:
+                    logging.warning(f"Flood control при обновлении профилей, ждём {e.retry_after} с")
+                    await asyncio.sleep(e.retry_after)
+                except (TelegramBadRequest, TelegramNotFound, TelegramForbiddenError) as e:
+                    logging.info(f"Профиль пользователя {user_id} недоступен: {e}")
+                    return user_id, None, None
+                except TelegramAPIError as e:
+                    logging.warning(f"Не удалось обновить данные пользователя {user_id}, повторим позже: {e}")
+                    return None
+
+    async def _run(self, chat_id, cursor, processed, total, stale_before):
+        started = time.monotonic()
+        failed = 0
+        await self.db.write(save_job, JOB_NAME, "running", cursor, processed, total, chat_id)
+
+        progress = await self._report(chat_id, None, f"🔄 Обновление профилей: {processed}/{total}")
+        last_report = time.monotonic()
+        pacer = Pacer(self.rate)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            while True:
+                user_ids = await self.db.read(next_stale_page, cursor, stale_before, self.page_size)
+                if not user_ids:
+                    break
+                results = await asyncio.gather(*(self._fetch(pacer, semaphore, user_id) for user_id in user_ids))
+                rows = [row for row in results if row is not None]
+                failed += len(results) - len(rows)
+                cursor = user_ids[-1]
+                processed += len(results)
+                await self.db.write(save_page, rows, int(time.time()), cursor, processed, total, chat_id)
+                if time.monotonic() - last_report >= self.report_interval:
+                    progress = await self._report(chat_id, progress, f"🔄 Обновление профилей: {processed}/{total}")
+                    last_report = time.monotonic()
+        except asyncio.CancelledError:
+            logging.info(f"Обновление профилей остановлено на user_id {cursor}, продолжим после запуска")
+            raise
+        except Exception:
+            logging.exception("Обновление профилей прервано")
+            await self._report(chat_id, progress, f"⚠️ Обновление профилей прервано на {processed}/{total}")
+            return
+
+        await self.db.write(save_job, JOB_NAME, "done", 0, processed, total, chat_id)
+        retry = f", не удалось: {failed} (повторим при следующем запуске)" if failed else ""
+        await self._report(
+            chat_id, progress,
+            f"✅ Профили обновлены: {processed - failed} за {time.monotonic() - started:.0f} с{retry}"
+        )
+
+    # Отправить или отредактировать сообщение о прогрессе
+    async def _report(self, chat_id, message, text):
+        if chat_id is None:
+            return message
+        try:
+            if message is None:
+                return await self.bot.send_message(chat_id, text)
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message.message_id)
+        except TelegramAPIError as e:
+            logging.warning(f"Не удалось отправить прогресс обновления профилей: {e}")
+        return message
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+from collections import deque
+from typing import Callable, Deque, Dict, List, Set
+
+from aiogram.exceptions import TelegramAPIError  # type: ignore
+from aiogram.types import Update  # type: ignore
+
+
+# Ключ шардирования обновления: id пользователя, если он есть, иначе id чата
+def update_key(update: Update) -> int:
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return chat.id if chat is not None else 0
+
+
+def shard_for(key: int, workers: int) -> int:
+    return key % workers
+
+
+# Пул процессов-обработчиков. Главный процесс получает обновления (polling или
+# webhook) и раскладывает их по очередям процессов по user_id: все обновления
+# одного пользователя попадают в один процесс и обрабатываются по порядку,
+# а разные пользователи обрабатываются на разных ядрах.
+# target(index, queue) выполняется в дочернем процессе и читает свою очередь.
+class ShardPool:
+    def __init__(self, workers: int, target: Callable, queue_size: int = 1000):
+        self.workers = workers
+        self.target = target
+        self.queue_size = queue_size
+        self.submitted = 0
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        # spawn: дочерний процесс не наследует потоки и соединения родителя
+        context = multiprocessing.get_context("spawn")
+        for index in range(self.workers):
+            shard_queue = context.Queue(maxsize=self.queue_size)
+            process = context.Process(target=self.target, args=(index, shard_queue), name=f"bot-shard-{index}")
+            process.start()
+            self._queues.append(shard_queue)
+            self._processes.append(process)
+        logging.info(f"Запущено процессов-обработчиков: {self.workers}")
+
+    # Передать обновление своему процессу; если его очередь заполнена — ждём
+    async def submit(self, update: Update):
+        shard_queue = self._queues[shard_for(update_key(update), self.workers)]
+        try:
+            shard_queue.put_nowait(update)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, shard_queue.put, update)
+        self.submitted += 1
+
+    @property
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._processes)
+
+    # Процессы дорабатывают уже полученные обновления и завершаются
+    async def close(self, timeout: float = 30.0):
+        loop = asyncio.get_running_loop()
+        for shard_queue in self._queues:
+            await loop.run_in_executor(None, shard_queue.put, None)
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logging.warning(f"{process.name} не завершился за {timeout} с, останавливаем")
+                process.terminate()
+        self._queues.clear()
+        self._processes.clear()
+
+
+# Чтение очереди в дочернем процессе. У каждого пользователя своя очередь и не больше
+# одной задачи, которая разбирает её по порядку; слот из concurrency задача занимает
+# только на время обработки обновления, поэтому пользователь с длинной очередью
+# не блокирует остальных. Прочитанных, но ещё не обработанных обновлений — не больше backlog.
+async def consume(shard_queue, dispatcher, bot, concurrency: int = 100, backlog: int = 1000):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = asyncio.Semaphore(backlog)
+    queues: Dict[int, Deque[Update]] = {}
+    tasks: Set[asyncio.Task] = set()
+
+    async def drain(key: int, user_queue: Deque[Update]):
+        while user_queue:
+            update = user_queue.popleft()
+            try:
+                async with semaphore:
+                    await dispatcher.feed_update(bot, update)
+            except Exception:
+                logging.exception(f"Ошибка обработки обновления {update.update_id}")
+            finally:
+                pending.release()
+        del queues[key]
+
+    while True:
+        await pending.acquire()
+        update = await loop.run_in_executor(None, shard_queue.get)
+        if update is None:
+            pending.release()
+            break
+        key = update_key(update)
+        user_queue = queues.get(key)
+        if user_queue is None:
+            user_queue = queues[key] = deque()
+            task = asyncio.create_task(drain(key, user_queue))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        user_queue.append(update)
+
+    if tasks:
+        await asyncio.wait(list(tasks))
+
+
+# Long polling в главном процессе: обновления не обрабатываются здесь, а передаются в submit
+async def poll_updates(bot, submit, allowed_updates=None, timeout: int = 30):
+    offset = None
+    backoff = 1.0
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            backoff = 1.0
+        except TelegramAPIError as e:
+            logging.warning(f"Ошибка getUpdates: {e}, повтор через {backoff:.0f} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+            continue
+        for update in updates:
+            await submit(update)
+            offset = update.update_id + 1
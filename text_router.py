@@ -0,0 +1,64 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from aiogram.types import Message  # type: ignore
+
+Handler = Callable[[Message], Awaitable[Any]]
+
+
+# Имя команды и упоминание бота: "/start 123" -> ("start", None), "/stats@bot" -> ("stats", "bot")
+def parse_command(text: str) -> Tuple[str, Optional[str]]:
+    parts = text[1:].split(maxsplit=1)
+    if not parts:
+        return "", None
+    name, _, mention = parts[0].partition("@")
+    return name, mention or None
+
+
+# Таблица обработчиков по точному тексту кнопки и по имени команды.
+# Вместо десятков фильтров F.text == "..." и Command(...), которые aiogram
+# проверяет по очереди, один фильтр находит обработчик одним поиском в словаре.
+# Если текст не найден, обновление идёт дальше по обычной цепочке фильтров.
+#
+#   menu = TextRouter()
+#   dp.message.register(menu.dispatch, menu.match)  # раньше остальных обработчиков
+#
+#   @menu.text("👤 My Profile")
+#   async def handle_profile(message): ...
+class TextRouter:
+    def __init__(self):
+        self.texts: Dict[str, Handler] = {}
+        self.commands: Dict[str, Handler] = {}
+
+    def text(self, *texts: str):
+        def register(handler: Handler) -> Handler:
+            for text in texts:
+                self.texts[text] = handler
+            return handler
+        return register
+
+    def command(self, *names: str):
+        def register(handler: Handler) -> Handler:
+            for name in names:
+                self.commands[name] = handler
+            return handler
+        return register
+
+    # Фильтр: найденный обработчик передаётся в dispatch аргументом text_handler
+    async def match(self, message: Message, bot) -> Union[bool, Dict[str, Handler]]:
+        text = message.text
+        if text is None:
+            return False
+        handler = self.texts.get(text)
+        if handler is None and text.startswith("/") and self.commands:
+            name, mention = parse_command(text)
+            handler = self.commands.get(name)
+            # Команда для другого бота в группе
+            if handler is not None and mention is not None:
+                me = await bot.me()
+                if mention.lower() != (me.username or "").lower():
+                    return False
+        return {"text_handler": handler} if handler is not None else False
+
+    @staticmethod
+    async def dispatch(message: Message, text_handler: Handler) -> Any:
+        return await text_handler(message)
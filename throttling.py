@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+from aiogram import BaseMiddleware  # type: ignore
+from aiogram.types import CallbackQuery, Message  # type: ignore
+
+from migrations import apply_migrations
+from text_router import parse_command
+
+
+# Лимит token bucket: capacity запросов подряд, один токен возвращается раз в interval секунд
+class Limit(NamedTuple):
+    capacity: int
+    interval: float
+
+    # Через сколько секунд простоя ведро снова полное и состояние можно забыть
+    @property
+    def idle_after(self) -> float:
+        return self.capacity * self.interval
+
+
+# Состояние ведра: (токены, время обновления, уже предупредили о лимите)
+BucketState = Tuple[float, float, bool]
+
+
+# Лимиты по умолчанию: /start как раньше — не чаще раза в 2 секунды,
+# остальные сообщения — до 5 подряд и дальше по одному в секунду
+DEFAULT_LIMITS: Dict[str, Limit] = {
+    "start": Limit(1, 2.0),
+    "default": Limit(5, 1.0),
+}
+
+
+# Разбор лимитов из строки вида "start=1/2,list_users=1/30,default=5/1"
+def parse_limits(value: str) -> Dict[str, Limit]:
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, spec = item.partition("=")
+        capacity, _, interval = spec.partition("/")
+        limits[name.strip().lstrip("/")] = Limit(int(capacity), float(interval or 1))
+    return limits
+
+
+# Один шаг token bucket. Возвращает (разрешено, предупредить пользователя, новое состояние).
+def consume(state: Optional[BucketState], limit: Limit, now: float) -> Tuple[bool, bool, BucketState]:
+    if state is None:
+        tokens, warned = float(limit.capacity), False
+    else:
+        tokens, updated, warned = state
+        tokens = min(float(limit.capacity), tokens + (now - updated) / limit.interval)
+    if tokens >= 1:
+        return True, False, (tokens - 1, now, False)
+    # Предупреждаем один раз, пока ведро пустое, чтобы не отвечать на каждый флуд
+    return False, not warned, (tokens, now, True)
+
+
+# Хранение состояний в памяти процесса
+class MemoryBackend:
+    def __init__(self):
+        self._states: Dict[str, Tuple[BucketState, float]] = {}
+
+    def __len__(self):
+        return len(self._states)
+
+    async def hit(self, key: str, limit: Limit, now: float) -> Tuple[bool, bool]:
+        item = self._states.get(key)
+        allowed, warn, state = consume(item[0] if item else None, limit, now)
+        self._states[key] = (state, now + limit.idle_after)
+        return allowed, warn
+
+    # Удаляем ведра, которые за время простоя снова наполнились
+    async def evict(self, now: float) -> int:
+        expired = [key for key, (_, expires) in self._states.items() if expires <= now]
+        for key in expired:
+            del self._states[key]
+        return len(expired)
+
+    async def close(self):
+        pass
+
+
+# Хранение состояний в SQLite: лимиты общие для нескольких процессов бота.
+# Работает в отдельном потоке со своим соединением, чтобы не блокировать event loop.
+class SQLiteBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="throttle-db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+            # Таблица throttle_state создаётся миграцией; на базе бота это одно чтение PRAGMA
+            apply_migrations(self._conn)
+        return self._conn
+
+    def _hit(self, key: str, limit: Limit, now: float) -> Tuple[bool, bool]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated, warned FROM throttle_state WHERE key = ?", (key,)).fetchone()
+            allowed, warn, (tokens, updated, warned) = consume(
+                (row[0], row[1], bool(row[2])) if row else None, limit, now
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO throttle_state (key, tokens, updated, warned, expires) VALUES (?, ?, ?, ?, ?)",
+                (key, tokens, updated, int(warned), now + limit.idle_after)
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return allowed, warn
+
+    def _evict(self, now: float) -> int:
+        return self._connection().execute("DELETE FROM throttle_state WHERE expires <= ?", (now,)).rowcount
+
+    async def hit(self, key: str, limit: Limit, now: float) -> Tuple[bool, bool]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._hit, key, limit, now)
+
+    async def evict(self, now: float) -> int:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._evict, now)
+
+    async def close(self):
+        def close_connection():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, close_connection)
+        self._executor.shutdown(wait=True)
+
+
+# Ограничитель частоты запросов по (пользователь, команда)
+class RateLimiter:
+    def __init__(self, limits: Optional[Dict[str, Limit]] = None, backend=None, evict_interval: float = 60.0,
+                 clock: Callable[[], float] = time.time):
+        self.limits = limits if limits is not None else dict(DEFAULT_LIMITS)
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.evict_interval = evict_interval
+        self.clock = clock
+        self.rejected = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def limit_for(self, command: str) -> Limit:
+        return self.limits.get(command) or self.limits["default"]
+
+    async def hit(self, user_id: int, command: str) -> Tuple[bool, bool]:
+        limit = self.limit_for(command)
+        # Команды без своего лимита делят одно ведро "default"
+        bucket = command if command in self.limits else "default"
+        allowed, warn = await self.backend.hit(f"{user_id}:{bucket}", limit, self.clock())
+        if not allowed:
+            self.rejected += 1
+        return allowed, warn
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._evict_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.backend.close()
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                evicted = await self.backend.evict(self.clock())
+                if evicted:
+                    logging.debug(f"Удалено неактивных состояний throttling: {evicted}")
+            except Exception:
+                logging.exception("Не удалось очистить состояния throttling")
+
+
+# Имя команды из текста сообщения: "/start 123" -> "start", "/stats@bot" -> "stats".
+# Кнопки и обычный текст считаются командой "message", inline-кнопки — префиксом
+# callback data: "users:next:10" -> "users".
+def command_name(event: Union[Message, CallbackQuery]) -> str:
+    if isinstance(event, CallbackQuery):
+        return (event.data or "").split(":", 1)[0] or "callback"
+    text = event.text or ""
+    if not text.startswith("/"):
+        return "message"
+    # "/" и "/   " без имени команды считаются обычным текстом
+    name, _ = parse_command(text)
+    return name.lower() or "message"
+
+
+# Middleware: ограничивает частоту для всех обработчиков сообщений и inline-кнопок, включая админские
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, limiter: RateLimiter, text: str = "⏳ Please wait before using this command again."):
+        self.limiter = limiter
+        self.text = text
+
+    async def __call__(
+        self,
+        handler: Callable[[Union[Message, CallbackQuery], Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.from_user is None:
+            return await handler(event, data)
+        allowed, warn = await self.limiter.hit(event.from_user.id, command_name(event))
+        if allowed:
+            return await handler(event, data)
+        if isinstance(event, CallbackQuery):
+            # На callback нужно ответить в любом случае, иначе кнопка "зависнет"
+            await event.answer(self.text if warn else None)
+        elif warn:
+            await event.answer(self.text)
+        return None
@@ -0,0 +1,161 @@
+import csv
+import html
+import io
+import json
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, InputFile  # type: ignore
+
+# Лимит длины текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+PAGE_SIZE = 20
+EXPORT_CHUNK = 1000
+
+UserRow = Tuple[int, Optional[str], Optional[str]]
+
+
+# Страница пользователей после user_id (keyset-пагинация, без OFFSET)
+def users_after(conn, after_id, limit) -> List[UserRow]:
+    return conn.execute(
+        "SELECT user_id, username, first_name FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+        (after_id, limit)
+    ).fetchall()
+
+
+# Страница для показа одним запросом: (строки, есть предыдущая, есть следующая).
+# Берём на одну строку больше лимита, чтобы узнать, есть ли страница дальше
+# в направлении листания; страница с другой стороны есть, если есть пользователи
+# по ту сторону anchor (EXISTS без корреляции SQLite вычисляет один раз).
+_PAGE_SQL = {
+    "next": "SELECT user_id, username, first_name, "
+            "EXISTS(SELECT 1 FROM users WHERE user_id <= :anchor) "
+            "FROM users WHERE user_id > :anchor ORDER BY user_id LIMIT :limit",
+    "prev": "SELECT user_id, username, first_name, "
+            "EXISTS(SELECT 1 FROM users WHERE user_id >= :anchor) "
+            "FROM users WHERE user_id < :anchor ORDER BY user_id DESC LIMIT :limit",
+}
+
+
+def load_page(conn, direction: str, anchor: int, limit: int = PAGE_SIZE) -> Tuple[List[UserRow], bool, bool]:
+    direction = "prev" if direction == "prev" else "next"
+    rows = conn.execute(_PAGE_SQL[direction], {"anchor": anchor, "limit": limit + 1}).fetchall()
+    if not rows:
+        return [], False, False
+    behind = bool(rows[0][3])
+    ahead = len(rows) > limit
+    page = [row[:3] for row in rows[:limit]]
+    if direction == "prev":
+        page.reverse()
+        return page, ahead, behind
+    return page, behind, ahead
+
+
+def render_user(user_id: int, username: Optional[str], first_name: Optional[str]) -> str:
+    return (
+        f"▫️ <b>{html.escape(first_name) if first_name else '—'}</b>\n"
+        f"├ @{html.escape(username) if username else 'нет юзернейма'}\n"
+        f"└ ID: <code>{user_id}</code>\n"
+        f"🔗 <a href='tg://user?id={user_id}'>Профиль</a>\n\n"
+    )
+
+
+# Текст страницы. Если строки не помещаются в лимит сообщения, лишние отбрасываются;
+# возвращается текст и сколько строк в него вошло.
+def render_page(rows: List[UserRow]) -> Tuple[str, int]:
+    parts = ["📂 <b>Список пользователей:</b>\n\n"]
+    length = len(parts[0])
+    used = 0
+    for row in rows:
+        part = render_user(*row)
+        if length + len(part) > MESSAGE_LIMIT:
+            break
+        parts.append(part)
+        length += len(part)
+        used += 1
+    return "".join(parts), used
+
+
+# Кнопки "назад/вперёд": в callback_data только направление и граничный user_id
+def page_keyboard(rows: List[UserRow], has_prev: bool, has_next: bool) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"users:prev:{rows[0][0]}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"users:next:{rows[-1][0]}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+# Готовая страница: (текст, клавиатура) или None, если пользователей нет
+async def build_page(db, direction: str = "next", anchor: int = 0):
+    rows, has_prev, has_next = await db.read(load_page, direction, anchor)
+    if not rows:
+        return None
+    text, used = render_page(rows)
+    if used < len(rows):
+        if direction == "prev":
+            # Листая назад, оставляем строки, ближайшие к anchor: считаем, сколько
+            # их помещается с конца, и заново собираем текст ровно из них
+            _, used = render_page(rows[::-1])
+            rows, has_prev = rows[len(rows) - used:], True
+            text, _ = render_page(rows)
+        else:
+            rows, has_next = rows[:used], True
+    return text, page_keyboard(rows, has_prev, has_next)
+
+
+# Все пользователи кусками по chunk строк; в памяти только текущий кусок
+async def iter_users(db, chunk: int = EXPORT_CHUNK) -> AsyncIterator[UserRow]:
+    last_id = 0
+    while True:
+        rows = await db.read(users_after, last_id, chunk)
+        for row in rows:
+            yield row
+        if len(rows) < chunk:
+            return
+        last_id = rows[-1][0]
+
+
+async def csv_lines(rows: AsyncIterator[UserRow]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["user_id", "username", "first_name"])
+    yield buffer.getvalue()
+    async for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(["" if value is None else value for value in row])
+        yield buffer.getvalue()
+
+
+async def jsonl_lines(rows: AsyncIterator[UserRow]) -> AsyncIterator[str]:
+    async for user_id, username, first_name in rows:
+        yield json.dumps({"user_id": user_id, "username": username, "first_name": first_name},
+                         ensure_ascii=False) + "\n"
+
+
+EXPORT_FORMATS = {"csv": csv_lines, "jsonl": jsonl_lines}
+
+
+# Файл для sendDocument, который читается из асинхронного генератора строк:
+# выгрузка отправляется кусками по мере чтения из базы, без сборки в памяти
+class StreamedExport(InputFile):
+    def __init__(self, lines: AsyncIterator[str], filename: str):
+        super().__init__(filename=filename)
+        self.lines = lines
+
+    async def read(self, chunk_size: int) -> AsyncGenerator[bytes, None]:
+        buffer = []
+        size = 0
+        async for line in self.lines:
+            data = line.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= chunk_size:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b"".join(buffer)
+
+
+def export_file(db, fmt: str) -> StreamedExport:
+    return StreamedExport(EXPORT_FORMATS[fmt](iter_users(db)), filename=f"users.{fmt}")
@@ -0,0 +1,109 @@
+import asyncio
+import hmac
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiohttp import web  # type: ignore
+from aiogram.types import Update  # type: ignore
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler  # type: ignore
+
+# Заголовок, в котором Telegram присылает secret_token из setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Приём обновлений от Telegram по webhook.
+# Проверяет secret token (обязателен: без него любой, кто знает путь, может
+# прислать поддельное обновление от имени админа) и отвечает Telegram сразу, а обработку ведёт в фоне;
+# фоновые задачи хранятся в self._tasks, чтобы их не собрал GC и их можно было
+# дождаться при остановке. Сессию бота не закрывает: это делает main().
+# Если задан submit, обновления не обрабатываются здесь, а передаются в него
+# (например, в процессы ShardPool).
+class SecretRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher, bot, secret_token: str,
+                 submit: Optional[Callable[[Update], Awaitable[None]]] = None, **data: Any):
+        if not secret_token:
+            raise ValueError("Для webhook нужен secret_token")
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **data)
+        self.secret_token = secret_token
+        self.submit = submit
+        self.received = 0
+        self.rejected = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            return web.Response(status=401)
+        self.received += 1
+        return await super().handle(request)
+
+    async def _handle_request_background(self, bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if self.submit is not None:
+            await self.submit(Update(**update))
+            return web.json_response({}, dumps=bot.session.json_dumps)
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    # Дождаться обработки уже принятых обновлений
+    async def close(self, timeout: float = 10.0):
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            if pending:
+                logging.warning(f"Не обработано обновлений при остановке: {len(pending)}")
+
+
+# aiohttp-приложение: POST path — обновления от Telegram, GET /healthz — проверка живости
+# для балансировщика. health() возвращает словарь с состоянием; исключение означает 503.
+def build_app(dispatcher, bot, path: str, secret_token: str,
+              health: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None,
+              submit: Optional[Callable[[Update], Awaitable[None]]] = None) -> web.Application:
+    app = web.Application()
+    handler = SecretRequestHandler(dispatcher, bot, secret_token=secret_token, submit=submit)
+    handler.register(app, path=path)
+    app["webhook_handler"] = handler
+
+    async def healthz(request: web.Request) -> web.Response:
+        status: Dict[str, Any] = {"status": "ok", "received": handler.received, "in_flight": handler.in_flight}
+        try:
+            if health is not None:
+                status.update(await health())
+        except Exception as e:
+            logging.exception("Проверка здоровья не прошла")
+            return web.json_response({"status": "error", "error": str(e)}, status=503)
+        return web.json_response(status)
+
+    app.router.add_get("/healthz", healthz)
+    return app
+
+
+# Запуск HTTP-сервера и регистрация webhook. Работает до отмены задачи.
+# Если url не задан, webhook не регистрируется (его ставит балансировщик или другой экземпляр).
+async def run_webhook(dispatcher, bot, host: str, port: int, path: str, secret_token: str,
+                      url: Optional[str] = None,
+                      health: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None,
+                      submit: Optional[Callable[[Update], Awaitable[None]]] = None):
+    app = build_app(dispatcher, bot, path, secret_token, health, submit)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook слушает http://{host}:{port}{path}")
+    try:
+        if url:
+            await bot.set_webhook(
+                url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+            )
+            logging.info(f"Webhook зарегистрирован: {url.rstrip('/') + path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()